@@ -1,11 +1,21 @@
 #!/usr/bin/env python3
 """
-Extract and summarize activity data by month from timeline.csv
+Extract and summarize activity data by month from timeline.csv, or from the
+binary record cache written by timeline-parser.py --cache (<export>.records).
 """
 
 import csv
 from collections import defaultdict
 
+from script_loader import load_timeline_parser
+
+
+def is_records_file(path):
+    """Check whether path is a binary record cache instead of a CSV file"""
+    magic = load_timeline_parser().CACHE_MAGIC
+    with open(path, 'rb') as f:
+        return f.read(len(magic)) == magic
+
 
 def parse_timeline_by_month(csv_file):
     """Parse timeline.csv and group activities by month"""
@@ -47,6 +57,65 @@ def parse_timeline_by_month(csv_file):
     
     return monthly_data
 
+class RecordRows:
+    """Rows of a record store, formatted as timeline.csv row dicts only when iterated"""
+
+    def __init__(self, store):
+        self.store = store
+        self.rows = []
+
+    def append(self, i):
+        self.rows.append(i)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __iter__(self):
+        return map(self.store.csv_row, self.rows)
+
+def parse_records_by_month(records_file):
+    """Group the records of a binary record cache by month without any text parsing"""
+    store = load_timeline_parser().RecordStore.load(records_file)
+
+    monthly_data = defaultdict(lambda: {
+        'activities': RecordRows(store),
+        'total_distance': 0.0,
+        'total_duration': 0.0,
+        'activity_counts': defaultdict(int),
+        'visit_counts': 0
+    })
+
+    # Compare dictionary codes instead of decoding every record
+    activity_code = store.lookup('record_type', 'activity')
+    visit_code = store.lookup('record_type', 'visit')
+    record_type, activity_type = store.record_type, store.activity_type
+    distances, durations = store.distance_meters, store.duration_seconds
+    activity_codes = defaultdict(lambda: defaultdict(int))
+
+    # Local calendar month, the same as the first 7 chars of the CSV timestamp
+    for i, month in store.months():
+        data = monthly_data[month]
+        data['activities'].append(i)
+
+        # Sum distances and durations (NaN marks missing values)
+        distance, duration = distances[i], durations[i]
+        data['total_distance'] += distance if distance == distance else 0.0
+        data['total_duration'] += duration if duration == duration else 0.0
+
+        code = record_type[i]
+        if code == activity_code:
+            activity_codes[month][activity_type[i]] += 1
+        elif code == visit_code:
+            data['visit_counts'] += 1
+
+    # Count activity types by name, '' for a missing one as in the CSV
+    activity_types = store.dictionary('activity_type')
+    for month, counts in activity_codes.items():
+        for code, count in counts.items():
+            monthly_data[month]['activity_counts'][activity_types[code] if code >= 0 else ''] += count
+
+    return monthly_data
+
 def print_monthly_summary(monthly_data, output_file=None):
     """Print summary of activities by month"""
     
@@ -125,11 +194,15 @@ def print_detailed_monthly_activities(monthly_data, month, output_file=None):
 if __name__ == "__main__":
     import sys
     
-    csv_file = "timeline.csv"
+    # timeline.csv by default, or a record cache such as Timeline.json.records
+    csv_file = sys.argv[1] if len(sys.argv) > 1 else "timeline.csv"
     
     # Parse the timeline
     print(f"Reading {csv_file}...")
-    monthly_data = parse_timeline_by_month(csv_file)
+    if is_records_file(csv_file):
+        monthly_data = parse_records_by_month(csv_file)
+    else:
+        monthly_data = parse_timeline_by_month(csv_file)
     
     # Print summary for all months
     print_monthly_summary(monthly_data)
@@ -0,0 +1,30 @@
+"""
+Import the hyphenated scripts of this directory (timeline-parser.py, ...) as modules.
+"""
+
+import importlib.util
+import os
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def load_script(filename, name):
+    """Import a script from this directory under a module name (its file name is not a valid one)"""
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    spec = importlib.util.spec_from_file_location(name, os.path.join(HERE, filename))
+    module = importlib.util.module_from_spec(spec)
+    # Registered so process pool workers can unpickle its functions
+    sys.modules[name] = module
+    try:
+        spec.loader.exec_module(module)
+    except BaseException:
+        del sys.modules[name]
+        raise
+    return module
+
+
+def load_timeline_parser():
+    return load_script("timeline-parser.py", "timeline_parser")
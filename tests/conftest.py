@@ -0,0 +1,62 @@
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from script_loader import load_script, load_timeline_parser  # noqa: E402
+
+SEGMENTS = 3000
+
+
+@pytest.fixture(scope="session")
+def tp():
+    return load_timeline_parser()
+
+
+@pytest.fixture(scope="session")
+def generator():
+    return load_script("timeline-generator.py", "timeline_generator")
+
+
+@pytest.fixture(scope="session")
+def export(generator, tmp_path_factory):
+    """A synthetic Timeline.json export"""
+    return generator.write_timeline(str(tmp_path_factory.mktemp("export") / "Timeline.json"), SEGMENTS, seed=7)
+
+
+@pytest.fixture(scope="session")
+def segments(export):
+    with open(export, encoding="utf-8") as f:
+        return json.load(f)["semanticSegments"]
+
+
+def write_export(path, segments):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"semanticSegments": segments}, f, ensure_ascii=False)
+    return str(path)
+
+
+def parse(tp, path, **kwargs):
+    """Load an export and parse all of its segments"""
+    parser = tp.TimelineParser(str(path))
+    assert parser.load_timeline_data(stream=kwargs.pop("stream", False))
+    return parser, parser.parse_all_segments(**kwargs)
+
+
+def assert_same_records(tp, left, right):
+    """Two stores hold the same records in the same order"""
+    assert len(left) == len(right)
+    for name in tp.RecordStore.INT_COLUMNS:
+        if name != "wifi_offset":
+            assert list(getattr(left, name)) == list(getattr(right, name)), name
+    for name in tp.RecordStore.FLOAT_COLUMNS:
+        assert [v if v == v else None for v in getattr(left, name)] == \
+            [v if v == v else None for v in getattr(right, name)], name
+    for name in tp.RecordStore.STRING_COLUMNS:
+        assert [left.strings[name][c] if c >= 0 else None for c in getattr(left, name)] == \
+            [right.strings[name][c] if c >= 0 else None for c in getattr(right, name)], name
+    assert [[(left.strings["bssid"][b], r) for b, r in left.wifi_devices_at(i)] for i in range(len(left))] == \
+        [[(right.strings["bssid"][b], r) for b, r in right.wifi_devices_at(i)] for i in range(len(right))]
@@ -0,0 +1,66 @@
+import sqlite3
+
+import pytest
+
+from conftest import parse
+
+
+def test_sqlite_load_keeps_records_older_than_stored(tp, export, tmp_path):
+    parser, records = parse(tp, export)
+    db = str(tmp_path / "timeline.db")
+    fresh = parser.export_sqlite(records, str(tmp_path / "fresh.db"))
+
+    # Newer records first, then the whole history
+    parser.export_sqlite(records.slice(len(records) // 2, len(records)), db)
+    parser.export_sqlite(records, db)
+
+    with sqlite3.connect(db) as connection:
+        assert connection.execute("SELECT count(*) FROM records").fetchone()[0] == fresh
+        assert connection.execute("SELECT min(timestamp_ns) FROM records").fetchone()[0] == records.timestamp[0]
+    assert parser.export_sqlite(records, db) == 0
+
+
+def test_sqlite_identity_keeps_location_less_records_apart(tp, tmp_path):
+    store = tp.RecordStore()
+    stamp = (1_700_000_000_000_000_000, 60)
+    for devices in ([{"mac": "a", "rawRssi": -40}], [{"mac": "b", "rawRssi": -70}, {"mac": "c", "rawRssi": -80}]):
+        store.append(0, stamp, stamp, "wifi_scan", "WIFI_SCAN", distance_meters=0, duration_seconds=0,
+                     wifi_devices=len(devices), strongest_signal=devices[0]["rawRssi"], devices=devices)
+    for confidence in (40, 60):
+        store.append(1, stamp, stamp, "activity_record", "STILL", probability=confidence)
+    store.append(1, stamp, stamp, "activity_record", "STILL", probability=60)
+    parser = tp.TimelineParser()
+    db = str(tmp_path / "timeline.db")
+
+    assert parser.export_sqlite(store, db, quiet=True) == 4
+    assert parser.export_sqlite(store, db, quiet=True) == 0
+    with sqlite3.connect(db) as connection:
+        assert connection.execute("SELECT local_date, local_time FROM records LIMIT 1").fetchone() == \
+            ("2023-11-14", "23:13:20")
+
+
+@pytest.mark.parametrize("file_format", ["parquet", "arrow"])
+def test_columnar_export_round_trip(tp, export, tmp_path, file_format):
+    pa = pytest.importorskip("pyarrow")
+    parser, records = parse(tp, export)
+    path = parser.export_columnar(records, str(tmp_path / f"timeline.{file_format}"), file_format, quiet=True)
+
+    if file_format == "arrow":
+        with pa.memory_map(path) as source:
+            reader = pa.ipc.open_file(source)
+            table = reader.read_all()
+            groups = reader.num_record_batches
+    else:
+        import pyarrow.parquet as pq
+        table = pq.read_table(path)
+        groups = pq.ParquetFile(path).num_row_groups
+
+    assert groups == len({month for _, month in records.months()})
+    columns = table.to_pydict()
+    assert table.column("timestamp").cast(pa.int64()).to_pylist() == list(records.timestamp)
+    assert columns["utc_offset_minutes"] == list(records.utc_offset)
+    for name in tp.RecordStore.STRING_COLUMNS:
+        assert columns[name] == [records.strings[name][c] if c >= 0 else None for c in getattr(records, name)], name
+    for name in tp.RecordStore.FLOAT_COLUMNS:
+        assert columns[name] == [v if v == v else None for v in getattr(records, name)], name
+    assert columns["wifi_devices"] == [v if v >= 0 else None for v in records.wifi_devices]
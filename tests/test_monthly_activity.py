@@ -0,0 +1,28 @@
+import pytest
+
+from conftest import load_script, parse
+
+
+@pytest.fixture(scope="module")
+def ma():
+    return load_script("monthly-activity.py", "monthly_activity")
+
+
+def test_record_cache_groups_like_csv(tp, ma, export, tmp_path):
+    parser, records = parse(tp, export)
+    records.save(str(tmp_path / "Timeline.json.records"))
+    parser.export_csv(records, str(tmp_path / "timeline.csv"), quiet=True)
+
+    assert ma.is_records_file(str(tmp_path / "Timeline.json.records"))
+    assert not ma.is_records_file(str(tmp_path / "timeline.csv"))
+    from_records = ma.parse_records_by_month(str(tmp_path / "Timeline.json.records"))
+    from_csv = ma.parse_timeline_by_month(str(tmp_path / "timeline.csv"))
+    assert sorted(from_records) == sorted(from_csv)
+    for month, data in from_csv.items():
+        grouped = from_records[month]
+        assert list(grouped["activities"]) == data["activities"]
+        assert grouped["activity_counts"] == data["activity_counts"]
+        assert grouped["visit_counts"] == data["visit_counts"]
+        # The CSV rounds every value
+        assert grouped["total_distance"] == pytest.approx(data["total_distance"], rel=1e-4)
+        assert grouped["total_duration"] == pytest.approx(data["total_duration"], rel=1e-4)
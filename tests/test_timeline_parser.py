@@ -0,0 +1,404 @@
+import copy
+import gc
+import io
+import json
+import math
+import random
+import sys
+from datetime import datetime, timedelta
+
+import pytest
+
+from conftest import SEGMENTS, assert_same_records, parse, write_export
+
+
+def column_lengths(tp, store):
+    return {name: len(getattr(store, name)) for name in tp.RecordStore.column_names()}
+
+
+def test_rejected_segment_leaves_columns_aligned(tp, segments, tmp_path):
+    activity = next(segment for segment in segments if "activity" in segment)
+    scan = next(segment for segment in segments if "wifiScan" in segment)
+    bad_activity = copy.deepcopy(activity)
+    bad_activity["activity"]["topCandidate"]["probability"] = "0.9"
+    bad_scan = copy.deepcopy(scan)
+    # The scan's devices must be dropped along with the string signal strength the columns reject
+    bad_scan["wifiScan"]["devicesRecords"] = [{"mac": 1, "rawRssi": "-50"}, {"mac": 2, "rawRssi": "-60"}]
+    path = write_export(tmp_path / "bad.json", [activity, bad_activity, scan, bad_scan])
+
+    parser, store = parse(tp, path)
+
+    assert len(store) == 2
+    assert set(column_lengths(tp, store).values()) == {2}
+    assert parser.stats.failed == {"activity": 1, "wifi_scan": 1}
+    assert len(store.wifi_bssid) == len(scan["wifiScan"]["devicesRecords"])
+    assert sorted(row["record_type"] for row in store) == ["activity", "wifi_scan"]
+    merged = tp.RecordStore.merge([store, store])
+    assert set(column_lengths(tp, merged).values()) == {4}
+
+
+def test_json_array_stream_across_chunk_boundaries(tp):
+    tricky = ['say "hi" [not {an} array]', "back\\slash\\", 'ends with \\"', "üñí©ødé \u2603", "\\\"[{"]
+    items = [{"text": text, "nested": {"list": [text, 1.5e-3, -12, None, True]}, "n": 12345678901234} for text in tricky]
+    items += [1e10, -0.25, "]}", [], {}]
+    document = json.dumps({"skipped": {"a": tricky, "b": [{"c": "]"}]}, "other": "x\\\"y", "semanticSegments": items,
+                           "after": [1, 2]})
+    for chunk_size in (1, 2, 3, 5, 7, 64, 1 << 16):
+        stream = tp.JsonArrayStream(io.StringIO(document), "semanticSegments", chunk_size=chunk_size)
+        assert list(stream) == items, chunk_size
+    with pytest.raises(KeyError):
+        list(tp.JsonArrayStream(io.StringIO(document), "missing", chunk_size=3))
+
+
+def ingest(tp, path, store_path):
+    parser = tp.TimelineParser(str(path))
+    assert parser.load_timeline_data()
+    store, _ = parser.ingest_incremental(str(store_path))
+    return parser, store
+
+
+def test_incremental_ingest_matches_full_parse(tp, segments, export, tmp_path):
+    half = write_export(tmp_path / "half.json", segments[:len(segments) // 2])
+    ingest(tp, half, tmp_path / "records.bin")
+    _, incremental = ingest(tp, export, tmp_path / "records.bin")
+    _, full = ingest(tp, export, tmp_path / "full.bin")
+
+    assert len(incremental) == len(full)
+    assert incremental.metadata["monthly"] == full.metadata["monthly"]
+    assert sorted(map(tuple, map(dict.items, incremental))) == sorted(map(tuple, map(dict.items, full)))
+
+
+def test_incremental_ingest_counts_malformed_segment(tp, segments, tmp_path):
+    ingest(tp, write_export(tmp_path / "old.json", segments[:100]), tmp_path / "records.bin")
+    bad = copy.deepcopy(segments[-1])
+    bad["startTime"] = "2025-13-01T00:00:00Z"
+    parser, store = ingest(tp, write_export(tmp_path / "new.json", segments[:200] + [bad]), tmp_path / "records.bin")
+
+    assert sum(parser.stats.failed.values()) == 1
+    assert parser.stats.error_samples
+
+
+def test_load_json_file_leaves_gc_alone(tp, export):
+    frozen = gc.get_freeze_count()
+    assert tp.load_json_file(export)["semanticSegments"]
+    assert gc.isenabled()
+    assert gc.get_freeze_count() == frozen
+
+
+def test_parallel_parse_matches_serial(tp, export):
+    _, serial = parse(tp, export)
+    for stream in (False, True):
+        parser, parallel = parse(tp, export, stream=stream, workers=2, shard_size=700)
+        assert_same_records(tp, serial, parallel)
+        assert parser.stats.result()["segments"] == SEGMENTS
+
+
+def test_parallel_parse_of_decoded_segments_matches_serial(tp, segments, export):
+    _, serial = parse(tp, export)
+    parser = tp.TimelineParser()
+    parser.semantic_segments = segments
+    assert_same_records(tp, serial, parser.parse_all_segments(workers=2, shard_size=700))
+
+
+def test_stay_points_match_between_serial_and_parallel_parse(tp, segments, tmp_path):
+    # Without Google's visits the positions sampled while staying become inferred stays
+    path = write_export(tmp_path / "no_visits.json", [segment for segment in segments if "visit" not in segment])
+    stores = []
+    for workers in (1, 2):
+        parser = tp.TimelineParser(path)
+        parser.stay_detector = tp.StayPointDetector()
+        assert parser.load_timeline_data(quiet=True)
+        stores.append(parser.parse_all_segments(workers=workers, shard_size=300, quiet=True))
+
+    serial, parallel = stores
+    assert serial.type_counts().get("visit", 0) > 10
+    assert_same_records(tp, serial, parallel)
+
+
+def test_segment_ranges_cover_every_segment(tp, segments, tmp_path):
+    tricky = copy.deepcopy(segments[:50])
+    tricky[3]["note"] = 'quote " backslash \\ bracket ] brace } comma ,\\"'
+    path = write_export(tmp_path / "tricky.json", tricky)
+    with open(path, "rb") as f:
+        data = f.read()
+    for block_size in (5, 4096):
+        decoded = []
+        for base_index, start, stop in tp.iter_segment_ranges(path, 7, block_size=block_size):
+            assert base_index == len(decoded)
+            decoded.extend(json.loads(b"[" + data[start:stop] + b"]"))
+        assert decoded == tricky
+    assert list(tp.iter_segment_ranges(write_export(tmp_path / "empty.json", []), 7)) == []
+
+
+def test_merge_drops_duplicates_and_their_devices(tp, export, monkeypatch):
+    _, store = parse(tp, export)
+    for numpy in (tp.np, None):
+        monkeypatch.setattr(tp, "np", numpy)
+        merged = tp.RecordStore.merge([store, store], dedupe=True, chunk_rows=500)
+        assert_same_records(tp, store, merged)
+        assert len(merged.wifi_bssid) == len(store.wifi_bssid)
+
+
+def test_merge_files_streams_overlapping_spills(tp, export, tmp_path, monkeypatch):
+    _, store = parse(tp, export)
+    third = len(store) // 3
+    paths = [str(tmp_path / "early.records"), str(tmp_path / "late.records")]
+    store.select(range(0, 2 * third)).save(paths[0])
+    store.select(range(third, len(store))).save(paths[1])
+
+    for numpy in (tp.np, None):
+        monkeypatch.setattr(tp, "np", numpy)
+        merged = tp.RecordStore.merge_files(paths, dedupe=True, chunk_rows=500)
+        assert_same_records(tp, store, merged)
+        assert len(merged.wifi_bssid) == len(store.wifi_bssid)
+
+
+def test_parse_export_prints_nothing(tp, export, tmp_path, capsys):
+    records_path, count, cached, _ = tp.parse_export(str(export), str(tmp_path / "export.records"))
+    assert not cached
+    assert len(tp.RecordStore.load(records_path)) == count
+    assert capsys.readouterr().out == ""
+
+
+def test_filter_pushdown_matches_records_between(tp, export):
+    _, full = parse(tp, export)
+    middle = full.datetime_at(len(full) // 2).isoformat()
+    for start, end, types in ((None, None, ["visit"]), (None, middle, ["activity", "position"]), (middle, None, None)):
+        _, filtered = parse(tp, export, segment_filter=tp.SegmentFilter(start, end, types))
+        assert_same_records(tp, full.records_between(start, end, types), filtered)
+
+
+def test_types_filter_applies_to_cached_records(tp, export, tmp_path, monkeypatch, capsys):
+    path = write_export(tmp_path / "Timeline.json", json.load(open(export, encoding="utf-8"))["semanticSegments"])
+    _, full = parse(tp, path)
+    visits = full.type_counts()["visit"]
+    for _ in range(2):  # first run writes the cache, second run reads it
+        monkeypatch.setattr(sys, "argv", ["timeline-parser.py", path, "--cache", "--types", "visit"])
+        tp.main()
+        assert f"Selected {visits} records" in capsys.readouterr().out
+
+
+def test_track_distances_without_numpy(tp, export, monkeypatch):
+    parser, records = parse(tp, export)
+    vectorized = parser.recompute_track_distances(records)
+    monkeypatch.setattr(tp, "np", None)
+    scalar = parser.recompute_track_distances(records)
+
+    assert scalar["total"] == pytest.approx(vectorized["total"])
+    assert scalar["per_activity"] == pytest.approx(vectorized["per_activity"])
+    assert list(scalar["cumulative"]) == pytest.approx(list(vectorized["cumulative"]))
+
+
+def test_aggregation_without_numpy_matches_split_runs(tp, export, monkeypatch):
+    _, records = parse(tp, export)
+
+    def aggregate(*bounds):
+        engine = tp.AggregationEngine([cls() for cls in tp.AggregationEngine.DEFAULT_ACCUMULATORS]
+                                      + [tp.MonthlyAccumulator()])
+        for start, stop in zip(bounds, bounds[1:]):
+            engine.run(records, start, stop)
+        return engine.results()
+
+    whole = aggregate(0, len(records))
+    assert whole["counts"]["total"] == len(records)
+    assert aggregate(0, 1234, len(records))["monthly"] == whole["monthly"]
+    monkeypatch.setattr(tp, "np", None)
+    assert aggregate(0, len(records)) == whole
+
+
+def test_decode_timestamps_matches_fromisoformat(tp, monkeypatch):
+
+    rng = random.Random(3)
+    zones = ["Z", "+00:00", "+05:45", "-09:30", "+14:00", "-12:00", ""]
+    texts = ["2024-02-29T23:59:59Z", "2023-02-29T10:00:00Z", "2024-01-01T24:00:00Z", "2024-01-01T10:00", "bad"]
+    for digits in range(10):
+        for zone in zones:
+            for _ in range(300 if digits in (0, 3) and zone in ("Z", "+05:45") else 5):
+                moment = datetime(1960, 1, 1) + timedelta(seconds=rng.randrange(3_000_000_000))
+                fraction = "." + "".join(rng.choice("0123456789") for _ in range(digits)) if digits else ""
+                texts.append(moment.isoformat() + fraction + zone)
+
+    expected = {}
+    for text in texts:
+        try:
+            dt = datetime.fromisoformat(text.replace("Z", "+00:00"))
+        except ValueError:
+            continue
+        expected[text] = tp.RecordStore.to_epoch_ns(dt)
+    assert len(expected) == len(texts) - 3
+    assert tp.decode_timestamps(texts) == expected
+    monkeypatch.setattr(tp, "np", None)
+    assert tp.decode_timestamps(texts) == expected
+
+
+def haversine(tp, lat1, lng1, lat2, lng2):
+    a = (math.sin(math.radians(lat2 - lat1) / 2) ** 2
+         + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(math.radians(lng2 - lng1) / 2) ** 2)
+    return 2 * tp.EARTH_RADIUS_METERS * math.asin(math.sqrt(min(a, 1.0)))
+
+
+def test_spatial_queries_match_brute_force_across_the_antimeridian(tp):
+    rng = random.Random(5)
+    points = [(rng.uniform(-1, 1), rng.uniform(-180, 180)) for _ in range(200)]
+    points += [(rng.uniform(-0.2, 0.2), rng.choice((179.9, -179.9)) + rng.uniform(-0.09, 0.09)) for _ in range(200)]
+    points += [(0.0, 179.9), (0.0, -179.9), (0.0, 180.0), (0.0, -180.0)]
+    index = tp.SpatialIndex.from_points([lat for lat, _ in points], [lng for _, lng in points], cell_meters=2000)
+
+    for lat, lng, radius in ((0.0, 179.9, 30000), (0.0, -179.9, 30000), (0.1, 180.0, 5000), (0.5, 20.0, 80000)):
+        distances = sorted((haversine(tp, lat, lng, *point), row) for row, point in enumerate(points))
+        expected = [(d, row) for d, row in distances if d <= radius]
+        found = index.within_radius(lat, lng, radius)
+        assert [row for row, _ in found] == [row for _, row in expected]
+        assert [d for _, d in found] == pytest.approx([d for d, _ in expected])
+        assert [row for row, _ in index.nearest(lat, lng, 7)] == [row for _, row in distances[:7]]
+    # Both sides of 180° are within 30 km of (0, 179.9)
+    assert {row for row, _ in index.within_radius(0.0, 179.9, 30000)} >= {len(points) - 4, len(points) - 3}
+
+    for south, west, north, east in ((-0.1, 179.85, 0.1, -179.85), (-1, -10, 1, 10), (-1, 179.0, 1, 180.0)):
+        crosses = west > east
+        expected = [row for row, (lat, lng) in enumerate(points) if south <= lat <= north
+                    and ((lng >= west or lng <= east) if crosses else west <= lng <= east)]
+        assert index.within_bbox(south, west, north, east) == expected
+
+
+def test_place_clusters_split_exactly_at_the_radius(tp):
+    radius = 100.0
+    step = radius / tp.EARTH_RADIUS_METERS
+    for lat in (0.0, 52.0, -70.0):
+        for scale in (0.99, 1.01):
+            north = (lat + math.degrees(step * scale), 8.0)
+            east = (lat, 8.0 + math.degrees(2 * math.asin(math.sin(step * scale / 2) / math.cos(math.radians(lat)))))
+            for other in (north, east):
+                assert haversine(tp, lat, 8.0, *other) == pytest.approx(radius * scale)
+                store = tp.RecordStore()
+                for n, (plat, plng) in enumerate([(lat, 8.0), other, (lat, 8.0)]):
+                    stamp = (1_700_000_000_000_000_000 + n * 3_600_000_000_000, 0)
+                    store.append(n, stamp, stamp, "visit", "HOME", start_latitude=plat, start_longitude=plng,
+                                 duration_seconds=600.0)
+
+                places = tp.cluster_visit_places(store, radius)
+                assert sorted(place["visits"] for place in places) == ([3] if scale < 1 else [1, 2])
+                # Only points within the radius of each other add up to min_visits
+                places = tp.cluster_visit_places(store, radius, min_visits=3)
+                assert [place["visits"] for place in places] == ([3] if scale < 1 else [])
+
+
+def test_simplified_tracks_stay_within_tolerance(tp, export):
+    np = pytest.importorskip("numpy")
+    rng = np.random.default_rng(11)
+    for tolerance in (1.0, 25.0):
+        # Random walks that double back on themselves, plus a straight line and repeated points
+        for x, y in [np.cumsum(rng.normal(0, 20, (2, 500)), axis=1) for _ in range(5)] + \
+                [(np.arange(50.0), np.zeros(50)), (np.zeros(5), np.zeros(5))]:
+            keep, error = tp.simplify_polyline(x, y, tolerance)
+            kept = np.flatnonzero(keep)
+            assert kept[0] == 0 and kept[-1] == len(x) - 1
+            for first, last in zip(kept[:-1], kept[1:]):
+                dx, dy = x[last] - x[first], y[last] - y[first]
+                worst = 0.0
+                for i in range(first + 1, last):
+                    px, py = x[i] - x[first], y[i] - y[first]
+                    length = dx * dx + dy * dy
+                    t = min(max((px * dx + py * dy) / length, 0.0), 1.0) if length else 0.0
+                    worst = max(worst, math.hypot(px - t * dx, py - t * dy))
+                assert worst <= tolerance
+                assert error[first] == pytest.approx(worst)
+
+    parser, records = parse(tp, export)
+    tracks = parser.simplify_tracks(records, 10.0)
+    assert 0 < len(tracks["rows"]) <= tracks["points"]
+    assert tracks["error_meters"].max() <= 10.0
+
+
+def test_gps_distances_of_activities_sharing_an_edge(tp):
+    pytest.importorskip("numpy")
+    minute = 60_000_000_000
+    base = 1_700_000_000_000_000_000
+    fixes = [(base + k * minute, 52.0 + 0.001 * k * k, 8.5 + 0.002 * k) for k in range(11)]
+    # Activities back to back at minute 5, one with a single fix and one with none
+    spans = [(0, 5), (5, 10), (10, 10.5), (20, 30)]
+    rows = [(start, "activity", (base + int(start * minute), base + int(stop * minute))) for start, stop in spans]
+    rows += [(k, "position", fix) for k, fix in enumerate(fixes)]
+    store = tp.RecordStore()
+    for _, kind, value in sorted(rows, key=lambda row: (row[0], row[1])):
+        if kind == "activity":
+            store.append(0, (value[0], 60), (value[1], 60), "activity", "WALKING", distance_meters=999.0)
+        else:
+            store.append(1, (value[0], 60), (value[0], 60), "position", None, start_latitude=value[1],
+                         start_longitude=value[2])
+
+    summary = tp.TimelineParser().recompute_activity_distances(store)
+
+    expected = []
+    for start, stop in spans:
+        inside = [fix for fix in fixes if base + int(start * minute) <= fix[0] <= base + int(stop * minute)]
+        expected.append((sum(haversine(tp, *a[1:], *b[1:]) for a, b in zip(inside, inside[1:])), len(inside)))
+    activities = [i for i in range(len(store)) if store.row(i)["record_type"] == "activity"]
+    assert [store.distance_meters[i] for i in activities[:2]] == pytest.approx([meters for meters, _ in expected[:2]])
+    assert [store.distance_meters[i] for i in activities[2:]] == [999.0, 999.0]
+    assert [store.track_points[i] for i in activities] == [count for _, count in expected] == [6, 6, 1, 0]
+    assert summary["corrected"] == 2
+    assert summary["reported_meters"] == 2 * 999.0
+    assert summary["gps_meters"] == pytest.approx(expected[0][0] + expected[1][0])
+
+
+def test_wifi_scans_fall_back_to_fingerprints(tp):
+    hour = 3_600_000_000_000
+    base = 1_700_000_000_000_000_000
+    home, work = (52.0, 8.5), (52.1, 8.7)
+    store = tp.RecordStore()
+
+    def scan(timestamp, *devices):
+        store.append(0, (timestamp, 60), (timestamp, 60), "wifi_scan", "WIFI_SCAN", wifi_devices=len(devices),
+                     strongest_signal=max(rssi for _, rssi in devices),
+                     devices=[{"mac": mac, "rawRssi": rssi} for mac, rssi in devices])
+
+    store.append(1, (base, 60), (base, 60), "position", None, start_latitude=home[0], start_longitude=home[1])
+    scan(base + 10_000_000_000, ("a", -40), ("b", -60))  # next to a fix
+    store.append(2, (base + 5 * hour, 60), (base + 6 * hour, 60), "visit", "WORK", start_latitude=work[0],
+                 start_longitude=work[1], end_latitude=work[0], end_longitude=work[1])
+    scan(base + 5 * hour + hour // 2, ("b", -50), ("c", -70))  # during a visit
+    fingerprinted = len(store)
+    scan(base + 48 * hour, ("a", -45), ("c", -80))  # no fix or visit nearby
+    scan(base + 49 * hour, ("d", -30))  # only an access point never seen at a known place
+
+    summary = tp.TimelineParser().locate_wifi_scans(store)
+
+    assert summary == {"scans": 4, "anchored": 2, "fingerprinted": 1, "unlocated": 1, "access_points": 3}
+    # Access point a was only seen at home, c only at work: weights are rssi + 100
+    expected = [(55 * h + 20 * w) / 75 for h, w in zip(home, work)]
+    row = store.row(fingerprinted)
+    assert (row["start_latitude"], row["start_longitude"]) == pytest.approx(expected)
+    assert (row["end_latitude"], row["end_longitude"]) == pytest.approx(expected)
+    assert store.strings["source"][store.source[fingerprinted]] == "WIFI_FINGERPRINT"
+    assert store.row(fingerprinted - 3)["start_latitude"] == home[0]
+    assert store.row(fingerprinted - 1)["start_latitude"] == work[0]
+    assert store.start_latitude[len(store) - 1] != store.start_latitude[len(store) - 1]
+
+
+def test_save_load_round_trip(tp, export, tmp_path):
+    _, records = parse(tp, export)
+    records.save(str(tmp_path / "records.bin"), source={"size": 1})
+    for writable in (False, True):
+        loaded = tp.RecordStore.load(str(tmp_path / "records.bin"), writable=writable)
+        assert_same_records(tp, records, loaded)
+        assert loaded.metadata == {"source": {"size": 1}}
+
+
+def test_incremental_heatmap_matches_full_build(tp, export, tmp_path):
+    np = pytest.importorskip("numpy")
+    _, records = parse(tp, export)
+    timestamps = records.timestamp
+    cut = next(i for i in range(len(records) // 2, len(records)) if timestamps[i - 1] < timestamps[i])
+
+    full = tp.HeatmapRaster((3, 9), weight="dwell")
+    full.add(records)
+    incremental = tp.HeatmapRaster((3, 9), weight="dwell")
+    incremental.add(records.slice(0, cut))
+    incremental.save(str(tmp_path))
+    incremental = tp.HeatmapRaster.load(str(tmp_path))
+    incremental.add(records)
+
+    assert incremental.tiles.keys() == full.tiles.keys()
+    for key, raster in full.tiles.items():
+        np.testing.assert_allclose(incremental.tiles[key], raster)
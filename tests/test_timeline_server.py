@@ -0,0 +1,69 @@
+import asyncio
+import json
+import threading
+from urllib.parse import quote
+
+import pytest
+
+from conftest import load_script, parse, write_export
+
+
+@pytest.fixture(scope="module")
+def ts():
+    return load_script("timeline-server.py", "timeline_server")
+
+
+def ask(server, target):
+    status, content_type, body, _ = asyncio.run(server.answer(target))
+    return status, json.loads(body) if content_type == "application/json" else body
+
+
+def test_server_answers_like_the_parser(tp, ts, segments, tmp_path, capsys):
+    path = write_export(tmp_path / "Timeline.json", segments)
+    _, records = parse(tp, path)
+    server = ts.TimelineServer(path)
+    asyncio.run(server.reload(force=True))
+
+    status, body = ask(server, "/records?limit=5")
+    assert status == 200 and body["count"] == len(records) and len(body["records"]) == 5
+    assert ask(server, "/status")[1]["records"] == len(records)
+    assert ask(server, "/summary")[1] == json.loads(json.dumps(tp.AggregationEngine().run(records).results()))
+    assert ask(server, "/records?types=visit")[1]["count"] == records.type_counts()["visit"]
+    assert ask(server, "/nowhere")[0] == 404
+    assert ask(server, "/near?lat=x&lng=1")[0] == 400
+
+    capsys.readouterr()
+    status, csv = ask(server, "/export?format=csv")
+    records_csv = tmp_path / "records.csv"
+    server.snapshot.parser.export_csv(server.snapshot.records, str(records_csv), quiet=True)
+    assert status == 200 and csv == records_csv.read_bytes()
+    assert capsys.readouterr().out == ""
+
+
+def test_server_reload_matches_full_ingest(tp, ts, segments, tmp_path):
+    path = tmp_path / "Timeline.json"
+    write_export(path, segments[: len(segments) // 2])
+    server = ts.TimelineServer(str(path))
+    asyncio.run(server.reload(force=True))
+
+    write_export(path, segments)
+    assert asyncio.run(server.reload(force=True))
+    full = ts.TimelineServer(write_export(tmp_path / "Full.json", segments))
+    asyncio.run(full.reload(force=True))
+    assert ask(server, "/monthly")[1] == ask(full, "/monthly")[1]
+    assert ask(server, "/summary")[1] == ask(full, "/summary")[1]
+
+
+def test_server_runs_large_windows_in_a_worker_thread(tp, ts, segments, tmp_path, monkeypatch):
+    server = ts.TimelineServer(write_export(tmp_path / "Timeline.json", segments))
+    asyncio.run(server.reload(force=True))
+    records = server.snapshot.records
+    middle = records.datetime_at(len(records) // 2).isoformat()
+    threads = []
+    run = tp.AggregationEngine.run
+    monkeypatch.setattr(tp.AggregationEngine, "run", lambda *args: threads.append(threading.current_thread()) or run(*args))
+    monkeypatch.setattr(ts, "EXECUTOR_ROWS", len(records) // 2)
+
+    assert ask(server, f"/summary?to={quote(middle)}")[1]["counts"]["total"] == records.time_range(None, middle)[1]
+    assert ask(server, "/summary?types=visit")[1]["counts"]["total"] == records.type_counts()["visit"]
+    assert threads == [threading.main_thread(), threads[1]] and threads[1] is not threading.main_thread()
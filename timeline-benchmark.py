@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Benchmark timeline-parser.py on synthetic exports from timeline-generator.py.
+
+Every size runs in a fresh process and times load_timeline_data,
+parse_all_segments, analyze_timeline and export_csv, reporting throughput
+(segments/s) and the peak resident memory after each stage. Results can be
+saved as JSON and compared against an earlier run to catch regressions.
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+from script_loader import load_script, load_timeline_parser
+
+STAGES = ["load_timeline_data", "parse_all_segments", "analyze_timeline", "export_csv"]
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB (None where unsupported)"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / (1 << 20) if sys.platform == "darwin" else peak / 1024
+
+
+def run_stages(path, stream=False, workers=1, json_backend="auto"):
+    """Time the parser stages on one export in this process; returns a result dict"""
+    timeline_parser = load_timeline_parser()
+    parser = timeline_parser.TimelineParser(path)
+    result = {"file": path, "bytes": os.path.getsize(path), "stream": stream, "workers": workers,
+              "json_backend": None if stream else timeline_parser.json_backend(json_backend)[0], "stages": {}}
+
+    with tempfile.TemporaryDirectory() as tmp, open(os.devnull, "w") as devnull:
+        csv_file = os.path.join(tmp, "timeline.csv")
+        steps = [
+            ("load_timeline_data", lambda: parser.load_timeline_data(stream=stream, json_backend_name=json_backend)),
+            ("parse_all_segments", lambda: parser.parse_all_segments(workers=workers)),
+            ("analyze_timeline", lambda: parser.analyze_timeline(records)),
+            ("export_csv", lambda: parser.export_csv(records, csv_file)),
+        ]
+        records = None
+        for stage, step in steps:
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(devnull):
+                value = step()
+            seconds = time.perf_counter() - start
+            if stage == "parse_all_segments":
+                records = value
+                result["records"] = len(records)
+                result["segments"] = parser.stats.result()["segments"]
+            result["stages"][stage] = {"seconds": seconds, "peak_rss_mb": peak_rss_mb()}
+
+    # Throughput in input segments per second (a segment can yield several records)
+    for stage in result["stages"].values():
+        stage["segments_per_second"] = result["segments"] / stage["seconds"] if stage["seconds"] else None
+    return result
+
+
+def print_results(results, baseline=None, tolerance=0.2):
+    """Print a table of all runs; returns the number of stages slower than the baseline"""
+    print(f"{'segments':>10}  {'stage':<20} {'seconds':>9} {'segments/s':>12} {'peak RSS MB':>12}")
+    regressions = 0
+    for size, result in results.items():
+        for stage in STAGES:
+            figures = result["stages"][stage]
+            rate = figures["segments_per_second"]
+            rss = figures["peak_rss_mb"]
+            line = (f"{size:>10}  {stage:<20} {figures['seconds']:9.3f} "
+                    f"{rate if rate is not None else float('nan'):12,.0f} "
+                    f"{rss if rss is not None else float('nan'):12.1f}")
+            before_result = (baseline or {}).get(size, {})
+            mode = ("stream", "workers", "json_backend")
+            same_mode = all(before_result.get(key) == result.get(key) for key in mode)
+            before = before_result.get("stages", {}).get(stage) if same_mode else None
+            if before and before["seconds"]:
+                change = figures["seconds"] / before["seconds"] - 1
+                line += f"  {change:+.0%} vs baseline"
+                if change > tolerance:
+                    line += "  SLOWER"
+                    regressions += 1
+            print(line)
+    return regressions
+
+
+def main():
+    """Main function"""
+    parser = argparse.ArgumentParser(description="Benchmark timeline-parser.py on synthetic Timeline exports")
+    parser.add_argument("--sizes", default="10k,1M", help="Comma-separated segment counts, e.g. 10k,1M,10M (default 10k,1M)")
+    parser.add_argument("--seed", type=int, default=1, help="Generator seed (default 1)")
+    parser.add_argument("--data-dir", default=os.path.join(tempfile.gettempdir(), "timeline-benchmark"),
+                        help="Where generated exports are kept and reused between runs")
+    parser.add_argument("--stream", action="store_true", help="Benchmark the streaming reader")
+    parser.add_argument("--workers", type=int, default=1, help="Parse with this many processes")
+    parser.add_argument("--json-backend", default="auto", help="JSON decoder to load with (auto, json, orjson, simdjson)")
+    parser.add_argument("--json", metavar="FILE", help="Write the results as JSON")
+    parser.add_argument("--compare", metavar="FILE", help="Compare against results saved with --json")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="With --compare: flag stages more than this fraction slower (default 0.2)")
+    parser.add_argument("--run", metavar="FILE", help=argparse.SUPPRESS)  # child process: one export
+    args = parser.parse_args()
+
+    if args.run:
+        json.dump(run_stages(args.run, args.stream, args.workers, args.json_backend), sys.stdout)
+        return 0
+
+    generator = load_script("timeline-generator.py", "timeline_generator")
+    os.makedirs(args.data_dir, exist_ok=True)
+    results = {}
+    for size in args.sizes.split(","):
+        count = generator.parse_count(size)
+        path = os.path.join(args.data_dir, f"timeline-{count}-seed{args.seed}.json")
+        if not os.path.isfile(path):
+            print(f"Generating {count} segments into {path}...")
+            generator.write_timeline(path, count, args.seed)
+
+        print(f"Benchmarking {count} segments...")
+        command = [sys.executable, os.path.abspath(__file__), "--run", path, "--workers", str(args.workers),
+                   "--json-backend", args.json_backend]
+        if args.stream:
+            command.append("--stream")
+        child = subprocess.run(command, capture_output=True, text=True)
+        if child.returncode:
+            print(f"Error: benchmark of {path} failed:\n{child.stderr}")
+            return 1
+        results[str(count)] = json.loads(child.stdout)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    print()
+    regressions = print_results(results, baseline, args.tolerance)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {args.json}")
+
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
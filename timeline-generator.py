@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+"""
+Generate a synthetic Google Timeline export (Timeline.json) for benchmarks and
+demos. The output is deterministic for a given seed and has the same segment
+mix as a real export: visits at recurring places, activities between them with
+GPS fixes along the route, activity records and wifi scans.
+"""
+
+import argparse
+import json
+import math
+import random
+import re
+from datetime import datetime, timedelta, timezone
+
+try:
+    from zoneinfo import ZoneInfo
+
+    LOCAL_TIMEZONE = ZoneInfo("Europe/Berlin")
+except Exception:  # no tz database: fixed offset instead of DST changes
+    LOCAL_TIMEZONE = timezone(timedelta(hours=1))
+
+CENTER = (52.0187, 8.5751)
+EARTH_RADIUS_METERS = 6371000
+
+# Activity type, speed in m/s, preferred up to this trip length in meters
+TRAVEL_MODES = [
+    ("WALKING", 1.4, 1500),
+    ("CYCLING", 4.5, 6000),
+    ("IN_BUS", 8.0, 12000),
+    ("IN_PASSENGER_VEHICLE", 13.0, 60000),
+    ("IN_TRAIN", 25.0, float("inf")),
+]
+SEMANTIC_TYPES = ["UNKNOWN", "INFERRED_HOME", "INFERRED_WORK", "SEARCHED_ADDRESS", "ALIASED_LOCATION"]
+SIZE_SUFFIXES = {"": 1, "k": 1000, "m": 1000000}
+
+
+def parse_count(text):
+    """Parse a segment count such as 10000, 10k or 1M"""
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([kKmM]?)\s*", text)
+    if not match:
+        raise ValueError(f"Invalid count '{text}'")
+    return int(float(match.group(1)) * SIZE_SUFFIXES[match.group(2).lower()])
+
+
+def format_latlng(lat, lng):
+    return f"{lat:.7f}°, {lng:.7f}°"
+
+
+def format_time(dt):
+    return dt.astimezone(LOCAL_TIMEZONE).isoformat(timespec="milliseconds")
+
+
+def offset_point(lat, lng, north_meters, east_meters):
+    """Move a point by the given meters (small offsets)"""
+    lat2 = lat + math.degrees(north_meters / EARTH_RADIUS_METERS)
+    lng2 = lng + math.degrees(east_meters / (EARTH_RADIUS_METERS * math.cos(math.radians(lat))))
+    return lat2, lng2
+
+
+def distance_meters(lat1, lng1, lat2, lng2):
+    dy = math.radians(lat2 - lat1) * EARTH_RADIUS_METERS
+    dx = math.radians(lng2 - lng1) * EARTH_RADIUS_METERS * math.cos(math.radians(lat1))
+    return math.hypot(dx, dy)
+
+
+class TimelineGenerator:
+    """Simulates one person's days and yields Timeline semantic segments in time order"""
+
+    def __init__(self, seed=1, start=None, places=60):
+        self.random = random.Random(seed)
+        self.time = start or datetime(2024, 1, 1, 7, 0, tzinfo=LOCAL_TIMEZONE)
+        self.places = [self._make_place(i) for i in range(places)]
+        self.home, self.work = self.places[0], self.places[1]
+        self.home["semantic_type"], self.work["semantic_type"] = "HOME", "WORK"
+        self.place = self.home
+
+    def _make_place(self, number):
+        r = self.random
+        # Most places are in town, a few are trips further out
+        radius = r.expovariate(1 / 4000) if r.random() < 0.9 else r.uniform(20000, 150000)
+        angle = r.uniform(0, 2 * math.pi)
+        lat, lng = offset_point(*CENTER, radius * math.sin(angle), radius * math.cos(angle))
+        return {
+            "place_id": f"ChIJ{r.getrandbits(64):016x}{number:04d}",
+            "lat": lat,
+            "lng": lng,
+            "semantic_type": r.choice(SEMANTIC_TYPES),
+            "macs": [r.getrandbits(48) for _ in range(r.randint(2, 12))],
+        }
+
+    def _next_place(self):
+        r = self.random
+        hour = self.time.astimezone(LOCAL_TIMEZONE).hour
+        if self.place is not self.home and (hour >= 21 or hour < 6 or r.random() < 0.3):
+            return self.home
+        if self.place is self.home and 6 <= hour < 10 and self.time.weekday() < 5:
+            return self.work
+        # Favourite places come up far more often than the rest
+        return self.places[min(int(r.paretovariate(1.2)) + 1, len(self.places) - 1)]
+
+    def _dwell(self, place):
+        r = self.random
+        if place is self.home:
+            hour = self.time.astimezone(LOCAL_TIMEZONE).hour
+            return timedelta(hours=r.uniform(8, 11)) if hour >= 18 or hour < 6 else timedelta(minutes=r.uniform(30, 180))
+        if place is self.work:
+            return timedelta(hours=r.uniform(6, 9))
+        return timedelta(minutes=r.uniform(10, 150))
+
+    def segments(self):
+        """Endless generator of segments (visit, then its samples, then the trip to the next place)"""
+        while True:
+            yield from self._visit()
+            yield from self._trip()
+
+    def _visit(self):
+        r = self.random
+        place = self.place
+        start = self.time
+        end = start + self._dwell(place)
+        yield {
+            "startTime": format_time(start),
+            "endTime": format_time(end),
+            "visit": {
+                "hierarchyLevel": 0,
+                "probability": round(r.uniform(0.5, 1.0), 6),
+                "topCandidate": {
+                    "placeId": place["place_id"],
+                    "semanticType": place["semantic_type"],
+                    "probability": round(r.uniform(0.3, 1.0), 6),
+                    "placeLocation": {"latLng": format_latlng(place["lat"], place["lng"])},
+                },
+            },
+        }
+
+        # Sparse samples while staying: wifi scans, low-power fixes, still records
+        t = start + timedelta(minutes=r.uniform(1, 15))
+        while t < end:
+            kind = r.random()
+            if kind < 0.45:
+                lat, lng = offset_point(place["lat"], place["lng"], r.gauss(0, 15), r.gauss(0, 15))
+                yield self._position(t, lat, lng, "WIFI", r.uniform(10, 50), 0.0)
+            elif kind < 0.75:
+                macs = r.sample(place["macs"], r.randint(1, len(place["macs"])))
+                yield {
+                    "wifiScan": {
+                        "deliveryTime": format_time(t),
+                        "devicesRecords": [{"mac": mac, "rawRssi": r.randint(-95, -35)} for mac in macs],
+                    }
+                }
+            else:
+                yield self._activity_record(t, "STILL")
+            t += timedelta(minutes=r.expovariate(1 / 20))
+        self.time = end
+
+    def _trip(self):
+        r = self.random
+        origin, target = self.place, self._next_place()
+        if target is origin:
+            target = self.home if origin is not self.home else self.work
+        straight = distance_meters(origin["lat"], origin["lng"], target["lat"], target["lng"])
+        route = straight * r.uniform(1.15, 1.5)
+        mode, speed, _ = next(m for m in TRAVEL_MODES if route <= m[2] or m[0] == "IN_TRAIN")
+        speed *= r.uniform(0.8, 1.2)
+
+        start = self.time
+        end = start + timedelta(seconds=max(route / speed, 60))
+        yield {
+            "startTime": format_time(start),
+            "endTime": format_time(end),
+            "activity": {
+                "start": {"latLng": format_latlng(origin["lat"], origin["lng"])},
+                "end": {"latLng": format_latlng(target["lat"], target["lng"])},
+                "distanceMeters": round(route, 1),
+                "probability": round(r.uniform(0.5, 1.0), 6),
+                "topCandidate": {"type": mode, "probability": round(r.uniform(0.4, 1.0), 6)},
+            },
+        }
+
+        # GPS fixes along a wobbly line between the places
+        interval = 30 if mode in ("WALKING", "CYCLING") else 60
+        steps = max(int((end - start).total_seconds() // interval), 1)
+        wobble_north, wobble_east = r.gauss(0, straight * 0.1), r.gauss(0, straight * 0.1)
+        altitude = r.uniform(60, 140)
+        for step in range(1, steps):
+            f = step / steps
+            bend = math.sin(math.pi * f)
+            lat = origin["lat"] + (target["lat"] - origin["lat"]) * f
+            lng = origin["lng"] + (target["lng"] - origin["lng"]) * f
+            lat, lng = offset_point(lat, lng, wobble_north * bend + r.gauss(0, 5), wobble_east * bend + r.gauss(0, 5))
+            altitude += r.gauss(0, 1)
+            t = start + (end - start) * f
+            yield self._position(t, lat, lng, "GPS", r.uniform(3, 25), max(r.gauss(speed, speed * 0.2), 0), altitude)
+            if r.random() < 0.1:
+                yield self._activity_record(t, mode)
+
+        self.place = target
+        self.time = end
+
+    def _position(self, t, lat, lng, source, accuracy, speed, altitude=None):
+        position = {
+            "LatLng": format_latlng(lat, lng),
+            "accuracyMeters": int(accuracy),
+            "source": source,
+            "timestamp": format_time(t),
+            "speedMetersPerSecond": round(speed, 2),
+        }
+        if altitude is not None:
+            position["altitudeMeters"] = round(altitude, 1)
+        return {"position": position}
+
+    def _activity_record(self, t, likely):
+        r = self.random
+        confidence = r.randint(50, 100)
+        others = [m[0] for m in TRAVEL_MODES if m[0] != likely]
+        return {
+            "activityRecord": {
+                "timestamp": format_time(t),
+                "probableActivities": [
+                    {"type": likely, "confidence": confidence / 100},
+                    {"type": r.choice(others), "confidence": (100 - confidence) / 100},
+                ],
+            }
+        }
+
+
+def write_timeline(path, count, seed=1, start=None):
+    """Write count segments as a Timeline.json file, one segment at a time (constant memory)"""
+    generator = TimelineGenerator(seed, start)
+    segments = generator.segments()
+    with open(path, "w", encoding="utf-8", buffering=1 << 20) as f:
+        f.write('{\n  "semanticSegments": [\n')
+        for i in range(count):
+            if i:
+                f.write(",\n")
+            f.write("    ")
+            f.write(json.dumps(next(segments), ensure_ascii=False))
+        f.write('\n  ],\n  "rawSignals": [],\n  "userLocationProfile": {}\n}\n')
+    return path
+
+
+def main():
+    """Main function"""
+    parser = argparse.ArgumentParser(description="Generate a synthetic Google Timeline export")
+    parser.add_argument("output", help="Timeline JSON file to write")
+    parser.add_argument("--segments", type=parse_count, default=parse_count("10k"),
+                        help="Number of semantic segments, e.g. 10k, 1M, 10M (default 10k)")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed; the same seed gives the same file")
+    parser.add_argument("--start", help="Start date (ISO, local time, default 2024-01-01)")
+    args = parser.parse_args()
+
+    start = None
+    if args.start:
+        start = datetime.fromisoformat(args.start)
+        start = start.replace(tzinfo=LOCAL_TIMEZONE) if start.tzinfo is None else start
+
+    write_timeline(args.output, args.segments, args.seed, start)
+    print(f"Wrote {args.segments} segments to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,20 +5,2603 @@ the data to provide insights into movement patterns and location history.
 """
 
 import argparse
+import contextlib
+import copy
+import functools
+import gc
+import gzip
+import hashlib
+import heapq
 import json
 import math
+import mmap
+import operator
 import os
-from collections import defaultdict
-from datetime import datetime
+import re
+import struct
+import sys
+import tempfile
+import time
+import zlib
+from abc import ABC, abstractmethod
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import Counter, defaultdict, deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import datetime, timedelta, timezone
+from itertools import accumulate, islice, repeat, zip_longest
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is only needed for the vectorized batch APIs
+    np = None
+
+try:
+    import orjson
+except ImportError:  # optional, much faster JSON decoding
+    orjson = None
+
+try:
+    import simdjson
+except ImportError:  # optional, pysimdjson
+    simdjson = None
+
+EARTH_RADIUS_METERS = 6371000
+STREAM_CHUNK_SIZE = 1 << 20  # characters read from the export per refill
+SHARD_SIZE = 20000  # segments per process pool task
+SCAN_BLOCK_SIZE = 16 << 20  # bytes of the export scanned per step when cutting it into shards
+
+
+def _json_loads(data):
+    """Stdlib decoder (json.loads takes bytes but not memoryviews)"""
+    return json.loads(bytes(data) if isinstance(data, memoryview) else data)
+
+
+# JSON decoders by name: loads(bytes-like) -> Python objects. Add more with
+# register_json_backend; "auto" takes the first installed one of JSON_BACKEND_PREFERENCE.
+JSON_BACKENDS = {"json": _json_loads}
+if orjson is not None:
+    JSON_BACKENDS["orjson"] = orjson.loads
+if simdjson is not None:
+    JSON_BACKENDS["simdjson"] = lambda data: simdjson.loads(bytes(data))
+JSON_BACKEND_PREFERENCE = ["orjson", "simdjson", "json"]
+
+
+def register_json_backend(name, loads, preferred=False):
+    """Make a decoder available to load_json_file (preferred: try it first for "auto")"""
+    JSON_BACKENDS[name] = loads
+    if name not in JSON_BACKEND_PREFERENCE:
+        JSON_BACKEND_PREFERENCE.insert(0 if preferred else len(JSON_BACKEND_PREFERENCE) - 1, name)
+
+
+def json_backend(name=None):
+    """Return (name, loads) of a JSON backend; None or "auto" picks the fastest installed one"""
+    if name in (None, "auto"):
+        name = next(candidate for candidate in JSON_BACKEND_PREFERENCE if candidate in JSON_BACKENDS)
+    loads = JSON_BACKENDS.get(name)
+    if loads is None:
+        raise RuntimeError(f"JSON backend '{name}' is not installed (available: {', '.join(JSON_BACKENDS)})")
+    return name, loads
+
+
+def load_json_file(path, backend=None):
+    """Decode a whole JSON file straight from a read-only memory map"""
+    _, loads = json_backend(backend)
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        with (mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else contextlib.nullcontext(b"")) as buffer:
+            with memoryview(buffer) as view:
+                return loads(view)
+
+
+class JsonArrayStream:
+    """Iterate over the items of one top-level JSON array, decoding one item at a time from chunks of the file"""
+
+    _WHITESPACE = re.compile(r"[ \t\n\r]*")
+    _STRUCTURE = re.compile(r'["\[\]{}]')
+    _STRING = re.compile(r'"(?:[^"\\]|\\.)*"', re.DOTALL)
+    _DELIMITER = re.compile(r"[ \t\n\r,\]}]")
+
+    def __init__(self, f, key, chunk_size=STREAM_CHUNK_SIZE):
+        self.f = f
+        self.key = key
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+        self._seek_array()
+
+    def _fill(self):
+        """Read the next chunk, dropping everything already consumed"""
+        if self.eof:
+            return False
+        chunk = self.f.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def _peek(self):
+        """Skip whitespace and return the next character ('' at end of file)"""
+        while True:
+            self.pos = self._WHITESPACE.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                return ""
+
+    def _expect(self, char):
+        if self._peek() != char:
+            raise ValueError(f"Expected '{char}' at offset {self.pos} while looking for '{self.key}'")
+        self.pos += 1
+
+    def _decode(self):
+        """Decode one complete JSON value, reading more data until it fits"""
+        self._peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+                continue
+            if isinstance(value, (int, float)) and not self._DELIMITER.search(self.buf, self.pos):
+                # A number at the end of the buffer might continue in the next chunk
+                if self._fill():
+                    continue
+            self.pos = end
+            return value
+
+    def _skip_value(self):
+        """Skip one value without materializing nested arrays or objects"""
+        if self._peek() not in "[{":
+            self._decode()
+            return
+
+        depth = 0
+        while True:
+            match = self._STRUCTURE.search(self.buf, self.pos)
+            if not match:
+                self.pos = len(self.buf)
+                if not self._fill():
+                    raise ValueError("Unexpected end of file while skipping a value")
+                continue
+
+            char = match.group()
+            if char == '"':
+                string = self._STRING.match(self.buf, match.start())
+                if not string:
+                    self.pos = match.start()
+                    if not self._fill():
+                        raise ValueError("Unterminated string in JSON file")
+                    continue
+                self.pos = string.end()
+                continue
+
+            self.pos = match.end()
+            depth += 1 if char in "[{" else -1
+            if depth == 0:
+                return
+
+    def _seek_array(self):
+        """Position the reader just behind the '[' of the requested key"""
+        self._expect("{")
+        if self._peek() == "}":
+            raise KeyError(self.key)
+
+        while True:
+            name = self._decode()
+            self._expect(":")
+            if name == self.key:
+                self._expect("[")
+                return
+
+            self._skip_value()
+            separator = self._peek()
+            self.pos += 1
+            if separator == "}":
+                raise KeyError(self.key)
+            if separator != ",":
+                raise ValueError(f"Malformed JSON object at offset {self.pos}")
+
+    def __iter__(self):
+        try:
+            if self._peek() == "]":
+                return
+
+            while True:
+                yield self._decode()
+                separator = self._peek()
+                self.pos += 1
+                if separator == "]":
+                    return
+                if separator != ",":
+                    raise ValueError(f"Malformed '{self.key}' array at offset {self.pos}")
+        finally:
+            self.f.close()
+
+
+def iter_segment_ranges(path, shard_size, key="semanticSegments", block_size=SCAN_BLOCK_SIZE):
+    """Cut a top-level JSON array into (base_index, start, stop) byte ranges of shard_size items (KeyError if missing)"""
+    require_numpy("iter_segment_ranges")
+    backslash, quote = ord("\\"), ord('"')
+    kinds = np.zeros(256, dtype=np.int8)
+    kinds[list(b"[{")] = 1
+    kinds[list(b"]}")] = -1
+    kinds[ord(",")] = 2
+    kinds[quote] = 3
+    key_pattern = re.compile(rb'"' + re.escape(key.encode()) + rb'"\s*:\s*$')
+
+    in_string, depth, backslashes = 0, 0, 0
+    array_start, base_index, pending = None, 0, np.empty(0, dtype=np.int64)
+    previous = b""
+    with open(path, "rb") as f:
+        offset = 0
+        for chunk in iter(lambda: f.read(block_size), b""):
+            block = np.frombuffer(chunk, dtype=np.uint8)
+            # "[" and "]" are "{" and "}" without bit 5
+            folded = block | 32
+            positions = np.flatnonzero((folded == ord("{")) | (folded == ord("}")) | (block == quote) | (block == ord(",")))
+            kind = kinds[block[positions]]
+
+            # A quote behind an odd run of backslashes (counted across blocks) is part of a string
+            quotes = positions[kind == 3]
+            escaped = []
+            for q in quotes[(quotes == 0) | (block[quotes - 1] == backslash)].tolist():
+                run = q - 1
+                while run >= 0 and chunk[run] == backslash:
+                    run -= 1
+                if (q - 1 - run + (backslashes if run < 0 else 0)) % 2:
+                    escaped.append(q)
+            if escaped:
+                keep = np.ones(len(positions), dtype=bool)
+                keep[np.searchsorted(positions, escaped)] = False
+                positions, kind = positions[keep], kind[keep]
+
+            is_quote = kind == 3
+            quotes_before = np.cumsum(is_quote, dtype=np.int64) + in_string
+            in_string = int(quotes_before[-1] % 2) if len(quotes_before) else in_string
+            outside = ~is_quote & (quotes_before % 2 == 0)
+            positions, kind = positions[outside], kind[outside]
+            depths = depth + np.cumsum(np.where(kind == 2, 0, kind), dtype=np.int64)
+            if len(depths):
+                depth = int(depths[-1])
+
+            if array_start is None:
+                text = previous + chunk
+                for position in positions[(kind == 1) & (depths == 2)].tolist():
+                    end = len(previous) + position
+                    if chunk[position] == ord("[") and key_pattern.search(text, max(0, end - 256), end):
+                        array_start = shard_start = offset + position + 1
+                        break
+            if array_start is not None:
+                absolute = positions + offset
+                after = absolute >= array_start
+                closing = np.flatnonzero(after & (kind == -1) & (depths == 1))
+                array_stop = int(absolute[closing[0]]) if closing.size else None
+                if array_stop is not None:
+                    after &= absolute < array_stop
+                pending = np.concatenate((pending, absolute[after & (kind == 2) & (depths == 2)]))
+                while len(pending) >= shard_size:
+                    stop = int(pending[shard_size - 1])
+                    yield base_index, shard_start, stop
+                    base_index, shard_start, pending = base_index + shard_size, stop + 1, pending[shard_size:]
+                if array_stop is not None:
+                    f.seek(shard_start)
+                    if base_index or len(pending) or f.read(array_stop - shard_start).strip():
+                        yield base_index, shard_start, array_stop
+                    return
+
+            trailing = len(chunk) - len(chunk.rstrip(b"\\"))
+            backslashes = trailing + (backslashes if trailing == len(chunk) else 0)
+            previous = (previous + chunk)[-256:]
+            offset += len(chunk)
+    raise KeyError(key)
+
+
+def require_numpy(feature):
+    """Fail with a clear message when a vectorized feature is used without NumPy"""
+    if np is None:
+        raise RuntimeError(f"{feature} requires NumPy (pip install numpy)")
+
+
+CSV_FIELDS = [
+    "timestamp",
+    "end_timestamp",
+    "date",
+    "time",
+    "record_type",
+    "activity_type",
+    "probability",
+    "start_latitude",
+    "start_longitude",
+    "end_latitude",
+    "end_longitude",
+    "distance_meters",
+    "duration_seconds",
+    "place_id",
+    "semantic_type",
+]
+
+METERS_PER_DEGREE = math.pi * EARTH_RADIUS_METERS / 180
+SPATIAL_CELL_METERS = 250  # grid cell edge of the spatial index
+PLACE_RADIUS_METERS = 100  # visits closer than this belong to the same place
+SIMPLIFY_TOLERANCE_METERS = 10  # allowed deviation of dropped track points
+STAY_RADIUS_METERS = 200  # fixes within this distance of their centroid form a stay
+STAY_MIN_DWELL_SECONDS = 20 * 60
+STAY_MAX_GAP_SECONDS = 60 * 60  # a longer silence between fixes ends a stay
+ERROR_SAMPLES = 5  # error messages kept per segment type
+WIFI_FIX_GAP_SECONDS = 120  # a wifi scan takes the location of a fix this close in time
+HEATMAP_ZOOM_LEVELS = range(4, 15)
+HEATMAP_MAX_DWELL_SECONDS = 10 * 60  # dwell credited to a fix at most (longer gaps are missing data)
+TILE_SIZE = 256
+MAX_MERCATOR_LATITUDE = 85.05112878
+
+EXPORT_CHUNK_ROWS = 65536  # rows formatted per column batch when exporting
+EXPORT_BUFFER_BYTES = 4 << 20
+
+SQLITE_BATCH_ROWS = 50000
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS records (
+    id INTEGER PRIMARY KEY,
+    timestamp_ns INTEGER NOT NULL,
+    end_timestamp_ns INTEGER NOT NULL,
+    utc_offset_minutes INTEGER NOT NULL,
+    local_date TEXT NOT NULL,
+    local_time TEXT NOT NULL,
+    record_type TEXT NOT NULL,
+    activity_type TEXT,
+    probability REAL,
+    start_latitude REAL,
+    start_longitude REAL,
+    end_latitude REAL,
+    end_longitude REAL,
+    distance_meters REAL,
+    duration_seconds REAL,
+    place_id TEXT,
+    semantic_type TEXT,
+    accuracy_meters REAL,
+    altitude_meters REAL,
+    speed_mps REAL,
+    source TEXT,
+    wifi_devices INTEGER,
+    strongest_signal REAL
+)
+"""
+SQLITE_IDENTITY = (
+    "timestamp_ns, end_timestamp_ns, record_type, ifnull(activity_type, ''), "
+    "ifnull(start_latitude, 999), ifnull(start_longitude, 999), ifnull(place_id, ''), ifnull(source, ''), "
+    "ifnull(probability, -1), ifnull(wifi_devices, -1), ifnull(strongest_signal, 999)"
+)
+# Location-less records (wifi scans, activity records) are told apart by their other fields
+SQLITE_IDENTITY_INDEX = f"CREATE UNIQUE INDEX records_identity ON records ({SQLITE_IDENTITY})"
+SQLITE_DELETE_REPEATS = f"DELETE FROM records WHERE id NOT IN (SELECT min(id) FROM records GROUP BY {SQLITE_IDENTITY})"
+SQLITE_INDEXED_COLUMNS = ("timestamp_ns", "record_type", "activity_type", "place_id")
+SQLITE_INSERT = (
+    "INSERT OR IGNORE INTO records (timestamp_ns, end_timestamp_ns, utc_offset_minutes, local_date, local_time, "
+    "record_type, activity_type, probability, start_latitude, start_longitude, end_latitude, end_longitude, "
+    "distance_meters, duration_seconds, place_id, semantic_type, accuracy_meters, altitude_meters, speed_mps, "
+    "source, wifi_devices, strongest_signal) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+)
+
+CACHE_MAGIC = b"TLRECS01"
+CACHE_ALIGNMENT = 8
+
+
+def column_typecode(column):
+    """Typecode of an array.array column or a memory-mapped memoryview column"""
+    return getattr(column, "typecode", None) or column.format
+
+
+def stable_argsort(column):
+    """Row order that sorts a column stably (a NumPy index array, or a list without NumPy)"""
+    if np is not None and len(column):
+        return np.argsort(np.frombuffer(column, dtype=column_typecode(column)), kind="stable")
+    return sorted(range(len(column)), key=column.__getitem__)
+
+
+def take(column, rows):
+    """New array of column[rows] for a NumPy index array or a sequence of row numbers"""
+    typecode = column_typecode(column)
+    taken = array(typecode)
+    if np is not None and len(column) and len(rows):
+        taken.frombytes(np.frombuffer(column, dtype=typecode)[np.asarray(rows, dtype=np.int64)].tobytes())
+    else:
+        taken.extend(map(column.__getitem__, rows))
+    return taken
+
+
+def extend_packed(column, values):
+    """Extend an array by a sequence of numbers in one struct.pack (struct.error for values of another type)"""
+    column.frombytes(struct.pack(f"{len(values)}{column.typecode}", *values))
+
+
+def _concatenated_ranges(starts, counts):
+    """NumPy indices of the ranges [start, start + count) laid end to end"""
+    ends = np.cumsum(counts)
+    return np.repeat(starts - ends + counts, counts) + np.arange(ends[-1] if len(ends) else 0)
+
+
+def source_fingerprint(file_path, content_hash=True):
+    """Identify an export by size, mtime and (optionally) a BLAKE2 hash of its bytes"""
+    stat = os.stat(file_path)
+    fingerprint = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+    if content_hash:
+        digest = hashlib.blake2b(digest_size=20)
+        with open(file_path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        fingerprint["hash"] = digest.hexdigest()
+    return fingerprint
+
+
+def open_text_output(path, compression=None):
+    """Open a UTF-8 text file for writing with a large buffer, optionally compressed"""
+    if compression == "gzip":
+        return gzip.open(path, "wt", encoding="utf-8", newline="", compresslevel=6)
+    if compression == "zstd":
+        try:
+            from compression import zstd  # Python 3.14+
+        except ImportError:
+            try:
+                import zstandard as zstd
+            except ImportError:
+                raise RuntimeError("zstd compression requires Python 3.14+ or the zstandard package") from None
+        return zstd.open(path, "wt", encoding="utf-8", newline="")
+    return open(path, "w", encoding="utf-8", newline="", buffering=EXPORT_BUFFER_BYTES)
+
+
+def write_column_file(path, columns, **header_fields):
+    """Write named typed arrays to a memory-mappable binary file"""
+    specs = []
+    offset = 0
+    for name, column in columns.items():
+        nbytes = len(column) * column.itemsize
+        specs.append({"name": name, "typecode": column_typecode(column), "offset": offset, "nbytes": nbytes})
+        offset += -(-nbytes // CACHE_ALIGNMENT) * CACHE_ALIGNMENT
+
+    header = json.dumps(dict(header_fields, byteorder=sys.byteorder, columns=specs)).encode("utf-8")
+    data_start = -(-(len(CACHE_MAGIC) + 8 + len(header)) // CACHE_ALIGNMENT) * CACHE_ALIGNMENT
+
+    # Write to a temporary file first so an interrupted run never leaves a torn file
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(CACHE_MAGIC)
+        f.write(len(header).to_bytes(8, "little"))
+        f.write(header)
+        for spec in specs:
+            f.seek(data_start + spec["offset"])
+            f.write(memoryview(columns[spec["name"]]).cast("B"))
+        f.truncate(data_start + offset)
+    os.replace(tmp_path, path)
+
+
+def read_column_header(path):
+    """Read only the JSON header of a column file (None if it is not one)"""
+    with open(path, "rb") as f:
+        if f.read(len(CACHE_MAGIC)) != CACHE_MAGIC:
+            return None
+        length = int.from_bytes(f.read(8), "little")
+        return json.loads(f.read(length))
+
+
+def read_column_file(path, writable=False):
+    """Open a column file; returns ({name: column}, header, mmap or None)"""
+    with open(path, "rb") as f:
+        if f.read(len(CACHE_MAGIC)) != CACHE_MAGIC:
+            raise ValueError(f"{path} is not a timeline column file")
+        length = int.from_bytes(f.read(8), "little")
+        header = json.loads(f.read(length))
+        data_start = -(-(len(CACHE_MAGIC) + 8 + length) // CACHE_ALIGNMENT) * CACHE_ALIGNMENT
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.fstat(f.fileno()).st_size else b""
+
+    columns = {}
+    copy = writable or header["byteorder"] != sys.byteorder
+    for spec in header["columns"]:
+        start = data_start + spec["offset"]
+        view = memoryview(buffer)[start:start + spec["nbytes"]].cast(spec["typecode"])
+        if copy:
+            column = array(spec["typecode"], view)
+            if header["byteorder"] != sys.byteorder:
+                column.byteswap()
+            view.release()
+        else:
+            column = view
+        columns[spec["name"]] = column
+
+    if copy and isinstance(buffer, mmap.mmap):
+        buffer.close()
+        buffer = None
+    return columns, header, buffer or None
+
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+MISSING = float("nan")
+
+DECODE_BATCH_SEGMENTS = 4096  # segments whose strings are decoded together
+MERGE_CHUNK_ROWS = 65536  # rows read and appended per step when merging record files
+DECODE_NUMPY_MIN = 256  # smaller batches are decoded row by row
+EPOCH_ORDINAL = EPOCH.toordinal()
+
+
+def decode_timestamp(text):
+    """(epoch ns, UTC offset minutes) of an ISO 8601 time like 2024-01-01T07:06:56.857+01:00 (ValueError if malformed)"""
+    dt = datetime.fromisoformat(text.replace("Z", "+00:00") if text[-1:] == "Z" else text)
+    offset = dt.utcoffset()
+    minutes = 0 if offset is None else offset.days * 1440 + offset.seconds // 60
+    seconds = (dt.toordinal() - EPOCH_ORDINAL) * 86400 + dt.hour * 3600 + dt.minute * 60 + dt.second - minutes * 60
+    return seconds * 1_000_000_000 + dt.microsecond * 1000, minutes
+
+
+def decode_timestamps(texts):
+    """Decode many timestamps at once: {text: (epoch ns, UTC offset minutes)}, malformed ones left out"""
+    unique = list(dict.fromkeys(texts))
+    decoded = {}
+    rest = unique
+    if np is not None and len(unique) >= DECODE_NUMPY_MIN:
+        rest = []
+        groups = defaultdict(list)
+        for text in unique:
+            groups[len(text)].append(text)
+        for length, group in groups.items():
+            if length < 19 or length > 40 or len(group) < DECODE_NUMPY_MIN:
+                rest.extend(group)
+                continue
+            ok, ns, offsets = _decode_timestamp_matrix(group, length)
+            decoded.update(zip(
+                (text for text, good in zip(group, ok.tolist()) if good),
+                zip(ns[ok].tolist(), offsets[ok].tolist()),
+            ))
+            rest.extend(text for text, good in zip(group, ok.tolist()) if not good)
+
+    for text in rest:
+        try:
+            decoded[text] = decode_timestamp(text)
+        except (ValueError, IndexError):
+            pass
+    return decoded
+
+
+def _decode_timestamp_matrix(group, length):
+    """Vectorized decode of same-length timestamps laid out like group[0]: (rows that fit, epoch ns, UTC offset minutes)"""
+    sample = group[0]
+    body, zone = length, None
+    if sample.endswith("Z"):
+        body, zone = length - 1, "Z"
+    elif length >= 25 and sample[length - 6] in "+-" and sample[length - 3] == ":":
+        body, zone = length - 6, "offset"
+    digits = body - 20 if body > 20 and sample[19] == "." else 0
+
+    chars = np.array(group).view(np.uint32).reshape(len(group), length).astype(np.int64)
+    separators = {4: "-", 7: "-", 10: "T", 13: ":", 16: ":"}
+    if digits:
+        separators[19] = "."
+    if zone == "Z":
+        separators[length - 1] = "Z"
+    elif zone:
+        separators[length - 3] = ":"
+    digit_columns = [k for k in range(body) if k not in separators]
+    if zone == "offset":
+        digit_columns += [length - 5, length - 4, length - 2, length - 1]
+
+    values = chars - ord("0")
+    ok = ((values[:, digit_columns] >= 0) & (values[:, digit_columns] <= 9)).all(axis=1)
+    for k, char in separators.items():
+        ok &= chars[:, k] == ord(char)
+    if body != 19 + (digits + 1 if digits else 0):
+        ok[:] = False
+
+    def number(start, stop):
+        result = np.zeros(len(group), dtype=np.int64)
+        for k in range(start, stop):
+            result = result * 10 + values[:, k]
+        return result
+
+    year, month, day = number(0, 4), number(5, 7), number(8, 10)
+    hour, minute, second = number(11, 13), number(14, 16), number(17, 19)
+    leap = (year % 4 == 0) & ((year % 100 != 0) | (year % 400 == 0))
+    month_days = np.array([0, 31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31])[np.clip(month, 0, 12)] + (leap & (month == 2))
+    ok &= (year >= 1) & (month >= 1) & (month <= 12) & (day >= 1) & (day <= month_days)
+    ok &= (hour < 24) & (minute < 60) & (second < 60)
+
+    micros = np.zeros(len(group), dtype=np.int64)
+    if digits:
+        micros = number(20, 20 + min(digits, 6)) * 10 ** (6 - min(digits, 6))
+    offsets = np.zeros(len(group), dtype=np.int64)
+    if zone == "offset":
+        sign = np.where(chars[:, length - 6] == ord("-"), -1, 1)
+        ok &= (chars[:, length - 6] == ord("+")) | (chars[:, length - 6] == ord("-"))
+        offsets = sign * (number(length - 5, length - 3) * 60 + number(length - 2, length))
+
+    # Days since the epoch from the civil date (proleptic Gregorian)
+    shifted = year - (month <= 2)
+    era = np.floor_divide(shifted, 400)
+    year_of_era = shifted - era * 400
+    day_of_year = (153 * (month + np.where(month > 2, -3, 9)) + 2) // 5 + day - 1
+    days = era * 146097 + year_of_era * 365 + year_of_era // 4 - year_of_era // 100 + day_of_year - 719468
+    seconds = days * 86400 + hour * 3600 + minute * 60 + second - offsets * 60
+    return ok, seconds * 1_000_000_000 + micros * 1000, offsets
+
+
+def decode_latlngs(texts):
+    """Decode many LatLng strings ('52.0187241°, 8.5751769°') at once: {text: (lat, lng)}, malformed ones left out"""
+    unique = list(dict.fromkeys(texts))
+    if all(text.count(",") == 1 for text in unique):
+        try:
+            values = array("d", map(float, ",".join(unique).replace("°", "").split(",")))
+            return dict(zip(unique, zip(values[0::2], values[1::2])))
+        except ValueError:
+            pass
+
+    decoded = {}
+    for text in unique:
+        parts = text.replace("°", "").split(",")
+        if len(parts) == 2:
+            try:
+                decoded[text] = (float(parts[0]), float(parts[1]))
+            except ValueError:
+                pass
+    return decoded
+
+
+class RecordStore:
+    """Columnar, array-backed container for parsed timeline records"""
+
+    INT_COLUMNS = {
+        "segment_index": "q",
+        "timestamp": "q",
+        "end_timestamp": "q",
+        "utc_offset": "h",
+        "end_utc_offset": "h",
+        "wifi_devices": "i",
+        "track_points": "i",
+        "wifi_offset": "q",
+    }
+    FLOAT_COLUMNS = (
+        "probability",
+        "start_latitude",
+        "start_longitude",
+        "end_latitude",
+        "end_longitude",
+        "distance_meters",
+        "duration_seconds",
+        "accuracy_meters",
+        "altitude_meters",
+        "speed_mps",
+        "strongest_signal",
+        "reported_distance_meters",
+    )
+    STRING_COLUMNS = ("record_type", "activity_type", "place_id", "semantic_type", "source")
+    # Access points seen by wifi scans, shared by all rows: a scan's devices are
+    # wifi_devices entries starting at its wifi_offset (BSSIDs dictionary-encoded)
+    DEVICE_COLUMNS = {"wifi_bssid": "i", "wifi_rssi": "b"}
+
+    # Fields present in the row dicts of every record, in CSV order
+    BASE_FIELDS = (
+        "segment_index",
+        "timestamp",
+        "end_timestamp",
+        "record_type",
+        "activity_type",
+        "probability",
+        "start_latitude",
+        "start_longitude",
+        "end_latitude",
+        "end_longitude",
+        "distance_meters",
+        "duration_seconds",
+        "place_id",
+        "semantic_type",
+    )
+    EXTRA_FIELDS = {
+        "position": ("accuracy_meters", "altitude_meters", "source", "speed_mps"),
+        "wifi_scan": ("wifi_devices", "strongest_signal"),
+        "activity": ("reported_distance_meters", "track_points"),
+    }
+
+    _ONE_MICROSECOND = timedelta(microseconds=1)
+    _timezones = {}
+
+    def __init__(self):
+        for name, typecode in self.INT_COLUMNS.items():
+            setattr(self, name, array(typecode))
+        for name in self.FLOAT_COLUMNS:
+            setattr(self, name, array("d"))
+        for name in self.STRING_COLUMNS:
+            setattr(self, name, array("i"))
+        for name, typecode in self.DEVICE_COLUMNS.items():
+            setattr(self, name, array(typecode))
+        self.strings = {name: [] for name in self.STRING_COLUMNS + ("bssid",)}
+        self._codes = {name: {} for name in self.STRING_COLUMNS + ("bssid",)}
+        self._mmap = None
+        self.metadata = {}
+
+    def __len__(self):
+        return len(self.timestamp)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.row(i)
+
+    def __getitem__(self, i):
+        return self.row(i)
+
+    @classmethod
+    def column_names(cls):
+        return list(cls.INT_COLUMNS) + list(cls.FLOAT_COLUMNS) + list(cls.STRING_COLUMNS)
+
+    def encode(self, column, value):
+        """Return the dictionary code of a string value (-1 for None)"""
+        if value is None:
+            return -1
+        codes = self._codes[column]
+        code = codes.get(value)
+        if code is None:
+            code = codes[value] = len(self.strings[column])
+            self.strings[column].append(value)
+        return code
+
+    def lookup(self, column, value):
+        """Return the code of an existing string value, or None if it never occurs"""
+        return self._codes[column].get(value)
+
+    def dictionary(self, column):
+        """Return the code -> string lookup of a dictionary-encoded column"""
+        return self.strings[column]
+
+    @staticmethod
+    def to_epoch_ns(dt):
+        """Split an aware datetime into (epoch nanoseconds, UTC offset in minutes)"""
+        if dt.tzinfo is None:
+            dt = dt.replace(tzinfo=timezone.utc)
+        offset = dt.utcoffset()
+        return (dt - EPOCH) // RecordStore._ONE_MICROSECOND * 1000, int(offset.total_seconds() // 60)
+
+    @classmethod
+    def to_datetime(cls, epoch_ns, offset_minutes):
+        """Rebuild the aware datetime from epoch nanoseconds and UTC offset"""
+        tz = cls._timezones.get(offset_minutes)
+        if tz is None:
+            tz = cls._timezones[offset_minutes] = timezone(timedelta(minutes=offset_minutes))
+        return (EPOCH + timedelta(microseconds=epoch_ns // 1000)).astimezone(tz)
+
+    # Field order of the row tuples extend_rows() takes; trailing fields may be left out
+    ROW_FIELDS = BASE_FIELDS + (
+        "accuracy_meters",
+        "altitude_meters",
+        "source",
+        "speed_mps",
+        "wifi_devices",
+        "strongest_signal",
+        "track_points",
+        "reported_distance_meters",
+        "devices",
+    )
+
+    def append(
+        self,
+        segment_index,
+        timestamp,
+        end_timestamp,
+        record_type,
+        activity_type,
+        probability=None,
+        start_latitude=None,
+        start_longitude=None,
+        end_latitude=None,
+        end_longitude=None,
+        distance_meters=None,
+        duration_seconds=None,
+        place_id=None,
+        semantic_type=None,
+        accuracy_meters=None,
+        altitude_meters=None,
+        source=None,
+        speed_mps=None,
+        wifi_devices=None,
+        strongest_signal=None,
+        track_points=None,
+        reported_distance_meters=None,
+        devices=None,
+    ):
+        """Append one record; missing values None, timestamps as datetimes or decode_timestamp pairs"""
+        if type(timestamp) is not tuple:
+            timestamp = self.to_epoch_ns(timestamp)
+        if type(end_timestamp) is not tuple:
+            end_timestamp = self.to_epoch_ns(end_timestamp)
+        self.extend_rows([(
+            segment_index, timestamp, end_timestamp, record_type, activity_type, probability,
+            start_latitude, start_longitude, end_latitude, end_longitude, distance_meters, duration_seconds,
+            place_id, semantic_type, accuracy_meters, altitude_meters, source, speed_mps,
+            wifi_devices, strongest_signal, track_points, reported_distance_meters, devices,
+        )])
+
+    def extend_rows(self, rows):
+        """Append ROW_FIELDS tuples (timestamps as decode_timestamp pairs, a scan's devicesRecords last), one extend per column"""
+        if not rows:
+            return
+        columns = list(zip_longest(*rows))
+        columns += [(None,) * len(rows)] * (len(self.ROW_FIELDS) - len(columns))
+        columns = dict(zip(self.ROW_FIELDS, columns))
+        length, device_length = len(self.timestamp), len(self.wifi_bssid)
+        try:
+            extend_packed(self.segment_index, columns["segment_index"])
+            for name, offset_name in (("timestamp", "utc_offset"), ("end_timestamp", "end_utc_offset")):
+                stamps, offsets = zip(*columns[name])
+                extend_packed(getattr(self, name), stamps)
+                extend_packed(getattr(self, offset_name), offsets)
+            for name in ("wifi_devices", "track_points"):
+                extend_packed(getattr(self, name), [-1 if value is None else value for value in columns[name]])
+            for name in self.FLOAT_COLUMNS:
+                extend_packed(getattr(self, name), [MISSING if value is None else value for value in columns[name]])
+            for name in self.STRING_COLUMNS:
+                values = columns[name]
+                codes = {value: self.encode(name, value) for value in dict.fromkeys(values)}
+                extend_packed(getattr(self, name), [codes[value] for value in values])
+            self._extend_devices(columns["devices"])
+        except BaseException:
+            # A value the columns reject must not leave them with different lengths
+            for name in self.column_names():
+                del getattr(self, name)[length:]
+            del self.wifi_bssid[device_length:]
+            del self.wifi_rssi[device_length:]
+            raise
+
+    def _extend_devices(self, scans):
+        """Store the devicesRecords of wifi scans (None for other rows) and extend wifi_offset"""
+        offset = len(self.wifi_bssid)
+        offsets, macs, rssis = [], [], []
+        for devices in scans:
+            if devices is None:
+                offsets.append(-1)
+                continue
+            offsets.append(offset)
+            offset += len(devices)
+            macs += [device.get("mac") for device in devices]
+            rssis += [min(max(int(device.get("rawRssi", -100)), -128), 127) for device in devices]
+        codes = {mac: self.encode("bssid", mac) for mac in dict.fromkeys(macs)}
+        extend_packed(self.wifi_bssid, [codes[mac] for mac in macs])
+        extend_packed(self.wifi_rssi, rssis)
+        extend_packed(self.wifi_offset, offsets)
+
+    def wifi_devices_at(self, i):
+        """[(bssid code, rssi)] of the wifi scan in row i (empty for other records)"""
+        offset = self.wifi_offset[i]
+        if offset < 0:
+            return []
+        stop = offset + self.wifi_devices[i]
+        return list(zip(self.wifi_bssid[offset:stop], self.wifi_rssi[offset:stop]))
+
+    def sort(self):
+        """Stable sort of all columns by start timestamp"""
+        timestamps = self.timestamp
+        if all(map(operator.le, timestamps, islice(timestamps, 1, None))):
+            return
+        order = stable_argsort(timestamps)
+        for name in self.column_names():
+            setattr(self, name, take(getattr(self, name), order))
+
+    @classmethod
+    def merge(cls, stores, dedupe=False, chunk_rows=MERGE_CHUNK_ROWS):
+        """Stable merge of stores sorted by timestamp; dedupe=True drops records repeating an earlier dedupe_key"""
+        if np is None:
+            return cls._merge_streams(stores, dedupe, chunk_rows)
+        # Only the timestamps are concatenated to find the order; rows go straight into the output, a chunk at a time
+        bounds = np.cumsum([0] + [len(store) for store in stores])
+        timestamps = np.concatenate([store.numpy("timestamp") for store in stores] + [np.empty(0, dtype=np.int64)])
+        order = np.argsort(timestamps, kind="stable")
+        numbers = np.searchsorted(bounds, order, side="right") - 1
+        rows = order - bounds[numbers]
+        if dedupe:
+            keep = cls._first_occurrences(stores, timestamps[order], numbers, rows)
+            numbers, rows = numbers[keep], rows[keep]
+        del timestamps, order
+
+        merged = cls()
+        remaps = [merged._string_remaps(store) for store in stores]
+        for lo in range(0, len(rows), chunk_rows):
+            merged._extend_picked(stores, remaps, numbers[lo:lo + chunk_rows], rows[lo:lo + chunk_rows])
+        return merged
+
+    @staticmethod
+    def _first_occurrences(stores, timestamps, numbers, rows):
+        """Mask of the picks (in timestamp order) whose dedupe_key did not occur earlier"""
+        keep = np.ones(len(rows), dtype=bool)
+        previous, keys = None, None
+        # Duplicates share a start time: compare keys within runs of equal timestamps only
+        for j in (np.flatnonzero(timestamps[1:] == timestamps[:-1]) + 1).tolist():
+            if j - 1 != previous:
+                keys = {stores[numbers[j - 1]].dedupe_key(int(rows[j - 1]))}
+            key = stores[numbers[j]].dedupe_key(int(rows[j]))
+            if key in keys:
+                keep[j] = False
+            else:
+                keys.add(key)
+            previous = j
+        return keep
+
+    @classmethod
+    def merge_files(cls, paths, dedupe=False, chunk_rows=MERGE_CHUNK_ROWS):
+        """merge() of saved stores, streamed: a k-way merge over the memory-mapped files, appended chunk by chunk"""
+        return cls._merge_streams([cls.load(path) for path in paths], dedupe, chunk_rows)
+
+    @classmethod
+    def _merge_streams(cls, stores, dedupe, chunk_rows):
+        """merge() as a k-way heapq.merge of the stores' timestamp columns, read and appended chunk by chunk"""
+        merged = cls()
+        remaps = [merged._string_remaps(store) for store in stores]
+
+        numbers, rows, previous, first, keys = array("q"), array("q"), None, None, None
+        for timestamp, n, i in heapq.merge(*(store._timestamp_keys(n, chunk_rows) for n, store in enumerate(stores))):
+            if timestamp != previous:
+                previous, first, keys = timestamp, (n, i), None
+            elif dedupe:
+                # Duplicates share a start time: compare keys within the current run only
+                if keys is None:
+                    keys = {stores[first[0]].dedupe_key(first[1])}
+                key = stores[n].dedupe_key(i)
+                if key in keys:
+                    continue
+                keys.add(key)
+            numbers.append(n)
+            rows.append(i)
+            if len(rows) == chunk_rows:
+                merged._extend_picked(stores, remaps, numbers, rows)
+                numbers, rows = array("q"), array("q")
+        merged._extend_picked(stores, remaps, numbers, rows)
+        return merged
+
+    def _timestamp_keys(self, number, chunk_rows):
+        """(timestamp, store number, row) of every row, reading the timestamp column a chunk at a time"""
+        for lo in range(0, len(self), chunk_rows):
+            timestamps = self.timestamp[lo:lo + chunk_rows].tolist()
+            yield from zip(timestamps, repeat(number), range(lo, lo + len(timestamps)))
+
+    def _string_remaps(self, other):
+        """Per dictionary of another store, the array mapping its codes to ours (-1 stays -1)"""
+        return {
+            name: array("i", [self.encode(name, value) for value in other.strings[name]] + [-1])
+            for name in self.STRING_COLUMNS + ("bssid",)
+        }
+
+    def _extend_picked(self, stores, remaps, numbers, rows):
+        """Append rows[j] of stores[numbers[j]] for every j, re-encoding strings and copying device lists"""
+        if not len(rows):
+            return
+        if np is None:
+            return self._extend_picked_rows(stores, remaps, numbers, rows)
+        numbers, rows = np.frombuffer(numbers, dtype=np.int64), np.frombuffer(rows, dtype=np.int64)
+        parts = [(n, np.flatnonzero(numbers == n)) for n in range(len(stores))]
+        parts = [(stores[n], remaps[n], positions, rows[positions]) for n, positions in parts if len(positions)]
+        for name in self.column_names():
+            values = np.empty(len(rows), dtype=column_typecode(getattr(self, name)))
+            for store, remap, positions, taken in parts:
+                values[positions] = store.numpy(name)[taken]
+                if name in remap:
+                    values[positions] = np.frombuffer(remap[name], dtype=np.int32)[values[positions]]
+            if name == "wifi_offset":
+                offsets = values
+            else:
+                getattr(self, name).frombytes(values.tobytes())
+            if name == "wifi_devices":
+                devices = values
+
+        # Copy the device lists of the picked scans only, laid out in pick order
+        counts = np.where(offsets >= 0, devices, 0)
+        starts = len(self.wifi_bssid) + np.cumsum(counts) - counts
+        bssids = np.empty(int(counts.sum()), dtype=np.int32)
+        rssis = np.empty(len(bssids), dtype=np.int8)
+        for store, remap, positions, _ in parts:
+            source = _concatenated_ranges(offsets[positions], counts[positions])
+            target = _concatenated_ranges(starts[positions] - len(self.wifi_bssid), counts[positions])
+            bssids[target] = np.frombuffer(remap["bssid"], dtype=np.int32)[store.numpy("wifi_bssid")[source]]
+            rssis[target] = store.numpy("wifi_rssi")[source]
+        self.wifi_bssid.frombytes(bssids.tobytes())
+        self.wifi_rssi.frombytes(rssis.tobytes())
+        self.wifi_offset.frombytes(np.where(offsets >= 0, starts, -1).astype(np.int64).tobytes())
+
+    def _extend_picked_rows(self, stores, remaps, numbers, rows):
+        """_extend_picked without NumPy"""
+        picks = list(zip(numbers, rows))
+        for name in self.column_names():
+            if name in self.STRING_COLUMNS:
+                getattr(self, name).extend([remaps[n][name][getattr(stores[n], name)[i]] for n, i in picks])
+            elif name != "wifi_offset":
+                getattr(self, name).extend([getattr(stores[n], name)[i] for n, i in picks])
+        for n, i in picks:
+            store = stores[n]
+            offset = store.wifi_offset[i]
+            if offset < 0:
+                self.wifi_offset.append(-1)
+                continue
+            self.wifi_offset.append(len(self.wifi_bssid))
+            stop = offset + store.wifi_devices[i]
+            self.wifi_bssid.extend(take(remaps[n]["bssid"], store.wifi_bssid[offset:stop]))
+            self.wifi_rssi.extend(store.wifi_rssi[offset:stop])
+
+    def save(self, path, **metadata):
+        """Write all columns to a memory-mappable record file (see write_column_file)"""
+        columns = {name: getattr(self, name) for name in self.column_names() + list(self.DEVICE_COLUMNS)}
+        write_column_file(path, columns, kind="records", strings=self.strings, metadata=metadata)
+
+    @classmethod
+    def read_header(cls, path):
+        """Read only the JSON header of a saved store (None if not a record file)"""
+        return read_column_header(path)
+
+    @classmethod
+    def load(cls, path, writable=False):
+        """Load a store written by save(), as read-only memory-mapped columns unless writable"""
+        columns, header, buffer = read_column_file(path, writable)
+        store = cls()
+        for name, column in columns.items():
+            setattr(store, name, column)
+
+        # Files written before a column existed get it filled with "missing"
+        length = len(columns.get("timestamp", ()))
+        for name in cls.column_names():
+            if name not in columns:
+                missing = MISSING if name in cls.FLOAT_COLUMNS else -1
+                setattr(store, name, array(column_typecode(getattr(store, name)), [missing]) * length)
+
+        store.strings = dict({"bssid": []}, **header["strings"])
+        store._codes = {name: {value: code for code, value in enumerate(values)} for name, values in store.strings.items()}
+        store._mmap = buffer
+        store.metadata = header["metadata"]
+        return store
+
+    def extend(self, other, rows=None):
+        """Append rows of another store (all rows by default), re-encoding its strings"""
+        rows = range(len(other)) if rows is None else rows
+        for name in list(self.INT_COLUMNS) + list(self.FLOAT_COLUMNS):
+            if name != "wifi_offset":
+                column = getattr(other, name)
+                getattr(self, name).extend(column[i] for i in rows)
+        for name in self.STRING_COLUMNS:
+            column = getattr(other, name)
+            remap = [self.encode(name, value) for value in other.strings[name]] + [-1]
+            getattr(self, name).extend(remap[column[i]] for i in rows)
+
+        # Copy the device lists of the appended scans only
+        remap = [self.encode("bssid", value) for value in other.strings["bssid"]] + [-1]
+        for i in rows:
+            offset = other.wifi_offset[i]
+            if offset < 0:
+                self.wifi_offset.append(-1)
+                continue
+            self.wifi_offset.append(len(self.wifi_bssid))
+            stop = offset + other.wifi_devices[i]
+            self.wifi_bssid.extend(remap[code] for code in other.wifi_bssid[offset:stop])
+            self.wifi_rssi.extend(other.wifi_rssi[offset:stop])
+
+    def slice(self, start, stop):
+        """Zero-copy, read-only view of rows [start, stop) sharing this store's buffers"""
+        view = RecordStore.__new__(RecordStore)
+        for name in self.column_names():
+            setattr(view, name, memoryview(getattr(self, name))[start:stop])
+        for name in self.DEVICE_COLUMNS:
+            setattr(view, name, getattr(self, name))
+        view.strings = self.strings
+        view._codes = self._codes
+        view._mmap = self._mmap
+        view.metadata = {}
+        return view
+
+    def select(self, rows):
+        """Copy the given rows into a new store that shares the string dictionaries"""
+        selection = RecordStore.__new__(RecordStore)
+        for name in self.column_names():
+            setattr(selection, name, take(getattr(self, name), rows))
+        for name in self.DEVICE_COLUMNS:
+            setattr(selection, name, getattr(self, name))
+        selection.strings = self.strings
+        selection._codes = self._codes
+        selection._mmap = None
+        selection.metadata = {}
+        return selection
+
+    def time_range(self, start=None, end=None):
+        """Row bounds [lo, hi) of records starting in [start, end): datetimes, ISO strings or epoch ns, None open"""
+        lo = 0 if start is None else bisect_left(self.timestamp, to_epoch_bound(start))
+        hi = len(self) if end is None else bisect_left(self.timestamp, to_epoch_bound(end), lo)
+        return lo, hi
+
+    def truncate(self, start, stop):
+        """Keep only rows [start, stop), in place"""
+        if start == 0 and stop == len(self):
+            return
+        for name in self.column_names():
+            column = getattr(self, name)
+            del column[stop:]
+            del column[:start]
+
+    def records_between(self, start=None, end=None, types=None):
+        """Records starting in [start, end), optionally limited to some record types"""
+        lo, hi = self.time_range(start, end)
+        if not types:
+            return self.slice(lo, hi)
+
+        codes = {self.lookup("record_type", t) for t in types} - {None}
+        record_type = self.record_type
+        return self.select([i for i in range(lo, hi) if record_type[i] in codes])
+
+    def dedupe_key(self, i):
+        """Identity of a record across overlapping exports: (start, end, type, location)"""
+        return (
+            self.timestamp[i],
+            self.end_timestamp[i],
+            self.strings["record_type"][self.record_type[i]],
+            self.strings["activity_type"][self.activity_type[i]],
+            round(self.start_latitude[i], 6) if self.start_latitude[i] == self.start_latitude[i] else None,
+            round(self.start_longitude[i], 6) if self.start_longitude[i] == self.start_longitude[i] else None,
+        )
+
+    def months(self, start=0, stop=None):
+        """Yield (i, 'YYYY-MM') with the local calendar month of every record"""
+        month_by_day = {}
+        for i in range(start, len(self) if stop is None else stop):
+            day = (self.timestamp[i] // 1_000_000_000 + self.utc_offset[i] * 60) // 86400
+            month = month_by_day.get(day)
+            if month is None:
+                month = month_by_day[day] = self.datetime_at(i).strftime("%Y-%m")
+            yield i, month
+
+    def numpy(self, column):
+        """Zero-copy NumPy view of a column (do not append while views are alive)"""
+        require_numpy("RecordStore.numpy")
+        data = getattr(self, column)
+        typecode = column_typecode(data)
+        return np.frombuffer(data, dtype=typecode) if len(data) else np.empty(0, dtype=typecode)
+
+    def replace_column(self, column, values):
+        """Swap a column for a copy of values (a sequence or NumPy array), e.g. on a read-only store"""
+        data = getattr(self, column)
+        replacement = array(column_typecode(data))
+        if np is not None and isinstance(values, np.ndarray):
+            replacement.frombytes(np.ascontiguousarray(values, dtype=replacement.typecode).tobytes())
+        else:
+            replacement.extend(values)
+        setattr(self, column, replacement)
+
+    def type_counts(self):
+        """Return {record_type: count} in order of first appearance"""
+        names = self.strings["record_type"]
+        return {names[code]: count for code, count in Counter(self.record_type).items()}
+
+    def datetime_at(self, i):
+        return self.to_datetime(self.timestamp[i], self.utc_offset[i])
+
+    def local_date_times(self, start, stop):
+        """Local 'YYYY-MM-DD' dates and 'HH:MM:SS' times of rows [start, stop), straight from the epoch and offset columns"""
+        if np is not None and stop > start:
+            seconds = self.numpy("timestamp")[start:stop] // 1_000_000_000 \
+                + self.numpy("utc_offset")[start:stop].astype(np.int64) * 60
+            chars = np.datetime_as_string(seconds.astype("datetime64[s]")).astype("U19").view("U1").reshape(-1, 19)
+            dates = np.ascontiguousarray(chars[:, :10]).view("U10").ravel()
+            times = np.ascontiguousarray(chars[:, 11:]).view("U8").ravel()
+            return dates.tolist(), times.tolist()
+
+        day_strings = {}
+        dates, times = [], []
+        for ns, offset in zip(self.timestamp[start:stop], self.utc_offset[start:stop]):
+            day, second = divmod(ns // 1_000_000_000 + offset * 60, 86400)
+            date = day_strings.get(day)
+            if date is None:
+                date = day_strings[day] = (EPOCH + timedelta(days=day)).strftime("%Y-%m-%d")
+            dates.append(date)
+            times.append(f"{second // 3600:02d}:{second // 60 % 60:02d}:{second % 60:02d}")
+        return dates, times
+
+    def csv_columns(self, start, stop):
+        """Format rows [start, stop) as timeline.csv columns (lists of strings), matching csv_row()"""
+
+        def numbers(column, fmt):
+            # One %-format over the whole slice instead of a format call per value
+            values = getattr(self, column)[start:stop].tolist()
+            return ((fmt + "\n") * len(values) % tuple(values)).replace("nan", "").split("\n")[:-1]
+
+        def strings(column):
+            lookup = self.strings[column] + [""]
+            return [lookup[code] for code in getattr(self, column)[start:stop]]
+
+        stamps, dates, times = self._iso_columns("timestamp", "utc_offset", start, stop)
+        end_stamps, _, _ = self._iso_columns("end_timestamp", "end_utc_offset", start, stop)
+
+        return [
+            stamps,
+            end_stamps,
+            dates,
+            times,
+            strings("record_type"),
+            strings("activity_type"),
+            numbers("probability", "%.4f"),
+            numbers("start_latitude", "%.7f"),
+            numbers("start_longitude", "%.7f"),
+            numbers("end_latitude", "%.7f"),
+            numbers("end_longitude", "%.7f"),
+            numbers("distance_meters", "%.1f"),
+            numbers("duration_seconds", "%.0f"),
+            strings("place_id"),
+            strings("semantic_type"),
+        ]
+
+    def _iso_columns(self, timestamp_column, offset_column, start, stop):
+        """Local ISO timestamps (microseconds only when non-zero), dates and times of rows [start, stop)"""
+        offsets = getattr(self, offset_column)[start:stop]
+        zone_strings = {
+            offset: f"{'-' if offset < 0 else '+'}{abs(offset) // 60:02d}:{abs(offset) % 60:02d}"
+            for offset in set(offsets)
+        }
+        if np is None or stop <= start:
+            return self._iso_columns_rows(getattr(self, timestamp_column)[start:stop], offsets, zone_strings)
+
+        micros = self.numpy(timestamp_column)[start:stop] // 1000
+        local = micros + self.numpy(offset_column)[start:stop].astype(np.int64) * 60_000_000
+        chars = np.datetime_as_string(local.astype("datetime64[us]")).astype("U26").view("U1").reshape(-1, 26)
+        seconds = np.ascontiguousarray(chars[:, :19]).view("U19").ravel()
+        fractions = np.ascontiguousarray(chars).view("U26").ravel()
+        zones = np.array([zone_strings[offset] for offset in offsets], dtype="U6")
+        stamps = np.char.add(np.where(micros % 1_000_000 == 0, seconds, fractions), zones)
+        dates = np.ascontiguousarray(chars[:, :10]).view("U10").ravel()
+        times = np.ascontiguousarray(chars[:, 11:19]).view("U8").ravel()
+        return stamps.tolist(), dates.tolist(), times.tolist()
+
+    @staticmethod
+    def _iso_columns_rows(timestamps, offsets, zone_strings):
+        """_iso_columns without NumPy"""
+        day_strings = {}
+        stamps, dates, times = [], [], []
+        for ns, offset in zip(timestamps, offsets):
+            local_seconds, fraction = divmod(ns // 1000, 1_000_000)
+            day, second = divmod(local_seconds + offset * 60, 86400)
+            date = day_strings.get(day)
+            if date is None:
+                date = day_strings[day] = (EPOCH + timedelta(days=day)).strftime("%Y-%m-%d")
+            time = f"{second // 3600:02d}:{second // 60 % 60:02d}:{second % 60:02d}"
+            zone = zone_strings[offset]
+            stamps.append(f"{date}T{time}.{fraction:06d}{zone}" if fraction else f"{date}T{time}{zone}")
+            dates.append(date)
+            times.append(time)
+        return stamps, dates, times
+
+    def csv_row(self, i):
+        """Format record i as a timeline.csv row dict"""
+        timestamp = self.datetime_at(i)
+        end_timestamp = self.to_datetime(self.end_timestamp[i], self.end_utc_offset[i])
+
+        def number(column, fmt):
+            value = getattr(self, column)[i]
+            return format(value, fmt) if value == value else ""
+
+        def string(column):
+            code = getattr(self, column)[i]
+            return self.strings[column][code] if code >= 0 else ""
+
+        return {
+            "timestamp": timestamp.isoformat(),
+            "end_timestamp": end_timestamp.isoformat(),
+            "date": timestamp.strftime("%Y-%m-%d"),
+            "time": timestamp.strftime("%H:%M:%S"),
+            "record_type": string("record_type"),
+            "activity_type": string("activity_type"),
+            "probability": number("probability", ".4f"),
+            "start_latitude": number("start_latitude", ".7f"),
+            "start_longitude": number("start_longitude", ".7f"),
+            "end_latitude": number("end_latitude", ".7f"),
+            "end_longitude": number("end_longitude", ".7f"),
+            "distance_meters": number("distance_meters", ".1f"),
+            "duration_seconds": number("duration_seconds", ".0f"),
+            "place_id": string("place_id"),
+            "semantic_type": string("semantic_type"),
+        }
+
+    def row(self, i):
+        """Materialize record i as a dict in the classic record layout"""
+        record_type = self.strings["record_type"][self.record_type[i]]
+        fields = self.BASE_FIELDS + self.EXTRA_FIELDS.get(record_type, ())
+        record = {}
+
+        for name in fields:
+            if name == "timestamp":
+                value = self.datetime_at(i)
+            elif name == "end_timestamp":
+                value = self.to_datetime(self.end_timestamp[i], self.end_utc_offset[i])
+            elif name in self.strings:
+                code = getattr(self, name)[i]
+                value = self.strings[name][code] if code >= 0 else None
+            else:
+                value = getattr(self, name)[i]
+                if value != value or (name in ("wifi_devices", "track_points") and value < 0):
+                    value = None
+            record[name] = value
+
+        return record
+
+
+class SpatialIndex:
+    """Uniform grid index over the start and end coordinates of a RecordStore"""
+
+    COLUMNS = ("cells", "offsets", "rows", "latitudes", "longitudes")
+
+    def __init__(self, cell_meters=SPATIAL_CELL_METERS):
+        self.cell_meters = cell_meters
+        self.cell_degrees = cell_meters / METERS_PER_DEGREE
+        self.grid_columns = int(360 / self.cell_degrees) + 2
+        self.cells = array("q")
+        self.offsets = array("q", [0])
+        self.rows = array("q")
+        self.latitudes = array("d")
+        self.longitudes = array("d")
+        self.records = None
+        self.metadata = {}
+
+    def _cell(self, lat, lng):
+        return int((lat + 90) // self.cell_degrees), int((lng + 180) // self.cell_degrees)
+
+    @classmethod
+    def build(cls, records, cell_meters=SPATIAL_CELL_METERS):
+        """Index every valid start point and every distinct end point"""
+        rows, latitudes, longitudes = array("q"), array("d"), array("d")
+        for i in range(len(records)):
+            lat, lng = records.start_latitude[i], records.start_longitude[i]
+            if lat == lat and lng == lng:
+                rows.append(i)
+                latitudes.append(lat)
+                longitudes.append(lng)
+            end_lat, end_lng = records.end_latitude[i], records.end_longitude[i]
+            if end_lat == end_lat and end_lng == end_lng and (end_lat != lat or end_lng != lng):
+                rows.append(i)
+                latitudes.append(end_lat)
+                longitudes.append(end_lng)
+
+        index = cls.from_points(latitudes, longitudes, rows, cell_meters)
+        index.records = records
+        return index
+
+    @classmethod
+    def from_points(cls, latitudes, longitudes, rows=None, cell_meters=SPATIAL_CELL_METERS):
+        """Index bare coordinates; rows are the ids reported by queries (default: position)"""
+        index = cls(cell_meters)
+        rows = array("q", range(len(latitudes)) if rows is None else rows)
+        keys = array("q")
+        for lat, lng in zip(latitudes, longitudes):
+            row, col = index._cell(lat, lng)
+            keys.append(row * index.grid_columns + col)
+
+        order = sorted(range(len(keys)), key=keys.__getitem__)
+        index.rows = array("q", map(rows.__getitem__, order))
+        index.latitudes = array("d", map(latitudes.__getitem__, order))
+        index.longitudes = array("d", map(longitudes.__getitem__, order))
+
+        index.offsets = array("q")
+        previous = None
+        for position, key in enumerate(map(keys.__getitem__, order)):
+            if key != previous:
+                index.cells.append(key)
+                index.offsets.append(position)
+                previous = key
+        index.offsets.append(len(order))
+        return index
+
+    def save(self, path, **metadata):
+        """Persist the index next to its records (same column file format)"""
+        columns = {name: getattr(self, name) for name in self.COLUMNS}
+        write_column_file(path, columns, kind="spatial", cell_meters=self.cell_meters, metadata=metadata)
+
+    @classmethod
+    def load(cls, path, records=None):
+        columns, header, buffer = read_column_file(path)
+        index = cls(header["cell_meters"])
+        for name, column in columns.items():
+            setattr(index, name, column)
+        index._mmap = buffer
+        index.records = records
+        index.metadata = header["metadata"]
+        return index
+
+    def _type_filter(self, types):
+        if not types:
+            return None
+        codes = {self.records.lookup("record_type", t) for t in types}
+        return codes - {None}
+
+    def _candidates(self, south, west, north, east):
+        """Yield point positions of all cells intersecting the bounding box (west > east crosses the antimeridian)"""
+        row_start, row_end = self._cell(max(south, -90.0), 0.0)[0], self._cell(min(north, 90.0), 0.0)[0]
+        for west, east in self._longitude_spans(west, east):
+            col_start, col_end = self._cell(0.0, west)[1], self._cell(0.0, east)[1]
+            for row in range(row_start, row_end + 1):
+                base = row * self.grid_columns
+                lo = bisect_left(self.cells, base + col_start)
+                hi = bisect_right(self.cells, base + col_end)
+                if lo < hi:
+                    yield from range(self.offsets[lo], self.offsets[hi])
+
+    @staticmethod
+    def _longitude_spans(west, east):
+        """The [west, east] ranges within -180..180 that cover a longitude interval, split at the antimeridian"""
+        if west <= east and east - west >= 360.0:
+            return [(-180.0, 180.0)]
+        west, east = (west + 180.0) % 360.0 - 180.0, (east + 180.0) % 360.0 - 180.0
+        return [(west, east)] if west <= east else [(west, 180.0), (-180.0, east)]
+
+    def within_radius(self, lat, lng, radius_meters, types=None):
+        """Records with a start or end point within radius: sorted [(row, meters)]"""
+        codes = self._type_filter(types)
+        dlat = radius_meters / METERS_PER_DEGREE
+        max_lat = min(abs(lat) + dlat, 90.0)
+        cos_lat = math.cos(math.radians(max_lat))
+        dlng = 180.0 if cos_lat < 1e-9 else min(radius_meters / (METERS_PER_DEGREE * cos_lat), 180.0)
+
+        best = {}
+        lat_rad, cos_query = math.radians(lat), math.cos(math.radians(lat))
+        for p in self._candidates(lat - dlat, lng - dlng, lat + dlat, lng + dlng):
+            row = self.rows[p]
+            if codes is not None and self.records.record_type[row] not in codes:
+                continue
+            plat = math.radians(self.latitudes[p])
+            a = (math.sin((plat - lat_rad) / 2) ** 2
+                 + cos_query * math.cos(plat) * math.sin(math.radians(self.longitudes[p] - lng) / 2) ** 2)
+            distance = 2 * EARTH_RADIUS_METERS * math.asin(math.sqrt(min(a, 1.0)))
+            if distance <= radius_meters and distance < best.get(row, math.inf):
+                best[row] = distance
+
+        return sorted(best.items(), key=lambda item: (item[1], item[0]))
+
+    def within_bbox(self, south, west, north, east, types=None):
+        """Records with a start or end point inside the box (west > east wraps past 180°): sorted row list"""
+        codes = self._type_filter(types)
+        found = set()
+        for p in self._candidates(south, west, north, east):
+            row = self.rows[p]
+            if codes is not None and self.records.record_type[row] not in codes:
+                continue
+            lng = self.longitudes[p]
+            if south <= self.latitudes[p] <= north and (west <= lng <= east if west <= east else lng >= west or lng <= east):
+                found.add(row)
+        return sorted(found)
+
+    def nearest(self, lat, lng, k=1, types=None):
+        """The k records closest to a point: [(row, meters)]"""
+        radius = self.cell_meters
+        while True:
+            found = self.within_radius(lat, lng, radius, types)
+            if len(found) >= k or radius > math.pi * EARTH_RADIUS_METERS:
+                return found[:k]
+            radius *= 2
+
+
+class WifiIndex:
+    """Wifi fingerprint index over the scans of a RecordStore"""
+
+    def __init__(self):
+        self.offsets = array("q", [0])
+        self.scans = array("q")
+        self.latitudes = array("d")
+        self.longitudes = array("d")
+        self.centroid_latitudes = array("d")
+        self.centroid_longitudes = array("d")
+        self.centroid_weights = array("d")
+        self.anchors = {}
+        self.records = None
+
+    @staticmethod
+    def weight(rssi):
+        """Weight of one sighting: stronger signals are closer to the access point"""
+        return max(rssi + 100, 1)
+
+    @classmethod
+    def build(cls, records, max_gap_seconds=WIFI_FIX_GAP_SECONDS):
+        """Anchor the scans of a timestamp-sorted store and index their access points"""
+        index = cls()
+        index.records = records
+        scan_code = records.lookup("record_type", "wifi_scan")
+        if scan_code is None:
+            return index
+
+        position_code = records.lookup("record_type", "position")
+        visit_code = records.lookup("record_type", "visit")
+        fix_times, fix_rows, visit_starts, visit_rows, scans = [], [], [], [], []
+        for i in range(len(records)):
+            record_type = records.record_type[i]
+            if record_type == scan_code:
+                if records.wifi_offset[i] >= 0:
+                    scans.append(i)
+            elif records.start_latitude[i] == records.start_latitude[i]:
+                if record_type == position_code:
+                    fix_times.append(records.timestamp[i])
+                    fix_rows.append(i)
+                elif record_type == visit_code:
+                    visit_starts.append(records.timestamp[i])
+                    visit_rows.append(i)
+
+        max_gap = max_gap_seconds * 1_000_000_000
+        for i in scans:
+            timestamp = records.timestamp[i]
+            anchor = None
+            k = bisect_left(fix_times, timestamp)
+            nearest = min((j for j in (k - 1, k) if 0 <= j < len(fix_times)),
+                          key=lambda j: abs(fix_times[j] - timestamp), default=None)
+            if nearest is not None and abs(fix_times[nearest] - timestamp) <= max_gap:
+                anchor = fix_rows[nearest]
+            else:
+                k = bisect_right(visit_starts, timestamp) - 1
+                if k >= 0 and records.end_timestamp[visit_rows[k]] >= timestamp:
+                    anchor = visit_rows[k]
+            if anchor is not None:
+                index.anchors[i] = (records.start_latitude[anchor], records.start_longitude[anchor])
+
+        # Count sightings per BSSID, then fill the postings in place
+        codes = len(records.strings["bssid"])
+        counts = array("q", [0]) * (codes + 1)
+        sums = [array("d", [0.0]) * codes for _ in range(3)]
+        for i, (lat, lng) in index.anchors.items():
+            for code, rssi in records.wifi_devices_at(i):
+                counts[code + 1] += 1
+                w = cls.weight(rssi)
+                sums[0][code] += lat * w
+                sums[1][code] += lng * w
+                sums[2][code] += w
+        for code in range(codes):
+            counts[code + 1] += counts[code]
+        index.offsets = counts
+
+        fill = array("q", counts[:-1])
+        size = counts[-1]
+        index.scans = array("q", [0]) * size
+        index.latitudes = array("d", [0.0]) * size
+        index.longitudes = array("d", [0.0]) * size
+        for i, (lat, lng) in index.anchors.items():
+            for code, _ in records.wifi_devices_at(i):
+                position = fill[code]
+                fill[code] += 1
+                index.scans[position] = i
+                index.latitudes[position] = lat
+                index.longitudes[position] = lng
+
+        index.centroid_weights = sums[2]
+        index.centroid_latitudes = array("d", (s / w if w else MISSING for s, w in zip(sums[0], sums[2])))
+        index.centroid_longitudes = array("d", (s / w if w else MISSING for s, w in zip(sums[1], sums[2])))
+        return index
+
+    def scans_with(self, code):
+        """[(scan row, latitude, longitude)] of the anchored scans that saw a BSSID code"""
+        if not 0 <= code < len(self.offsets) - 1:
+            return []
+        lo, hi = self.offsets[code], self.offsets[code + 1]
+        return list(zip(self.scans[lo:hi], self.latitudes[lo:hi], self.longitudes[lo:hi]))
+
+    def locate(self, devices):
+        """Estimate (latitude, longitude, matched access points) for [(bssid code, rssi)], or None"""
+        lat_sum = lng_sum = total = 0.0
+        matched = 0
+        for code, rssi in devices:
+            if not 0 <= code < len(self.centroid_weights) or not self.centroid_weights[code]:
+                continue
+            w = self.weight(rssi)
+            lat_sum += self.centroid_latitudes[code] * w
+            lng_sum += self.centroid_longitudes[code] * w
+            total += w
+            matched += 1
+        if not matched:
+            return None
+        return lat_sum / total, lng_sum / total, matched
+
+
+def to_epoch_bound(value):
+    """Convert a datetime, ISO string or epoch nanoseconds to epoch nanoseconds"""
+    if isinstance(value, int):
+        return value
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if value.tzinfo is None:
+        value = value.astimezone()  # naive bounds are local wall-clock time
+    return RecordStore.to_epoch_ns(value)[0]
+
+
+def cluster_visit_places(records, radius_meters=PLACE_RADIUS_METERS, min_visits=1):
+    """Group visit coordinates into places with grid-accelerated density clustering, sorted by dwell time"""
+    visit_code = records.lookup("record_type", "visit")
+    point_ids = {}
+    latitudes, longitudes, weights = array("d"), array("d"), array("q")
+    visit_rows, visit_points = array("q"), array("q")
+
+    for i in range(len(records)):
+        if records.record_type[i] != visit_code:
+            continue
+        lat, lng = records.start_latitude[i], records.start_longitude[i]
+        if lat != lat or lng != lng:
+            continue
+        key = (round(lat, 6), round(lng, 6))
+        point = point_ids.get(key)
+        if point is None:
+            point = point_ids[key] = len(latitudes)
+            latitudes.append(lat)
+            longitudes.append(lng)
+            weights.append(0)
+        weights[point] += 1
+        visit_rows.append(i)
+        visit_points.append(point)
+
+    # Equal-area-ish grid: rows of fixed height, columns scaled by each row's latitude
+    cell = radius_meters / math.sqrt(2) * 0.999
+    cells = defaultdict(list)
+    for p, (lat, lng) in enumerate(zip(latitudes, longitudes)):
+        row = int(math.radians(lat) * EARTH_RADIUS_METERS // cell)
+        scale = math.cos((row + 0.5) * cell / EARTH_RADIUS_METERS)
+        cells[row, int(math.radians(lng) * EARTH_RADIUS_METERS * scale // cell)].append(p)
+
+    def neighbour_cells(row, col):
+        """Cells after (row, col) that may hold points within the radius"""
+        scale = math.cos((row + 0.5) * cell / EARTH_RADIUS_METERS)
+        lng_lo = col * cell / (EARTH_RADIUS_METERS * scale)
+        lng_hi = (col + 1) * cell / (EARTH_RADIUS_METERS * scale)
+        for other_row in range(row, row + 3):
+            min_cos = min(math.cos(r * cell / EARTH_RADIUS_METERS) for r in (other_row, other_row + 1, row, row + 1))
+            margin = radius_meters / (EARTH_RADIUS_METERS * max(min_cos, 1e-9))
+            other_scale = math.cos((other_row + 0.5) * cell / EARTH_RADIUS_METERS)
+            first = int((lng_lo - margin) * EARTH_RADIUS_METERS * other_scale // cell)
+            last = int((lng_hi + margin) * EARTH_RADIUS_METERS * other_scale // cell)
+            for other_col in range(first, last + 1):
+                if (other_row, other_col) > (row, col) and (other_row, other_col) in cells:
+                    yield other_row, other_col
+
+    def close(p, q):
+        lat1, lat2 = math.radians(latitudes[p]), math.radians(latitudes[q])
+        a = (math.sin((lat2 - lat1) / 2) ** 2
+             + math.cos(lat1) * math.cos(lat2) * math.sin(math.radians(longitudes[q] - longitudes[p]) / 2) ** 2)
+        return 2 * EARTH_RADIUS_METERS * math.asin(math.sqrt(min(a, 1.0))) <= radius_meters
+
+    neighbours = {key: list(neighbour_cells(*key)) for key in cells}
+
+    # Core points: a cell heavy enough makes all its points core, sparse ones are counted exactly
+    core = [min_visits <= 1] * len(latitudes)
+    if min_visits > 1:
+        reverse = defaultdict(list)
+        for key, others in neighbours.items():
+            for other in others:
+                reverse[other].append(key)
+        for key, members in cells.items():
+            if sum(weights[p] for p in members) >= min_visits:
+                for p in members:
+                    core[p] = True
+                continue
+            nearby = [q for other in neighbours[key] + reverse[key] for q in cells[other]]
+            for p in members:
+                total = sum(weights[q] for q in members)
+                total += sum(weights[q] for q in nearby if close(p, q))
+                core[p] = total >= min_visits
+
+    parent = array("q", range(len(latitudes)))
+    assigned = [False] * len(latitudes)
+
+    def find(p):
+        root = p
+        while parent[root] != root:
+            root = parent[root]
+        while parent[p] != root:
+            parent[p], p = root, parent[p]
+        return root
+
+    def union(p, q):
+        root_p, root_q = find(p), find(q)
+        if root_p != root_q:
+            parent[root_q] = root_p
+
+    # Inside a cell every pair is within the radius
+    for members in cells.values():
+        anchor = next((p for p in members if core[p]), None)
+        if anchor is None:
+            continue
+        for p in members:
+            if core[p]:
+                union(anchor, p)
+            else:
+                parent[p] = find(anchor)
+            assigned[p] = True
+
+    # Between cells: one close core pair links two places, border points join a reaching core
+    for key, others in neighbours.items():
+        for other in others:
+            for a, b in ((key, other), (other, key)):
+                cores_b = [q for q in cells[b] if core[q]]
+                if not cores_b:
+                    continue
+                for p in cells[a]:
+                    if core[p]:
+                        if find(p) != find(cores_b[0]):
+                            for q in cores_b:
+                                if close(p, q):
+                                    union(p, q)
+                                    break
+                    elif not assigned[p]:
+                        for q in cores_b:
+                            if close(p, q):
+                                parent[p] = find(q)
+                                assigned[p] = True
+                                break
+
+    places = {}
+    for i, point in zip(visit_rows, visit_points):
+        if not assigned[point]:
+            continue
+        root = find(point)
+        place = places.get(root)
+        if place is None:
+            place = places[root] = {"rows": [], "dwell_seconds": 0.0, "first": i, "last": i}
+        place["rows"].append(i)
+        duration = records.duration_seconds[i]
+        place["dwell_seconds"] += duration if duration == duration else 0.0
+        if records.timestamp[i] < records.timestamp[place["first"]]:
+            place["first"] = i
+        if records.end_timestamp[i] > records.end_timestamp[place["last"]]:
+            place["last"] = i
+
+    place_ids = records.dictionary("place_id")
+    semantic_types = records.dictionary("semantic_type")
+    results = []
+    for place in places.values():
+        rows = place["rows"]
+        ids = Counter(place_ids[records.place_id[i]] for i in rows if records.place_id[i] >= 0)
+        types = Counter(semantic_types[records.semantic_type[i]] for i in rows if records.semantic_type[i] >= 0)
+        last = place["last"]
+        results.append({
+            "latitude": sum(records.start_latitude[i] for i in rows) / len(rows),
+            "longitude": sum(records.start_longitude[i] for i in rows) / len(rows),
+            "visits": len(rows),
+            "dwell_seconds": place["dwell_seconds"],
+            "first_seen": records.datetime_at(place["first"]).isoformat(),
+            "last_seen": records.to_datetime(records.end_timestamp[last], records.end_utc_offset[last]).isoformat(),
+            "place_id": ids.most_common(1)[0][0] if ids else None,
+            "place_ids": len(ids),
+            "semantic_type": types.most_common(1)[0][0] if types else None,
+        })
+
+    results.sort(key=lambda place: place["dwell_seconds"], reverse=True)
+    return results
+
+
+def simplify_polyline(x, y, tolerance):
+    """Douglas-Peucker simplification of one track in projected meters; returns (keep mask, error per kept point)"""
+    n = len(x)
+    keep = np.zeros(n, dtype=bool)
+    error = np.zeros(n)
+    if n == 0:
+        return keep, error
+    keep[0] = keep[-1] = True
+
+    spans = [(0, n - 1)]
+    while spans:
+        first, last = spans.pop()
+        if last - first < 2:
+            continue
+        dx, dy = x[last] - x[first], y[last] - y[first]
+        px, py = x[first + 1:last] - x[first], y[first + 1:last] - y[first]
+        length = dx * dx + dy * dy
+        # Distance to the chord segment (not the infinite line), so backtracking tracks are caught
+        t = np.clip((px * dx + py * dy) / length, 0.0, 1.0) if length else 0.0
+        deviation = np.hypot(px - t * dx, py - t * dy)
+        worst = int(np.argmax(deviation))
+        if deviation[worst] > tolerance:
+            split = first + 1 + worst
+            keep[split] = True
+            spans.append((split, last))
+            spans.append((first, split))
+        else:
+            error[first] = deviation[worst]
+
+    return keep, error
+
+
+class StayPointDetector:
+    """Streaming stay-point detection over time-ordered position fixes"""
+
+    def __init__(self, radius_meters=STAY_RADIUS_METERS, min_dwell_seconds=STAY_MIN_DWELL_SECONDS,
+                 max_gap_seconds=STAY_MAX_GAP_SECONDS):
+        self.radius_meters = radius_meters
+        self.min_dwell_seconds = min_dwell_seconds
+        self.max_gap_seconds = max_gap_seconds
+        self._gap_ns = int(max_gap_seconds * 1e9)
+        self._run = None  # [segment_index, start_ns, start_offset, last_ns, last_offset, sum_lat, sum_lng, fixes]
+        self._pending = deque()  # finished stays a late visit segment may still cancel
+        self._visits = deque()  # (start_ns, end_ns) of recent Google visits
+        self._latest = None
+
+    def settings(self):
+        """Parameters that change the detected stays (part of the cache key)"""
+        return {
+            "radius_meters": self.radius_meters,
+            "min_dwell_seconds": self.min_dwell_seconds,
+            "max_gap_seconds": self.max_gap_seconds,
+        }
+
+    def add_visit(self, start_ns, end_ns):
+        """Note a Google visit segment; overlapping stays are suppressed"""
+        self._pending = deque(stay for stay in self._pending
+                              if not (stay["start_ns"] < end_ns and start_ns < stay["end_ns"]))
+        self._visits.append((start_ns, end_ns))
+        return self._advance(start_ns)
+
+    def add_position(self, segment_index, timestamp_ns, utc_offset, lat, lng):
+        """Feed one fix; returns the stays that can no longer be cancelled"""
+        if lat != lat or lng != lng:
+            return []
+        run = self._run
+        if run is not None and timestamp_ns < run[3]:
+            return []
+
+        if run is not None:
+            center_lat, center_lng = run[5] / run[7], run[6] / run[7]
+            dy = math.radians(lat - center_lat) * EARTH_RADIUS_METERS
+            dx = math.radians(lng - center_lng) * EARTH_RADIUS_METERS * math.cos(math.radians(center_lat))
+            if timestamp_ns - run[3] <= self._gap_ns and dx * dx + dy * dy <= self.radius_meters ** 2:
+                run[3], run[4] = timestamp_ns, utc_offset
+                run[5] += lat
+                run[6] += lng
+                run[7] += 1
+                return self._advance(timestamp_ns)
+            self._close_run()
+
+        self._run = [segment_index, timestamp_ns, utc_offset, timestamp_ns, utc_offset, lat, lng, 1]
+        return self._advance(timestamp_ns)
+
+    def flush(self):
+        """End of stream: close the open run and release every remaining stay"""
+        self._close_run()
+        stays = list(self._pending)
+        self._pending.clear()
+        self._visits.clear()
+        return stays
+
+    def _close_run(self):
+        run, self._run = self._run, None
+        if run is None or run[3] - run[1] < self.min_dwell_seconds * 1e9:
+            return
+        start_ns, end_ns = run[1], run[3]
+        if any(start_ns < visit_end and visit_start < end_ns for visit_start, visit_end in self._visits):
+            return
+        self._pending.append({
+            "segment_index": run[0],
+            "start_ns": start_ns,
+            "start_offset": run[2],
+            "end_ns": end_ns,
+            "end_offset": run[4],
+            "latitude": run[5] / run[7],
+            "longitude": run[6] / run[7],
+            "fixes": run[7],
+        })
+
+    def _advance(self, timestamp_ns):
+        """Release stays and forget visits that are more than max_gap_seconds behind"""
+        if self._latest is None or timestamp_ns > self._latest:
+            self._latest = timestamp_ns
+        horizon = self._latest - self._gap_ns
+        if self._run is not None:
+            horizon = min(horizon, self._run[1])
+        while self._visits and self._visits[0][1] < horizon:
+            self._visits.popleft()
+        released = []
+        while self._pending and self._pending[0]["end_ns"] < self._latest - self._gap_ns:
+            released.append(self._pending.popleft())
+        return released
+
+
+def write_png(path, rgba):
+    """Write an (height, width, 4) uint8 array as an RGBA PNG (zlib only, no imaging library)"""
+    height, width, _ = rgba.shape
+
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+    # Every scanline starts with filter type 0 (none)
+    raw = np.concatenate((np.zeros((height, 1), dtype=np.uint8), rgba.reshape(height, width * 4)), axis=1)
+    with open(path, "wb") as f:
+        f.write(b"\x89PNG\r\n\x1a\n")
+        f.write(chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0)))
+        f.write(chunk(b"IDAT", zlib.compress(raw.tobytes(), 6)))
+        f.write(chunk(b"IEND", b""))
+
+
+def heat_colors(weights, maximum):
+    """Map weights to RGBA (log scale up to maximum; zero stays transparent)"""
+    stops = [0.0, 0.35, 0.65, 1.0]
+    palette = [(0, 0, 190), (0, 200, 255), (255, 235, 0), (230, 0, 0)]
+    level = np.log1p(weights) / math.log1p(maximum) if maximum > 0 else np.zeros_like(weights)
+    rgba = np.empty(weights.shape + (4,), dtype=np.uint8)
+    for channel in range(3):
+        rgba[..., channel] = np.interp(level, stops, [color[channel] for color in palette])
+    rgba[..., 3] = np.where(weights > 0, 96 + 159 * level, 0)
+    return rgba
+
+
+class HeatmapRaster:
+    """Weighted location histograms as XYZ map tiles (Web Mercator, 256 px)"""
+
+    WEIGHTS = ("count", "dwell")
+
+    def __init__(self, zoom_levels=HEATMAP_ZOOM_LEVELS, weight="count"):
+        if weight not in self.WEIGHTS:
+            raise ValueError(f"Unknown heatmap weight '{weight}' (use {' or '.join(self.WEIGHTS)})")
+        self.zoom_levels = sorted(zoom_levels)
+        self.weight = weight
+        self.tiles = {}  # (zoom, x, y) -> (TILE_SIZE, TILE_SIZE) float64 array
+        self.watermark = None
+        self.open_fix = None  # [timestamp, latitude, longitude] of the last fix, its dwell still unknown
+        self.maxima = {}  # zoom -> largest pixel weight at the last render
+        self.changed = set()
+
+    def settings(self):
+        return {"zoom_levels": self.zoom_levels, "weight": self.weight}
+
+    @staticmethod
+    def points(records, start=0):
+        """Rows, latitudes, longitudes and dwell seconds of the located records from row start"""
+        return HeatmapRaster._weighted_points(records, start)[:4]
+
+    @staticmethod
+    def _weighted_points(records, start=0):
+        """points() plus the position of the last fix if its dwell waits for a later fix (else None)"""
+        latitudes, longitudes = records.numpy("start_latitude"), records.numpy("start_longitude")
+        record_types = records.numpy("record_type")
+        timestamps = records.numpy("timestamp")
+        located = np.isfinite(latitudes) & np.isfinite(longitudes)
+        activity_code = records.lookup("record_type", "activity")
+        if activity_code is not None:
+            located &= record_types != activity_code
+        visit_code = records.lookup("record_type", "visit")
+        # Visits before start can still contain the fixes after it
+        visits = np.flatnonzero(located & (record_types == visit_code)) if visit_code is not None else np.empty(0, dtype=np.int64)
+        rows = np.flatnonzero(located[start:]) + start
+        is_visit = record_types[rows] == visit_code if visit_code is not None else np.zeros(len(rows), dtype=bool)
+
+        dwell = np.zeros(len(rows))
+        open_fix = None
+        fixes = np.flatnonzero(~is_visit)
+        if len(fixes):
+            fix_times = timestamps[rows[fixes]]
+            gaps = np.diff(fix_times, append=fix_times[-1]) / 1e9
+            dwell[fixes] = np.minimum(gaps, HEATMAP_MAX_DWELL_SECONDS)
+            # Merge-join the fixes against the visit spans
+            owner = np.searchsorted(timestamps[visits], fix_times, side="right") - 1
+            inside = owner >= 0
+            inside[inside] = fix_times[inside] <= records.numpy("end_timestamp")[visits[owner[inside]]]
+            dwell[fixes[inside]] = 0
+            if not inside[-1]:
+                open_fix = int(fixes[-1])
+        dwell[is_visit] = records.numpy("duration_seconds")[rows[is_visit]]
+        return rows, latitudes[rows], longitudes[rows], np.nan_to_num(dwell), open_fix
+
+    @staticmethod
+    def pixels(latitudes, longitudes, zoom):
+        """Global Web Mercator pixel coordinates (x, y) at a zoom level"""
+        size = TILE_SIZE << zoom
+        lat = np.radians(np.clip(latitudes, -MAX_MERCATOR_LATITUDE, MAX_MERCATOR_LATITUDE))
+        x = (longitudes + 180) / 360 * size
+        y = (0.5 - np.log(np.tan(np.pi / 4 + lat / 2)) / (2 * np.pi)) * size
+        return (np.clip(x, 0, size - 1).astype(np.int64), np.clip(y, 0, size - 1).astype(np.int64))
+
+    def add_points(self, latitudes, longitudes, weights):
+        """Bin weighted points into the tiles of every zoom level"""
+        if not len(latitudes):
+            return
+        for zoom in self.zoom_levels:
+            x, y = self.pixels(latitudes, longitudes, zoom)
+            tile = (x // TILE_SIZE) << zoom | (y // TILE_SIZE)
+            keys = tile * (TILE_SIZE * TILE_SIZE) + (y % TILE_SIZE) * TILE_SIZE + x % TILE_SIZE
+            unique, inverse = np.unique(keys, return_inverse=True)
+            sums = np.bincount(inverse.ravel(), weights=weights)
+            tiles = unique // (TILE_SIZE * TILE_SIZE)
+            bounds = np.flatnonzero(np.diff(tiles)) + 1
+            for lo, hi in zip(np.concatenate(([0], bounds)), np.concatenate((bounds, [len(unique)]))):
+                code = int(tiles[lo])
+                key = (zoom, code >> zoom, code & ((1 << zoom) - 1))
+                raster = self.tiles.get(key)
+                if raster is None:
+                    raster = self.tiles[key] = np.zeros((TILE_SIZE, TILE_SIZE))
+                raster.ravel()[unique[lo:hi] % (TILE_SIZE * TILE_SIZE)] += sums[lo:hi]
+                self.changed.add(key)
+
+    def add(self, records):
+        """Add the records starting after the watermark; returns the number of points added"""
+        start = 0 if self.watermark is None else bisect_right(records.timestamp, self.watermark)
+        if start >= len(records):
+            return 0
+        rows, latitudes, longitudes, dwell, open_fix = self._weighted_points(records, start)
+        weights = dwell if self.weight == "dwell" else np.ones(len(rows))
+        self.add_points(latitudes, longitudes, weights)
+
+        # The last fix of the previous add waited for the first fix of this one
+        visit_code = records.lookup("record_type", "visit")
+        fixes = rows if visit_code is None else rows[records.numpy("record_type")[rows] != visit_code]
+        if len(fixes):
+            if self.open_fix is not None and self.weight == "dwell":
+                timestamp, latitude, longitude = self.open_fix
+                gap = min((records.timestamp[int(fixes[0])] - timestamp) / 1e9, HEATMAP_MAX_DWELL_SECONDS)
+                self.add_points(np.array([latitude]), np.array([longitude]), np.array([gap]))
+            self.open_fix = None
+            if open_fix is not None:
+                self.open_fix = [records.timestamp[int(rows[open_fix])], float(latitudes[open_fix]), float(longitudes[open_fix])]
+        self.watermark = records.timestamp[len(records) - 1]
+        return len(rows)
+
+    @staticmethod
+    def grid(latitudes, longitudes, weights, bins, bbox=None):
+        """Plain 2D histogram (rows north to south) over bbox (south, west, north, east, default: the data)"""
+        if bbox is None:
+            bbox = (float(latitudes.min()), float(longitudes.min()), float(latitudes.max()), float(longitudes.max()))
+        south, west, north, east = bbox
+        histogram, _, _ = np.histogram2d(latitudes, longitudes, bins=bins, range=((south, north), (west, east)), weights=weights)
+        return histogram[::-1], bbox
+
+    def save(self, directory):
+        """Write the raw tile weights and watermark to directory/heatmap.npz (compressed)"""
+        os.makedirs(directory, exist_ok=True)
+        state = dict(self.settings(), watermark_ns=self.watermark, open_fix=self.open_fix,
+                     maxima={str(z): m for z, m in self.maxima.items()})
+        arrays = {f"{z}/{x}/{y}": raster for (z, x, y), raster in self.tiles.items()}
+        path = os.path.join(directory, "heatmap.npz")
+        # np.savez appends .npz to names without it; write under a temporary .npz name
+        tmp_path = os.path.join(directory, "heatmap.tmp.npz")
+        np.savez_compressed(tmp_path, state=np.array(json.dumps(state)), **arrays)
+        os.replace(tmp_path, path)
+        return path
+
+    @classmethod
+    def load(cls, directory):
+        """Load the state written by save(), or None if there is none"""
+        path = os.path.join(directory, "heatmap.npz")
+        if not os.path.isfile(path):
+            return None
+        with np.load(path) as data:
+            state = json.loads(str(data["state"]))
+            raster = cls(state["zoom_levels"], state["weight"])
+            for name in data.files:
+                if name != "state":
+                    raster.tiles[tuple(int(v) for v in name.split("/"))] = data[name]
+        raster.watermark = state["watermark_ns"]
+        raster.open_fix = state.get("open_fix")
+        raster.maxima = {int(z): m for z, m in state["maxima"].items()}
+        return raster
+
+    def render(self, directory):
+        """Write changed tiles as directory/{z}/{x}/{y}.png; returns the number written"""
+        maxima = {}
+        for (zoom, _, _), raster in self.tiles.items():
+            maxima[zoom] = max(maxima.get(zoom, 0.0), float(raster.max()))
+        written = 0
+        for key, raster in self.tiles.items():
+            zoom, x, y = key
+            if key not in self.changed and maxima[zoom] == self.maxima.get(zoom):
+                continue
+            os.makedirs(os.path.join(directory, str(zoom), str(x)), exist_ok=True)
+            write_png(os.path.join(directory, str(zoom), str(x), f"{y}.png"), heat_colors(raster, maxima[zoom]))
+            written += 1
+        self.maxima = maxima
+        self.changed = set()
+        return written
+
+
+def segment_start_time(segment):
+    """Raw start time string of any segment type, without parsing anything"""
+    if "startTime" in segment:
+        return segment["startTime"]
+    if "position" in segment:
+        return segment["position"].get("timestamp")
+    if "activityRecord" in segment:
+        return segment["activityRecord"].get("timestamp")
+    if "wifiScan" in segment:
+        return segment["wifiScan"].get("deliveryTime")
+    return None
+
+
+class SegmentFilter:
+    """Time range and record type filter applied to raw segments before parsing (filter pushdown)"""
+
+    RECORD_TYPES = ("activity", "visit", "position", "activity_record", "wifi_scan")
+
+    def __init__(self, start=None, end=None, types=None):
+        self.start_ns = None if start is None else to_epoch_bound(start)
+        self.end_ns = None if end is None else to_epoch_bound(end)
+        self.types = set(types) if types else None
+        if self.types and not self.types <= set(self.RECORD_TYPES):
+            raise ValueError(f"Unknown record types: {', '.join(sorted(self.types - set(self.RECORD_TYPES)))}")
+
+        def day(epoch_ns, days):
+            return (EPOCH + timedelta(microseconds=epoch_ns // 1000, days=days)).strftime("%Y-%m-%d")
+
+        self.first_day = None if self.start_ns is None else day(self.start_ns, -1)
+        self.last_day = None if self.end_ns is None else day(self.end_ns, 1)
+
+    def accepts(self, segment, kind=None):
+        """Cheap check on a raw segment of the given record type (None skips the type check)"""
+        if kind is not None and self.types is not None and kind not in self.types:
+            return False
+        if self.first_day or self.last_day:
+            start_str = segment_start_time(segment)
+            if start_str:
+                date = start_str[:10]
+                if (self.first_day and date < self.first_day) or (self.last_day and date > self.last_day):
+                    return False
+        return True
+
+    def including(self, *types):
+        """Copy of this filter that also accepts the given record types"""
+        widened = copy.copy(self)
+        if self.types is not None:
+            widened.types = self.types | set(types)
+        return widened
+
+    def apply(self, store):
+        """Exact filter of a sorted store: records starting in [start, end) of the wanted types"""
+        if self.types is None:
+            lo, hi = store.time_range(self.start_ns, self.end_ns)
+            store.truncate(lo, hi)
+            return store
+        return store.records_between(self.start_ns, self.end_ns, self.types)
+
+
+class Accumulator(ABC):
+    """Base class of a pluggable, mergeable aggregation step"""
+
+    name = None
+
+    @abstractmethod
+    def add_range(self, store, lo, hi):
+        """Fold rows [lo, hi) of a store into the state (the engine never passes an empty range)"""
+
+    @abstractmethod
+    def merge(self, other):
+        """Fold in another accumulator's state"""
+
+    @abstractmethod
+    def result(self):
+        """JSON-serializable result"""
+
+
+def _add_counts(target, source):
+    for key, value in source.items():
+        target[key] = target.get(key, 0) + value
+
+
+def _totals_by_code(codes, weights=None):
+    """{code: rows} (or {code: sum of weights}) of a dictionary-encoded column slice, NumPy array or sequence"""
+    if np is not None and isinstance(codes, np.ndarray):
+        shifted = codes.astype(np.int64) + 1  # -1 (None) gets its own bin
+        counts = np.bincount(shifted)
+        totals = counts if weights is None else np.bincount(shifted, weights=weights)
+        return {int(code) - 1: totals[code].item() for code in np.flatnonzero(counts)}
+    if weights is None:
+        return Counter(codes)
+    totals = {}
+    for code, value in zip(codes, weights):
+        totals[code] = totals.get(code, 0.0) + value
+    return totals
+
+
+def _running_sum(total, values):
+    """total + values added left to right like repeated +=, so runs split across calls add up exactly"""
+    return np.cumsum(np.concatenate(([total], values)))[-1].item() if len(values) else total
+
+
+class CountAccumulator(Accumulator):
+    """Record counts per activity type and per record type"""
+
+    name = "counts"
+
+    def __init__(self):
+        self.total = 0
+        self.by_activity = {}
+        self.by_record_type = {}
+
+    def add_range(self, store, lo, hi):
+        if np is not None:
+            activity_codes, type_codes = store.numpy("activity_type")[lo:hi], store.numpy("record_type")[lo:hi]
+        else:
+            activity_codes, type_codes = store.activity_type[lo:hi], store.record_type[lo:hi]
+        activities, record_types = store.dictionary("activity_type"), store.dictionary("record_type")
+        _add_counts(self.by_activity, {activities[c]: n for c, n in _totals_by_code(activity_codes).items()})
+        _add_counts(self.by_record_type, {record_types[c]: n for c, n in _totals_by_code(type_codes).items()})
+        self.total += hi - lo
+
+    def merge(self, other):
+        self.total += other.total
+        _add_counts(self.by_activity, other.by_activity)
+        _add_counts(self.by_record_type, other.by_record_type)
+
+    def result(self):
+        return {"total": self.total, "by_activity": self.by_activity, "by_record_type": self.by_record_type}
+
+
+class SumAccumulator(Accumulator):
+    """Total and per-activity sum of one float column, skipping NaN and zero"""
+
+    column = None
+
+    def __init__(self):
+        self.total = 0.0
+        self.by_activity = {}
+
+    def add_range(self, store, lo, hi):
+        if np is not None:
+            values, codes = store.numpy(self.column)[lo:hi], store.numpy("activity_type")[lo:hi]
+            kept = (values != 0) & (values == values)
+            sums = _totals_by_code(codes[kept], values[kept])
+        else:
+            kept = [(code, value) for code, value in zip(store.activity_type[lo:hi], getattr(store, self.column)[lo:hi])
+                    if value and value == value]
+            sums = _totals_by_code(*zip(*kept)) if kept else {}
+        activities = store.dictionary("activity_type")
+        for code, value in sorted(sums.items()):
+            self.by_activity[activities[code]] = self.by_activity.get(activities[code], 0.0) + value
+            self.total += value
+
+    def merge(self, other):
+        self.total += other.total
+        for activity, value in other.by_activity.items():
+            self.by_activity[activity] = self.by_activity.get(activity, 0.0) + value
+
+    def result(self):
+        return {"total": self.total, "by_activity": self.by_activity}
+
+
+class DistanceAccumulator(SumAccumulator):
+    name = "distance_meters"
+    column = "distance_meters"
+
+
+class DurationAccumulator(SumAccumulator):
+    name = "duration_seconds"
+    column = "duration_seconds"
+
+
+class CoverageAccumulator(Accumulator):
+    """How many records carry coordinates"""
+
+    name = "coverage"
+
+    def __init__(self):
+        self.total = 0
+        self.with_location = 0
+
+    def add_range(self, store, lo, hi):
+        self.total += hi - lo
+        if np is not None:
+            self.with_location += int(np.count_nonzero(~np.isnan(store.numpy("start_latitude")[lo:hi])))
+        else:
+            self.with_location += sum(lat == lat for lat in store.start_latitude[lo:hi])
+
+    def merge(self, other):
+        self.total += other.total
+        self.with_location += other.with_location
+
+    def result(self):
+        share = self.with_location / self.total if self.total else 0.0
+        return {"total": self.total, "with_location": self.with_location, "share": share}
+
+
+class DateRangeAccumulator(Accumulator):
+    """Earliest and latest record start, kept with their UTC offsets"""
+
+    name = "date_range"
+
+    def __init__(self):
+        self.first = None  # (epoch ns, offset minutes)
+        self.last = None
+
+    def add_range(self, store, lo, hi):
+        timestamps = store.timestamp
+        if np is not None:
+            window = store.numpy("timestamp")[lo:hi]
+            first, last = lo + int(np.argmin(window)), hi - 1 - int(np.argmax(window[::-1]))
+        else:
+            # Earliest first occurrence and latest last occurrence, like a scan with < and >=
+            first = min(range(lo, hi), key=timestamps.__getitem__)
+            last = max(reversed(range(lo, hi)), key=timestamps.__getitem__)
+        if self.first is None or timestamps[first] < self.first[0]:
+            self.first = (timestamps[first], store.utc_offset[first])
+        if self.last is None or timestamps[last] >= self.last[0]:
+            self.last = (timestamps[last], store.utc_offset[last])
+
+    def merge(self, other):
+        if other.first is not None and (self.first is None or other.first[0] < self.first[0]):
+            self.first = other.first
+        if other.last is not None and (self.last is None or other.last[0] >= self.last[0]):
+            self.last = other.last
+
+    def result(self):
+        if self.first is None:
+            return {"start": None, "end": None, "hours": 0.0}
+        return {
+            "start": RecordStore.to_datetime(*self.first).isoformat(),
+            "end": RecordStore.to_datetime(*self.last).isoformat(),
+            "hours": (self.last[0] - self.first[0]) / 3.6e12,
+        }
+
+
+class MonthlyAccumulator(Accumulator):
+    """Per local calendar month: records, distance, duration, visits and activity counts"""
+
+    name = "monthly"
+
+    def __init__(self, months=None):
+        # months: a previous result() to continue from (e.g. a persisted store's aggregates)
+        self.months = months if months is not None else {}
+        self.touched = set()
+
+    def _totals(self, month):
+        totals = self.months.get(month)
+        if totals is None:
+            totals = self.months[month] = {
+                "records": 0,
+                "distance_meters": 0.0,
+                "duration_seconds": 0.0,
+                "visits": 0,
+                "activities": {},
+            }
+        self.touched.add(month)
+        return totals
+
+    def add_range(self, store, lo, hi):
+        if np is None:
+            return self._add_rows(store, lo, hi)
+        days = (store.numpy("timestamp")[lo:hi] // 1_000_000_000
+                + store.numpy("utc_offset")[lo:hi].astype(np.int64) * 60) // 86400
+        keys, inverse = np.unique(days.astype("datetime64[D]").astype("datetime64[M]"), return_inverse=True)
+        # Rows grouped by month, in store order within each month
+        order = np.argsort(inverse, kind="stable")
+        bounds = np.searchsorted(inverse[order], np.arange(len(keys) + 1))
+        distances = np.nan_to_num(store.numpy("distance_meters")[lo:hi][order], nan=0.0)
+        durations = np.nan_to_num(store.numpy("duration_seconds")[lo:hi][order], nan=0.0)
+        record_types = store.numpy("record_type")[lo:hi][order]
+        activity_codes = store.numpy("activity_type")[lo:hi][order]
+        visit, activity = store.lookup("record_type", "visit"), store.lookup("record_type", "activity")
+        activity_types = store.dictionary("activity_type")
+
+        for key, a, b in zip(keys, bounds[:-1].tolist(), bounds[1:].tolist()):
+            totals = self._totals(str(key))
+            totals["records"] += b - a
+            totals["distance_meters"] = _running_sum(totals["distance_meters"], distances[a:b])
+            totals["duration_seconds"] = _running_sum(totals["duration_seconds"], durations[a:b])
+            types = record_types[a:b]
+            totals["visits"] += int(np.count_nonzero(types == visit)) if visit is not None else 0
+            if activity is not None:
+                counts = _totals_by_code(activity_codes[a:b][types == activity])
+                _add_counts(totals["activities"], {activity_types[c]: n for c, n in counts.items()})
+
+    def _add_rows(self, store, lo, hi):
+        """add_range without NumPy"""
+        record_types = store.dictionary("record_type")
+        activity_types = store.dictionary("activity_type")
+        for i, month in store.months(lo, hi):
+            totals = self._totals(month)
+            totals["records"] += 1
+            distance, duration = store.distance_meters[i], store.duration_seconds[i]
+            totals["distance_meters"] += distance if distance == distance else 0.0
+            totals["duration_seconds"] += duration if duration == duration else 0.0
+
+            record_type = record_types[store.record_type[i]]
+            if record_type == "activity":
+                activity = activity_types[store.activity_type[i]]
+                totals["activities"][activity] = totals["activities"].get(activity, 0) + 1
+            elif record_type == "visit":
+                totals["visits"] += 1
+
+    def merge(self, other):
+        for month, theirs in other.months.items():
+            ours = self.months.setdefault(
+                month, {"records": 0, "distance_meters": 0.0, "duration_seconds": 0.0, "visits": 0, "activities": {}}
+            )
+            for key in ("records", "distance_meters", "duration_seconds", "visits"):
+                ours[key] += theirs[key]
+            _add_counts(ours["activities"], theirs["activities"])
+
+    def result(self):
+        return dict(sorted(self.months.items()))
+
+
+class AggregationEngine:
+    """Feed column ranges of a store to a set of accumulators in a single pass"""
+
+    DEFAULT_ACCUMULATORS = (
+        CountAccumulator,
+        DistanceAccumulator,
+        DurationAccumulator,
+        CoverageAccumulator,
+        DateRangeAccumulator,
+    )
+
+    def __init__(self, accumulators=None):
+        if accumulators is None:
+            accumulators = [cls() for cls in self.DEFAULT_ACCUMULATORS]
+        self.accumulators = list(accumulators)
+
+    def run(self, store, start=0, stop=None):
+        """Aggregate rows [start, stop) of a store; returns self"""
+        stop = len(store) if stop is None else stop
+        if start < stop:
+            for accumulator in self.accumulators:
+                accumulator.add_range(store, start, stop)
+        return self
+
+    def merge(self, other):
+        """Combine another engine's state (accumulators are matched by name)"""
+        theirs = {accumulator.name: accumulator for accumulator in other.accumulators}
+        for accumulator in self.accumulators:
+            if accumulator.name in theirs:
+                accumulator.merge(theirs[accumulator.name])
+        return self
+
+    def results(self):
+        """Structured, JSON-serializable results keyed by accumulator name"""
+        return {accumulator.name: accumulator.result() for accumulator in self.accumulators}
+
+
+class RunStats:
+    """Counters and timings of a parser run, mergeable across worker processes"""
+
+    def __init__(self, samples=ERROR_SAMPLES):
+        self.samples = samples
+        self.stages = {}
+        self.parsed = Counter()
+        self.failed = Counter()
+        self.errors = Counter()
+        self.error_samples = defaultdict(list)
+        self.unknown_segments = 0
+        self.filtered_segments = 0
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """Time a block; the block may set stage["items"] for a throughput figure"""
+        stage = {"items": None}
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield stage
+        finally:
+            self.add_stage(name, time.perf_counter() - wall, time.process_time() - cpu, stage["items"])
+
+    def add_stage(self, name, wall_seconds, cpu_seconds, items=None, calls=1):
+        totals = self.stages.setdefault(name, {"calls": 0, "wall_seconds": 0.0, "cpu_seconds": 0.0, "items": 0})
+        totals["calls"] += calls
+        totals["wall_seconds"] += wall_seconds
+        totals["cpu_seconds"] += cpu_seconds
+        totals["items"] += items or 0
+
+    def error(self, kind, key, error):
+        """Count an exception while parsing; the first few are kept as examples"""
+        self.errors[kind] += 1
+        samples = self.error_samples[kind]
+        if len(samples) < self.samples:
+            samples.append({"segment": key, "error": f"{type(error).__name__}: {error}"})
+
+    def merge(self, other):
+        for name, totals in other.stages.items():
+            self.add_stage(name, totals["wall_seconds"], totals["cpu_seconds"], totals["items"], totals["calls"])
+        self.parsed.update(other.parsed)
+        self.failed.update(other.failed)
+        self.errors.update(other.errors)
+        for kind, samples in other.error_samples.items():
+            self.error_samples[kind].extend(samples[:self.samples - len(self.error_samples[kind])])
+        self.unknown_segments += other.unknown_segments
+        self.filtered_segments += other.filtered_segments
+        return self
+
+    def result(self):
+        """JSON-serializable snapshot"""
+        stages = {}
+        for name, totals in self.stages.items():
+            wall = totals["wall_seconds"]
+            stages[name] = dict(totals, items_per_second=totals["items"] / wall if totals["items"] and wall else None)
+        return {
+            "segments": sum(self.parsed.values()) + sum(self.failed.values()) + self.unknown_segments
+            + self.filtered_segments,
+            "parsed": dict(self.parsed),
+            "failed": dict(self.failed),
+            "errors": dict(self.errors),
+            "unknown_segments": self.unknown_segments,
+            "filtered_segments": self.filtered_segments,
+            "error_samples": dict(self.error_samples),
+            "stages": stages,
+        }
+
+
+def timed_stage(name, count=None):
+    """Method decorator: record each call as a stage of self.stats (count(self, result, records) gives its items)"""
+    def decorate(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            with self.stats.stage(name) as stage:
+                result = method(self, *args, **kwargs)
+                if count:
+                    stage["items"] = count(self, result, args[0] if args else kwargs.get("records"))
+            return result
+        return wrapper
+    return decorate
+
+
+def count_records(parser, result, records):
+    return len(records)
+
+
+def iter_shards(segments, shard_size):
+    """Cut a segment sequence or stream into (base_index, list) shards"""
+    base_index = 0
+    iterator = iter(segments)
+    while True:
+        shard = list(islice(iterator, shard_size))
+        if not shard:
+            return
+        yield base_index, shard
+        base_index += len(shard)
+
+
+def parse_shard(base_index, segments, segment_filter=None):
+    """Process pool entry point: parse and sort one shard; returns the store and its RunStats"""
+    parser = TimelineParser()
+    store = RecordStore()
+    with parser.stats.stage("parse_shard") as stage:
+        parser._parse_segments(segments, store, base_index, segment_filter)
+        store.sort()
+        stage["items"] = len(segments)
+    return store, parser.stats
+
+
+def parse_shard_range(path, base_index, start, stop, json_backend_name=None, segment_filter=None):
+    """Process pool entry point: decode the segments in bytes [start, stop) of an export, then parse_shard them"""
+    _, loads = json_backend(json_backend_name)
+    with open(path, "rb") as f:
+        f.seek(start)
+        segments = loads(b"[" + f.read(stop - start) + b"]")
+    return parse_shard(base_index, segments, segment_filter)
+
+
+def expand_export_paths(paths):
+    """Files and directories to a list of export files (directories: every *.json below them)"""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, names in os.walk(path):
+                dirs.sort()
+                files.extend(os.path.join(root, name) for name in sorted(names) if name.lower().endswith(".json"))
+        else:
+            files.append(path)
+    return files
+
+
+def parse_export(path, records_path, use_cache=False, stay_settings=None, segment_filter=None):
+    """Process pool entry point: parse one export into a sorted record file; returns (file or None, count, from cache, RunStats)"""
+    parser = TimelineParser(path)
+    if stay_settings:
+        parser.stay_detector = StayPointDetector(**stay_settings)
+
+    store = parser.load_cached_records(quiet=True) if use_cache else None
+    if store is not None:
+        return parser.cache_path(), len(store), True, parser.stats
+    if not parser.load_timeline_data(stream=True, quiet=True):
+        return None, 0, False, parser.stats
+    store = parser.parse_all_segments(segment_filter=None if use_cache else segment_filter, quiet=True)
+    if use_cache and parser.save_cached_records(store, quiet=True):
+        return parser.cache_path(), len(store), False, parser.stats
+    store.save(records_path)
+    return records_path, len(store), False, parser.stats
 
 
 class TimelineParser:
     def __init__(self, file_path=None):
         self.file_path = file_path
         self.semantic_segments = []
+        self.json_backend_name = None  # set once semantic_segments come from file_path
+        self._segment_file = None  # open export behind a streamed semantic_segments
+        self.stay_detector = None  # StayPointDetector run over positions while parsing
+        self.stats = RunStats()
+        self._times, self._coords = {}, {}  # strings of the batch being parsed, decoded up front
 
-    def load_timeline_data(self, file_path=None):
-        """Load timeline data from JSON file"""
+    @timed_stage("load_timeline_data", lambda parser, result, _: len(parser.semantic_segments)
+                 if isinstance(parser.semantic_segments, list) else 0)
+    def load_timeline_data(self, file_path=None, stream=False, json_backend_name=None, quiet=False):
+        """Load timeline data from JSON file (stream=True: a one-shot segment iterator instead; quiet=True: errors only)"""
         if file_path:
             self.file_path = file_path
 
@@ -30,27 +2613,203 @@ class TimelineParser:
             return False
 
         try:
-            with open(self.file_path, "r", encoding="utf-8") as f:
-                data = json.load(f)
+            backend, _ = json_backend(json_backend_name)
+        except RuntimeError as e:
+            print(f"Error: {e}")
+            return False
+        self.json_backend_name = None
+
+        if stream:
+            loaded = self._open_segment_stream(quiet)
+            self.json_backend_name = backend if loaded else None
+            return loaded
+
+        try:
+            data = load_json_file(self.file_path, backend)
 
-                if "semanticSegments" in data:
-                    self.semantic_segments = data["semanticSegments"]
+            if "semanticSegments" in data:
+                self.semantic_segments = data["semanticSegments"]
+                self.json_backend_name = backend
+                if not quiet:
                     print(f"Loaded {len(self.semantic_segments)} semantic segments")
-                    return True
-                else:
-                    print("No 'semanticSegments' found in JSON file")
-                    return False
+                return True
+            else:
+                print("No 'semanticSegments' found in JSON file")
+                return False
+
+        except Exception as e:
+            print(f"Error reading {self.file_path}: {e}")
+            return False
 
+    def _open_segment_stream(self, quiet=False):
+        """Prepare semantic_segments as an incremental reader over the export"""
+        f = open(self.file_path, "r", encoding="utf-8")
+        try:
+            self.semantic_segments = iter(JsonArrayStream(f, "semanticSegments"))
+            self._segment_file = f
+        except KeyError:
+            f.close()
+            print("No 'semanticSegments' found in JSON file")
+            return False
         except Exception as e:
+            f.close()
             print(f"Error reading {self.file_path}: {e}")
             return False
 
+        if not quiet:
+            print(f"Streaming semantic segments from {self.file_path}")
+        return True
+
+    def cache_path(self):
+        """Location of the parsed-record cache for the current export"""
+        return f"{self.file_path}.records"
+
+    @timed_stage("load_cache", lambda parser, store, _: len(store) if store is not None else 0)
+    def load_cached_records(self, cache_path=None, quiet=False):
+        """Return the cached RecordStore if it still matches the export, else None"""
+        cache_path = cache_path or self.cache_path()
+        if not os.path.isfile(cache_path) or not os.path.isfile(self.file_path):
+            return None
+
+        try:
+            header = RecordStore.read_header(cache_path)
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable cache {cache_path}: {e}")
+            return None
+        cached = (header or {}).get("metadata", {}).get("source")
+        if not cached:
+            return None
+        stay_points = self.stay_detector.settings() if self.stay_detector else None
+        if header["metadata"].get("stay_points") != stay_points:
+            return None
+        # Caches from before wifi devices were stored would lose them; reparse
+        if not any(spec["name"] == "wifi_offset" for spec in header.get("columns", [])):
+            return None
+
+        current = source_fingerprint(self.file_path, content_hash=False)
+        if current["size"] != cached["size"]:
+            return None
+        if current["mtime_ns"] != cached["mtime_ns"]:
+            if source_fingerprint(self.file_path)["hash"] != cached["hash"]:
+                return None
+
+        store = RecordStore.load(cache_path)
+        if current["mtime_ns"] != cached["mtime_ns"]:
+            # Same content, new mtime: refresh the key so the next run skips hashing
+            try:
+                store.save(cache_path, source=dict(cached, mtime_ns=current["mtime_ns"]), stay_points=stay_points)
+            except OSError:
+                pass
+        store.metadata = {"source": dict(cached, mtime_ns=current["mtime_ns"]), "stay_points": stay_points}
+        if not quiet:
+            print(f"Loaded {len(store)} records from cache {cache_path}")
+        return store
+
+    @timed_stage("save_cache", count_records)
+    def save_cached_records(self, records, cache_path=None, quiet=False):
+        """Persist parsed records keyed by the export's fingerprint"""
+        cache_path = cache_path or self.cache_path()
+        records.metadata["source"] = source_fingerprint(self.file_path)
+        stay_points = self.stay_detector.settings() if self.stay_detector else None
+        try:
+            records.save(cache_path, source=records.metadata["source"], stay_points=stay_points)
+        except OSError as e:
+            print(f"Error writing cache {cache_path}: {e}")
+            return False
+        if not quiet:
+            print(f"Cached parsed records in {cache_path}")
+        return True
+
+    @timed_stage("ingest_incremental", lambda parser, result, _: len(result[0]))
+    def ingest_incremental(self, store_path):
+        """Add the export's records after the store's watermark to a persisted store; returns (store, updated months)"""
+        if os.path.isfile(store_path):
+            store = RecordStore.load(store_path, writable=True)
+            print(f"Loaded {len(store)} stored records from {store_path}")
+        else:
+            store = RecordStore()
+        metadata = store.metadata
+        watermark = metadata.get("watermark_ns")
+        watermark_day = None
+        if watermark is not None:
+            watermark_day = (EPOCH + timedelta(microseconds=watermark // 1000) - timedelta(days=1)).strftime("%Y-%m-%d")
+
+        batch = RecordStore()
+        skipped = 0
+
+        def after_watermark():
+            nonlocal skipped
+            for i, segment in enumerate(self.semantic_segments):
+                if watermark is not None:
+                    start_str = segment_start_time(segment)
+                    # Dates more than a day before the watermark cannot be new in any time zone
+                    if not start_str or (type(start_str) is str and start_str[:10] < watermark_day):
+                        skipped += 1
+                        continue
+                    try:
+                        if decode_timestamp(start_str)[0] < watermark:
+                            skipped += 1
+                            continue
+                    except (ValueError, IndexError, TypeError):
+                        pass  # malformed: the segment parser counts it as failed
+                yield i, segment
+
+        self._parse_numbered(after_watermark(), batch)
+        self._flush_stays(batch)
+        batch.sort()
+
+        # Overlapping records can only sit at or after the watermark
+        first_new = bisect_left(store.timestamp, watermark) if watermark is not None else len(store)
+        seen = {store.dedupe_key(i) for i in range(first_new, len(store))}
+        rows = []
+        for i in range(len(batch)):
+            key = batch.dedupe_key(i)
+            if key not in seen:
+                seen.add(key)
+                rows.append(i)
+
+        start = len(store)
+        store.extend(batch, rows)
+        monthly = MonthlyAccumulator(metadata.get("monthly"))
+        AggregationEngine([monthly]).run(store, start)
+        metadata["monthly"] = monthly.result()
+        updated_months = sorted(monthly.touched)
+        if len(store):
+            metadata["watermark_ns"] = max(watermark or 0, store.timestamp[len(store) - 1])
+
+        store.save(store_path, **metadata)
+        store.metadata = metadata
+        print(f"Skipped {skipped} segments before the watermark, "
+              f"dropped {len(batch) - len(rows)} duplicates, added {len(rows)} new records")
+        self._print_failures()
+        if updated_months:
+            print(f"Updated monthly aggregates: {', '.join(updated_months)}")
+        return store, updated_months
+
+    def spatial_index(self, records, index_path=None, cell_meters=SPATIAL_CELL_METERS):
+        """Return a SpatialIndex over records, reusing a persisted one when it matches"""
+        key = {"count": len(records), "source": records.metadata.get("source")}
+        if index_path and os.path.isfile(index_path):
+            header = read_column_header(index_path) or {}
+            if header.get("kind") == "spatial" and header.get("cell_meters") == cell_meters \
+                    and header.get("metadata") == key:
+                return SpatialIndex.load(index_path, records)
+
+        index = SpatialIndex.build(records, cell_meters)
+        if index_path:
+            index.save(index_path, **key)
+        return index
+
     def parse_latlng_string(self, latlng_str):
         """Parse LatLng string format '52.0187241°, 8.5751769°' to decimal degrees"""
         if not latlng_str:
             return None, None
         
         try:
+            decoded = self._coords.get(latlng_str)
+            if decoded is not None:
+                return decoded
+
             # Remove degree symbols and split
             clean_str = latlng_str.replace('°', '').strip()
             parts = clean_str.split(',')
@@ -59,69 +2818,315 @@ class TimelineParser:
                 lng = float(parts[1].strip())
                 return lat, lng
         except Exception as e:
-            print(f"Error parsing LatLng '{latlng_str}': {e}")
+            self.stats.error("latlng", latlng_str, e)
         
         return None, None
 
-    def parse_all_segments(self):
-        """Parse all semantic segments into structured records"""
-        records = []
+    @timed_stage("parse_all_segments", lambda parser, store, _: len(store))
+    def parse_all_segments(self, workers=1, shard_size=SHARD_SIZE, segment_filter=None, quiet=False):
+        """Parse all semantic segments into a columnar RecordStore (in a process pool with workers > 1)"""
+        if workers and workers > 1:
+            shard_filter = segment_filter
+            if segment_filter is not None and self.stay_detector:
+                shard_filter = segment_filter.including("visit", "position")
+            store = self._parse_parallel(workers, shard_size, shard_filter)
+            if self.stay_detector:
+                # Shards cannot see stays across their borders: one pass over the merged store instead
+                store = RecordStore.merge([store, self.detect_stays(store)])
+        else:
+            store = RecordStore()
+            self._parse_segments(self.semantic_segments, store, segment_filter=segment_filter)
+            self._flush_stays(store)
 
-        for i, segment in enumerate(self.semantic_segments):
-            # Parse activity segments
+            # Sort by timestamp
+            with self.stats.stage("sort") as stage:
+                store.sort()
+                stage["items"] = len(store)
+
+        if segment_filter is not None:
+            store = segment_filter.apply(store)
+        if quiet:
+            return store
+
+        print(f"\nParsed {len(store)} total records:")
+        for rtype, count in store.type_counts().items():
+            print(f"  {rtype}: {count}")
+        self._print_failures()
+        if self.stay_detector:
+            code = store.lookup("source", "stay_point")
+            print(f"  (inferred stays: {store.source.count(code) if code is not None else 0})")
+
+        return store
+
+    def _print_failures(self):
+        """Print the failed segments per type with one sample error"""
+        for kind, count in self.stats.failed.items():
+            samples = self.stats.error_samples.get(kind)
+            print(f"  failed {kind}: {count}" + (f" (e.g. segment {samples[0]['segment']}: {samples[0]['error']})" if samples else ""))
+
+    @timed_stage("parse_files", lambda parser, store, _: len(store))
+    def parse_files(self, paths, workers=1, use_cache=False, segment_filter=None):
+        """Parse several exports (files or directories) into one time-ordered, deduplicated store"""
+        files = expand_export_paths(paths)
+        stay_settings = self.stay_detector.settings() if self.stay_detector else None
+        workers = max(1, min(workers or 1, len(files)))
+        print(f"Parsing {len(files)} exports with {workers} worker{'s' if workers > 1 else ''}")
+
+        with tempfile.TemporaryDirectory() as spill_dir:
+            jobs = [(path, os.path.join(spill_dir, f"{n}.records"), use_cache, stay_settings, segment_filter)
+                    for n, path in enumerate(files)]
+            if workers > 1:
+                with ProcessPoolExecutor(max_workers=workers) as executor:
+                    results = list(executor.map(parse_export, *zip(*jobs)))
+            else:
+                results = [parse_export(*job) for job in jobs]
+
+            spills, total = [], 0
+            for path, (records_path, count, cached, stats) in zip(files, results):
+                self.stats.merge(stats)
+                if records_path is None:
+                    print(f"  Error: could not read {path}")
+                    continue
+                print(f"  {path}: {count} records{' (cached)' if cached else ''}")
+                spills.append(records_path)
+                total += count
+
+            with self.stats.stage("merge") as stage:
+                store = RecordStore.merge_files(spills, dedupe=True)
+                stage["items"] = len(store)
+        if segment_filter is not None and use_cache:
+            store = segment_filter.apply(store)
+
+        print(f"\nMerged {total} records into {len(store)} ({total - len(store)} duplicates dropped)")
+        for rtype, count in store.type_counts().items():
+            print(f"  {rtype}: {count}")
+        store.metadata = {"files": files}
+        return store
+
+    def _parse_segments(self, segments, store, base_index=0, segment_filter=None):
+        """Dispatch every segment to the parser for its type, in batches with their strings decoded up front"""
+        self._parse_numbered(enumerate(segments, base_index), store, segment_filter)
+
+    def _parse_numbered(self, numbered, store, segment_filter=None):
+        """_parse_segments over (segment index, segment) pairs"""
+        numbered = iter(numbered)
+        while True:
+            rows = self._classify_segments(islice(numbered, DECODE_BATCH_SEGMENTS), segment_filter)
+            if rows is None:
+                return
+            self._decode_batch(rows)
+            try:
+                self._dispatch_segments(rows, store)
+            finally:
+                self._times, self._coords = {}, {}
+
+    def _classify_segments(self, numbered, segment_filter=None):
+        """[(index, segment, kind)] of the segments that pass the filter (None when there are none left)"""
+        detector = self.stay_detector
+        stats = self.stats
+        rows = []
+        seen = False
+        for i, segment in numbered:
+            seen = True
             if "activity" in segment:
-                record = self._parse_activity_segment(segment, i)
-                if record:
-                    records.append(record)
+                kind = "activity"
+            elif "visit" in segment:
+                kind = "visit"
+            elif "position" in segment:
+                kind = "position"
+            elif "activityRecord" in segment:
+                kind = "activity_record"
+            elif "wifiScan" in segment:
+                kind = "wifi_scan"
+            else:
+                stats.unknown_segments += 1
+                continue
+
+            if segment_filter is not None:
+                # The stay detector needs positions and visits even if they are not kept
+                needed = detector is not None and kind in ("visit", "position")
+                if not segment_filter.accepts(segment, None if needed else kind):
+                    stats.filtered_segments += 1
+                    continue
+            rows.append((i, segment, kind))
+        return rows if seen else None
+
+    def _decode_batch(self, rows):
+        """Decode the timestamp and LatLng strings of a batch for decode_time and parse_latlng_string"""
+        times, coords = [], []
+        for _, segment, kind in rows:
+            try:
+                if kind == "activity":
+                    data = segment["activity"]
+                    times += (segment.get("startTime"), segment.get("endTime"))
+                    coords += (data.get("start", {}).get("latLng"), data.get("end", {}).get("latLng"))
+                elif kind == "visit":
+                    times += (segment.get("startTime"), segment.get("endTime"))
+                    coords.append(segment["visit"].get("topCandidate", {}).get("placeLocation", {}).get("latLng"))
+                elif kind == "position":
+                    times.append(segment["position"].get("timestamp"))
+                    coords.append(segment["position"].get("LatLng"))
+                elif kind == "activity_record":
+                    times.append(segment["activityRecord"].get("timestamp"))
+                else:
+                    times.append(segment["wifiScan"].get("deliveryTime"))
+            except (AttributeError, TypeError):
+                pass  # odd structure: the parser reports it
+        self._times = decode_timestamps([text for text in times if type(text) is str])
+        self._coords = decode_latlngs([text for text in coords if type(text) is str])
+
+    def decode_time(self, text):
+        """(epoch ns, UTC offset minutes) of a timestamp string, pre-decoded for the current batch"""
+        decoded = self._times.get(text)
+        return decoded if decoded is not None else decode_timestamp(text)
+
+    def _dispatch_segments(self, rows, store):
+        """Run the parser of every classified segment, then add the batch's records to the store at once"""
+        detector = self.stay_detector
+        stats = self.stats
+        parsed, failed = stats.parsed, stats.failed
+        records = []
+        for i, segment, kind in rows:
+            # Parse activity segments
+            if kind == "activity":
+                ok = self._parse_activity_segment(segment, i, records)
 
             # Parse visit segments
-            elif "visit" in segment:
-                record = self._parse_visit_segment(segment, i)
-                if record:
-                    records.append(record)
+            elif kind == "visit":
+                ok = self._parse_visit_segment(segment, i, records)
+                if ok and detector:
+                    record = records[-1]
+                    records += self._stay_rows(detector.add_visit(record[1][0], record[2][0]))
 
             # Parse standalone position records
-            elif "position" in segment:
-                record = self._parse_position_record(segment, i)
-                if record:
-                    records.append(record)
+            elif kind == "position":
+                ok = self._parse_position_record(segment, i, records)
+                if ok and detector:
+                    record = records[-1]
+                    lat, lng = record[6], record[7]
+                    records += self._stay_rows(detector.add_position(
+                        i, *record[1], MISSING if lat is None else lat, MISSING if lng is None else lng,
+                    ))
 
             # Parse standalone activity records
-            elif "activityRecord" in segment:
-                record = self._parse_activity_record(segment, i)
-                if record:
-                    records.append(record)
+            elif kind == "activity_record":
+                ok = self._parse_activity_record(segment, i, records)
 
             # Parse wifi scans
-            elif "wifiScan" in segment:
-                record = self._parse_wifi_scan(segment, i)
-                if record:
-                    records.append(record)
-
-        # Sort by timestamp
-        records.sort(key=lambda x: x["timestamp"])
-
-        print(f"\nParsed {len(records)} total records:")
-        type_counts = defaultdict(int)
-        for r in records:
-            type_counts[r["record_type"]] += 1
-        for rtype, count in type_counts.items():
-            print(f"  {rtype}: {count}")
+            else:
+                ok = self._parse_wifi_scan(segment, i, records)
 
-        return records
+            if ok:
+                parsed[kind] += 1
+            else:
+                failed[kind] += 1
+
+        try:
+            store.extend_rows(records)
+        except Exception:
+            # The store rolled the batch back: add the records one by one to find the ones the columns reject
+            for record in records:
+                try:
+                    store.extend_rows([record])
+                except Exception as e:
+                    kind = record[3]
+                    self.stats.error(kind, record[0], e)
+                    parsed[kind] -= 1
+                    failed[kind] += 1
+
+    def detect_stays(self, records):
+        """Run the stay detector over a sorted RecordStore; returns the stays as a new store"""
+        detector = self.stay_detector or StayPointDetector()
+        stays = RecordStore()
+        position, visit = records.lookup("record_type", "position"), records.lookup("record_type", "visit")
+        record_type = records.record_type
+        for i in range(len(records)):
+            if record_type[i] == position:
+                self._append_stays(stays, detector.add_position(
+                    records.segment_index[i], records.timestamp[i], records.utc_offset[i],
+                    records.start_latitude[i], records.start_longitude[i],
+                ))
+            elif record_type[i] == visit and records.source[i] < 0:
+                self._append_stays(stays, detector.add_visit(records.timestamp[i], records.end_timestamp[i]))
+        self._append_stays(stays, detector.flush())
+        return stays
+
+    def _flush_stays(self, store):
+        """Append the stays still held by the detector at the end of the stream"""
+        if self.stay_detector:
+            self._append_stays(store, self.stay_detector.flush())
+
+    def _append_stays(self, store, stays):
+        """Append detected stays as visit records shaped like _parse_visit_segment's"""
+        store.extend_rows(self._stay_rows(stays))
+
+    @staticmethod
+    def _stay_rows(stays):
+        """RecordStore.ROW_FIELDS tuples of detected stays"""
+        return [
+            (
+                stay["segment_index"], (stay["start_ns"], stay["start_offset"]), (stay["end_ns"], stay["end_offset"]),
+                "visit", "VISIT", 0, stay["latitude"], stay["longitude"], stay["latitude"], stay["longitude"],
+                0, (stay["end_ns"] - stay["start_ns"]) / 1e9, None, "INFERRED_STAY", None, None, "stay_point",
+            )
+            for stay in stays
+        ]
 
-    def _parse_activity_segment(self, segment, index):
+    def _parse_parallel(self, workers, shard_size, segment_filter=None):
+        """Parse shards in a process pool and merge the sorted results"""
+        if self.json_backend_name is not None and np is not None:
+            if self._segment_file is not None:
+                self._segment_file.close()
+            tasks = (
+                (parse_shard_range, self.file_path, base_index, start, stop, self.json_backend_name, segment_filter)
+                for base_index, start, stop in iter_segment_ranges(self.file_path, shard_size)
+            )
+        else:
+            tasks = (
+                (parse_shard, base_index, segments, segment_filter)
+                for base_index, segments in iter_shards(self.semantic_segments, shard_size)
+            )
+        shards = {}
+        pending = set()
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            # Keep only a few shards in flight so streamed input stays bounded
+            for shard_number, task in enumerate(tasks):
+                future = executor.submit(*task)
+                future.shard_number = shard_number
+                pending.add(future)
+                if len(pending) >= 2 * workers:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for finished in done:
+                        shards[finished.shard_number] = self._collect_shard(finished)
+
+            for finished in pending:
+                shards[finished.shard_number] = self._collect_shard(finished)
+
+        # Shards are merged in segment order, so ties keep the serial ordering
+        with self.stats.stage("merge") as stage:
+            store = RecordStore.merge([shards[number] for number in sorted(shards)])
+            stage["items"] = len(store)
+        return store
+
+    def _collect_shard(self, future):
+        """Take a finished shard's store and fold its stats into ours"""
+        store, stats = future.result()
+        self.stats.merge(stats)
+        return store
+
+    def _parse_activity_segment(self, segment, index, records):
         """Parse activity segment (movement)"""
         activity_data = segment["activity"]
         start_time_str = segment.get("startTime")
         end_time_str = segment.get("endTime")
 
         if not start_time_str:
-            return None
+            return False
 
         try:
-            start_time = datetime.fromisoformat(start_time_str.replace("Z", "+00:00"))
-            end_time = datetime.fromisoformat(end_time_str.replace("Z", "+00:00")) if end_time_str else start_time
+            start_time = self.decode_time(start_time_str)
+            end_time = self.decode_time(end_time_str) if end_time_str else start_time
 
             # Parse start and end locations
             start_lat, start_lng = None, None
@@ -138,41 +3143,30 @@ class TimelineParser:
             activity_type = top_candidate.get("type", "UNKNOWN")
             probability = top_candidate.get("probability", 0)
 
-            record = {
-                "segment_index": index,
-                "timestamp": start_time,
-                "end_timestamp": end_time,
-                "record_type": "activity",
-                "activity_type": activity_type,
-                "probability": probability,
-                "start_latitude": start_lat,
-                "start_longitude": start_lng,
-                "end_latitude": end_lat,
-                "end_longitude": end_lng,
-                "distance_meters": activity_data.get("distanceMeters"),
-                "duration_seconds": (end_time - start_time).total_seconds(),
-                "place_id": None,
-                "semantic_type": None,
-            }
+            records.append((
+                index, start_time, end_time, "activity", activity_type, probability,
+                start_lat, start_lng, end_lat, end_lng,
+                activity_data.get("distanceMeters"), (end_time[0] - start_time[0]) / 1e9,
+            ))
 
-            return record
+            return True
 
         except Exception as e:
-            print(f"Error parsing activity segment {index}: {e}")
-            return None
+            self.stats.error("activity", index, e)
+            return False
 
-    def _parse_visit_segment(self, segment, index):
+    def _parse_visit_segment(self, segment, index, records):
         """Parse visit segment (stay at location)"""
         visit_data = segment["visit"]
         start_time_str = segment.get("startTime")
         end_time_str = segment.get("endTime")
 
         if not start_time_str:
-            return None
+            return False
 
         try:
-            start_time = datetime.fromisoformat(start_time_str.replace("Z", "+00:00"))
-            end_time = datetime.fromisoformat(end_time_str.replace("Z", "+00:00")) if end_time_str else start_time
+            start_time = self.decode_time(start_time_str)
+            end_time = self.decode_time(end_time_str) if end_time_str else start_time
 
             # Get location from top candidate
             top_candidate = visit_data.get("topCandidate", {})
@@ -182,81 +3176,56 @@ class TimelineParser:
             if "latLng" in place_location:
                 lat, lng = self.parse_latlng_string(place_location["latLng"])
 
-            record = {
-                "segment_index": index,
-                "timestamp": start_time,
-                "end_timestamp": end_time,
-                "record_type": "visit",
-                "activity_type": "VISIT",
-                "probability": visit_data.get("probability", 0),
-                "start_latitude": lat,
-                "start_longitude": lng,
-                "end_latitude": lat,
-                "end_longitude": lng,
-                "distance_meters": 0,
-                "duration_seconds": (end_time - start_time).total_seconds(),
-                "place_id": top_candidate.get("placeId"),
-                "semantic_type": top_candidate.get("semanticType", "UNKNOWN"),
-            }
+            records.append((
+                index, start_time, end_time, "visit", "VISIT", visit_data.get("probability", 0),
+                lat, lng, lat, lng, 0, (end_time[0] - start_time[0]) / 1e9,
+                top_candidate.get("placeId"), top_candidate.get("semanticType", "UNKNOWN"),
+            ))
 
-            return record
+            return True
 
         except Exception as e:
-            print(f"Error parsing visit segment {index}: {e}")
-            return None
+            self.stats.error("visit", index, e)
+            return False
 
-    def _parse_position_record(self, segment, index):
+    def _parse_position_record(self, segment, index, records):
         """Parse standalone position record"""
         position_data = segment["position"]
         timestamp_str = position_data.get("timestamp")
 
         if not timestamp_str:
-            return None
+            return False
 
         try:
-            timestamp = datetime.fromisoformat(timestamp_str.replace("Z", "+00:00"))
+            timestamp = self.decode_time(timestamp_str)
 
             lat, lng = None, None
             if "LatLng" in position_data:
                 lat, lng = self.parse_latlng_string(position_data["LatLng"])
 
-            record = {
-                "segment_index": index,
-                "timestamp": timestamp,
-                "end_timestamp": timestamp,
-                "record_type": "position",
-                "activity_type": "GPS_POSITION",
-                "probability": None,
-                "start_latitude": lat,
-                "start_longitude": lng,
-                "end_latitude": lat,
-                "end_longitude": lng,
-                "distance_meters": 0,
-                "duration_seconds": 0,
-                "place_id": None,
-                "semantic_type": None,
-                "accuracy_meters": position_data.get("accuracyMeters"),
-                "altitude_meters": position_data.get("altitudeMeters"),
-                "source": position_data.get("source"),
-                "speed_mps": position_data.get("speedMetersPerSecond"),
-            }
+            records.append((
+                index, timestamp, timestamp, "position", "GPS_POSITION", None,
+                lat, lng, lat, lng, 0, 0, None, None,
+                position_data.get("accuracyMeters"), position_data.get("altitudeMeters"),
+                position_data.get("source"), position_data.get("speedMetersPerSecond"),
+            ))
 
-            return record
+            return True
 
         except Exception as e:
-            print(f"Error parsing position record {index}: {e}")
-            return None
+            self.stats.error("position", index, e)
+            return False
 
-    def _parse_activity_record(self, segment, index):
+    def _parse_activity_record(self, segment, index, records):
         """Parse standalone activity record"""
         activity_data = segment["activityRecord"]
         timestamp_str = activity_data.get("timestamp")
 
         if not timestamp_str:
-            return None
+            return False
 
         try:
-            timestamp = datetime.fromisoformat(timestamp_str.replace("Z", "+00:00"))
+            timestamp = self.decode_time(timestamp_str)
 
             # Get most probable activity
             probable_activities = activity_data.get("probableActivities", [])
@@ -268,67 +3237,42 @@ class TimelineParser:
                 activity_type = "UNKNOWN"
                 confidence = 0
 
-            record = {
-                "segment_index": index,
-                "timestamp": timestamp,
-                "end_timestamp": timestamp,
-                "record_type": "activity_record",
-                "activity_type": activity_type,
-                "probability": confidence,
-                "start_latitude": None,
-                "start_longitude": None,
-                "end_latitude": None,
-                "end_longitude": None,
-                "distance_meters": 0,
-                "duration_seconds": 0,
-                "place_id": None,
-                "semantic_type": None,
-            }
+            records.append((
+                index, timestamp, timestamp, "activity_record", activity_type, confidence,
+                None, None, None, None, 0, 0,
+            ))
 
-            return record
+            return True
 
         except Exception as e:
-            print(f"Error parsing activity record {index}: {e}")
-            return None
+            self.stats.error("activity_record", index, e)
+            return False
 
-    def _parse_wifi_scan(self, segment, index):
+    def _parse_wifi_scan(self, segment, index, records):
         """Parse wifi scan record"""
         wifi_data = segment["wifiScan"]
         timestamp_str = wifi_data.get("deliveryTime")
 
         if not timestamp_str:
-            return None
+            return False
 
         try:
-            timestamp = datetime.fromisoformat(timestamp_str.replace("Z", "+00:00"))
+            timestamp = self.decode_time(timestamp_str)
 
             devices = wifi_data.get("devicesRecords", [])
             strongest_signal = max([d.get("rawRssi", -100) for d in devices]) if devices else None
 
-            record = {
-                "segment_index": index,
-                "timestamp": timestamp,
-                "end_timestamp": timestamp,
-                "record_type": "wifi_scan",
-                "activity_type": "WIFI_SCAN",
-                "probability": None,
-                "start_latitude": None,
-                "start_longitude": None,
-                "end_latitude": None,
-                "end_longitude": None,
-                "distance_meters": 0,
-                "duration_seconds": 0,
-                "place_id": None,
-                "semantic_type": None,
-                "wifi_devices": len(devices),
-                "strongest_signal": strongest_signal,
-            }
+            records.append((
+                index, timestamp, timestamp, "wifi_scan", "WIFI_SCAN", None,
+                None, None, None, None, 0, 0, None, None, None, None, None, None,
+                len(devices), strongest_signal, None, None, devices,
+            ))
 
-            return record
+            return True
 
         except Exception as e:
-            print(f"Error parsing wifi scan {index}: {e}")
-            return None
+            self.stats.error("wifi_scan", index, e)
+            return False
 
     def haversine_distance(self, lat1, lon1, lat2, lon2):
         """Calculate distance between two points in meters"""
@@ -340,33 +3284,278 @@ class TimelineParser:
         dlon = lon2 - lon1
         a = math.sin(dlat / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlon / 2) ** 2
         c = 2 * math.asin(math.sqrt(a))
-        return c * 6371000  # Earth's radius in meters
+        return c * EARTH_RADIUS_METERS
+
+    def batch_haversine_distances(self, lat1, lon1, lat2, lon2):
+        """Vectorized haversine: element-wise distances in meters between two coordinate arrays (0 where missing)"""
+        if np is None:
+            return array("d", (
+                0.0 if math.isnan(a + b + c + d) else self.haversine_distance(a, b, c, d)
+                for a, b, c, d in zip(lat1, lon1, lat2, lon2)
+            ))
+        lat1, lon1, lat2, lon2 = (np.radians(np.asarray(a, dtype=np.float64)) for a in (lat1, lon1, lat2, lon2))
+        a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+        distances = 2 * EARTH_RADIUS_METERS * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+        return np.nan_to_num(distances, nan=0.0)
+
+    def track_distances(self, latitudes, longitudes, activity_codes=None, activity_names=None):
+        """Distances along a track: segment_distances, cumulative, total and per_activity meters"""
+        if np is None:
+            return self._scalar_track_distances(latitudes, longitudes, activity_codes, activity_names)
+        latitudes = np.asarray(latitudes, dtype=np.float64)
+        longitudes = np.asarray(longitudes, dtype=np.float64)
+
+        valid = np.flatnonzero(np.isfinite(latitudes) & np.isfinite(longitudes))
+        segment_distances = np.zeros(len(latitudes))
+        if len(valid) > 1:
+            start, end = valid[:-1], valid[1:]
+            segment_distances[end] = self.batch_haversine_distances(
+                latitudes[start], longitudes[start], latitudes[end], longitudes[end]
+            )
+
+        cumulative = np.cumsum(segment_distances)
+        result = {
+            "segment_distances": segment_distances,
+            "cumulative": cumulative,
+            "total": float(cumulative[-1]) if len(cumulative) else 0.0,
+            "per_activity": {},
+        }
+
+        if activity_codes is not None and len(valid) > 1:
+            codes = np.asarray(activity_codes)[valid[:-1]]
+            mask = codes >= 0
+            totals = np.bincount(codes[mask], weights=segment_distances[valid[1:]][mask])
+            for code in np.flatnonzero(totals):
+                name = activity_names[code] if activity_names is not None else int(code)
+                result["per_activity"][name] = float(totals[code])
+
+        return result
+
+    def _scalar_track_distances(self, latitudes, longitudes, activity_codes=None, activity_names=None):
+        """track_distances without NumPy, one haversine_distance per segment"""
+        valid = [i for i, (lat, lng) in enumerate(zip(latitudes, longitudes)) if math.isfinite(lat) and math.isfinite(lng)]
+        segment_distances = array("d", [0.0]) * len(latitudes)
+        totals = defaultdict(float)
+        for start, end in zip(valid, valid[1:]):
+            distance = self.haversine_distance(latitudes[start], longitudes[start], latitudes[end], longitudes[end])
+            segment_distances[end] = distance
+            if activity_codes is not None and activity_codes[start] >= 0:
+                totals[activity_codes[start]] += distance
+
+        cumulative = array("d", accumulate(segment_distances))
+        return {
+            "segment_distances": segment_distances,
+            "cumulative": cumulative,
+            "total": cumulative[-1] if cumulative else 0.0,
+            "per_activity": {
+                activity_names[code] if activity_names is not None else code: totals[code]
+                for code in sorted(totals) if totals[code]
+            },
+        }
+
+    def recompute_track_distances(self, records, record_type="position"):
+        """Recompute the travelled distance from the raw points of one record type"""
+        code = records.lookup("record_type", record_type)
+        if code is None:
+            return self.track_distances([], [])
+        if np is None:
+            rows = [i for i, row_code in enumerate(records.record_type) if row_code == code]
+            return self.track_distances(
+                take(records.start_latitude, rows),
+                take(records.start_longitude, rows),
+                take(records.activity_type, rows),
+                records.dictionary("activity_type"),
+            )
+
+        rows = np.flatnonzero(records.numpy("record_type") == code)
+        return self.track_distances(
+            records.numpy("start_latitude")[rows],
+            records.numpy("start_longitude")[rows],
+            records.numpy("activity_type")[rows],
+            records.dictionary("activity_type"),
+        )
+
+    def simplify_tracks(self, records, tolerance_meters=SIMPLIFY_TOLERANCE_METERS):
+        """Reduce raw position records to simplified tracks, one per activity segment"""
+        require_numpy("simplify_tracks")
+        result = {"rows": np.zeros(0, dtype=np.int64), "track": np.zeros(0, dtype=np.int64),
+                  "activity_type": [], "error_meters": np.zeros(0), "points": 0}
+        code = records.lookup("record_type", "position")
+        if code is None:
+            return result
+
+        latitudes, longitudes = records.numpy("start_latitude"), records.numpy("start_longitude")
+        rows = np.flatnonzero((records.numpy("record_type") == code) & np.isfinite(latitudes) & np.isfinite(longitudes))
+        result["points"] = len(rows)
+        if not len(rows):
+            return result
+
+        # Merge-join the sorted positions against the activity time spans
+        timestamps = records.numpy("timestamp")[rows]
+        activity_code = records.lookup("record_type", "activity")
+        activities = np.flatnonzero(records.numpy("record_type") == activity_code) if activity_code is not None else rows[:0]
+        owner = np.searchsorted(records.numpy("timestamp")[activities], timestamps, side="right") - 1
+        covered = owner >= 0
+        covered[covered] = timestamps[covered] <= records.numpy("end_timestamp")[activities[owner[covered]]]
+        owner = np.where(covered, owner, -1)
+        bounds = np.concatenate(([0], np.flatnonzero(np.diff(owner)) + 1, [len(rows)]))
+
+        activity_names = records.dictionary("activity_type")
+        kept_rows, kept_tracks, kept_errors = [], [], []
+        for track, (lo, hi) in enumerate(zip(bounds[:-1], bounds[1:])):
+            lat = latitudes[rows[lo:hi]]
+            lng = longitudes[rows[lo:hi]]
+            scale = math.cos(math.radians(float(lat.mean())))
+            keep, error = simplify_polyline(
+                np.radians(lng) * EARTH_RADIUS_METERS * scale,
+                np.radians(lat) * EARTH_RADIUS_METERS,
+                tolerance_meters,
+            )
+            kept_rows.append(rows[lo:hi][keep])
+            kept_errors.append(error[keep])
+            kept_tracks.append(np.full(int(keep.sum()), track))
+            name = None
+            if owner[lo] >= 0:
+                activity = records.activity_type[int(activities[owner[lo]])]
+                name = activity_names[activity] if activity >= 0 else None
+            result["activity_type"].append(name)
+
+        result["rows"] = np.concatenate(kept_rows)
+        result["track"] = np.concatenate(kept_tracks)
+        result["error_meters"] = np.concatenate(kept_errors)
+        return result
+
+    def export_tracks(self, records, tracks, filename="tracks.csv", compression=None, quiet=False):
+        """Write simplified tracks (see simplify_tracks) as CSV"""
+        with open_text_output(filename, compression) as f:
+            f.write("track,activity_type,timestamp,latitude,longitude,error_meters\r\n")
+            for i, track, error in zip(tracks["rows"].tolist(), tracks["track"].tolist(), tracks["error_meters"].tolist()):
+                f.write(
+                    f"{track},{tracks['activity_type'][track] or ''},{records.datetime_at(i).isoformat()},"
+                    f"{records.start_latitude[i]:.7f},{records.start_longitude[i]:.7f},{error:.1f}\r\n"
+                )
+
+        if not quiet:
+            print(f"{len(tracks['rows'])} track points exported to {filename}")
+
+    def recompute_activity_distances(self, records, min_points=2):
+        """Replace activity distances with the length of the GPS track inside each activity, in place"""
+        require_numpy("recompute_activity_distances")
+        summary = {"activities": 0, "corrected": 0, "reported_meters": 0.0, "gps_meters": 0.0}
+        activity_code = records.lookup("record_type", "activity")
+        position_code = records.lookup("record_type", "position")
+        if activity_code is None:
+            return summary
+
+        record_types = records.numpy("record_type")
+        latitudes, longitudes = records.numpy("start_latitude"), records.numpy("start_longitude")
+        timestamps = records.numpy("timestamp")
+        activities = np.flatnonzero(record_types == activity_code)
+        positions = np.flatnonzero((record_types == position_code) & np.isfinite(latitudes) & np.isfinite(longitudes))
+        summary["activities"] = len(activities)
+
+        fix_times = timestamps[positions]
+        lo = np.searchsorted(fix_times, timestamps[activities], side="left")
+        hi = np.searchsorted(fix_times, records.numpy("end_timestamp")[activities], side="right")
+        points = np.maximum(hi - lo, 0)
+        corrected = points >= min_points
+
+        cumulative = self.track_distances(latitudes[positions], longitudes[positions])["cumulative"]
+        meters = np.zeros(len(activities))
+        meters[corrected] = cumulative[hi[corrected] - 1] - cumulative[lo[corrected]]
+
+        distances = records.numpy("distance_meters").copy()
+        reported = records.numpy("reported_distance_meters").copy()
+        track_points = records.numpy("track_points").copy()
+        rows = activities[corrected]
+        reported[rows] = np.where(np.isnan(reported[rows]), distances[rows], reported[rows])
+        distances[rows] = meters[corrected]
+        track_points[activities] = points
+
+        summary["corrected"] = len(rows)
+        summary["reported_meters"] = float(np.nansum(reported[rows]))
+        summary["gps_meters"] = float(meters[corrected].sum())
+        records.replace_column("distance_meters", distances)
+        records.replace_column("reported_distance_meters", reported)
+        records.replace_column("track_points", track_points)
+        return summary
+
+    def render_heatmap(self, records, directory, zoom_levels=HEATMAP_ZOOM_LEVELS, weight="count", grid=None):
+        """Rasterize located records into PNG map tiles under directory (see HeatmapRaster)"""
+        require_numpy("render_heatmap")
+        raster = HeatmapRaster.load(directory)
+        if raster is None or raster.settings() != HeatmapRaster(zoom_levels, weight).settings():
+            raster = HeatmapRaster(zoom_levels, weight)
+        summary = {"points": raster.add(records), "tiles": len(raster.tiles)}
+        summary["rendered"] = raster.render(directory)
+        raster.save(directory)
+
+        if grid:
+            _, latitudes, longitudes, dwell = HeatmapRaster.points(records)
+            if len(latitudes):
+                weights = dwell if weight == "dwell" else None
+                histogram, bbox = HeatmapRaster.grid(latitudes, longitudes, weights, grid)
+                np.savez_compressed(os.path.join(directory, "grid.npz"), histogram=histogram, bbox=np.array(bbox))
+                write_png(os.path.join(directory, "grid.png"), heat_colors(histogram, float(histogram.max())))
+                summary["grid"] = list(histogram.shape)
+        return summary
+
+    def locate_wifi_scans(self, records, max_gap_seconds=WIFI_FIX_GAP_SECONDS):
+        """Give wifi scans coordinates: their anchor fix or visit, else a fingerprint estimate"""
+        index = WifiIndex.build(records, max_gap_seconds)
+        summary = {"scans": 0, "anchored": len(index.anchors), "fingerprinted": 0, "unlocated": 0,
+                   "access_points": sum(1 for w in index.centroid_weights if w)}
+        scan_code = records.lookup("record_type", "wifi_scan")
+        if scan_code is None:
+            return summary
+
+        columns = {name: array("d", getattr(records, name))
+                   for name in ("start_latitude", "start_longitude", "end_latitude", "end_longitude")}
+        sources = array("i", records.source)
+        fingerprint = records.encode("source", "WIFI_FINGERPRINT")
+        for i in range(len(records)):
+            if records.record_type[i] != scan_code:
+                continue
+            summary["scans"] += 1
+            location = index.anchors.get(i)
+            if location is None:
+                estimate = index.locate(records.wifi_devices_at(i))
+                if estimate is None:
+                    summary["unlocated"] += 1
+                    continue
+                location = estimate[:2]
+                sources[i] = fingerprint
+                summary["fingerprinted"] += 1
+            columns["start_latitude"][i] = columns["end_latitude"][i] = location[0]
+            columns["start_longitude"][i] = columns["end_longitude"][i] = location[1]
+
+        for name, values in columns.items():
+            records.replace_column(name, values)
+        records.replace_column("source", sources)
+        return summary
+
+    @timed_stage("analyze_timeline", count_records)
+    def analyze_timeline(self, records, engine=None):
+        """Analyze the parsed timeline data (a RecordStore), print a report and return its figures"""
+        engine = engine or AggregationEngine()
+        results = engine.run(records).results()
 
-    def analyze_timeline(self, records):
-        """Analyze the parsed timeline data"""
         print(f"\n=== TIMELINE ANALYSIS ===")
         print(f"Total records: {len(records)}")
 
         if not records:
-            return
+            return results
 
         # Date range
-        start_date = records[0]["timestamp"].strftime("%Y-%m-%d %H:%M")
-        end_date = records[-1]["timestamp"].strftime("%Y-%m-%d %H:%M")
-        total_hours = (records[-1]["timestamp"] - records[0]["timestamp"]).total_seconds() / 3600
-        print(f"Period: {start_date} to {end_date} ({total_hours:.1f} hours)")
+        date_range = results["date_range"]
+        start_date = datetime.fromisoformat(date_range["start"]).strftime("%Y-%m-%d %H:%M")
+        end_date = datetime.fromisoformat(date_range["end"]).strftime("%Y-%m-%d %H:%M")
+        print(f"Period: {start_date} to {end_date} ({date_range['hours']:.1f} hours)")
 
         # Activity breakdown with distances
-        activity_counts = defaultdict(int)
-        activity_distances = defaultdict(float)
-        total_distance = 0
-        
-        for record in records:
-            activity_counts[record["activity_type"]] += 1
-            if record.get("distance_meters"):
-                distance = record["distance_meters"]
-                activity_distances[record["activity_type"]] += distance
-                total_distance += distance
+        activity_counts = results["counts"]["by_activity"]
+        activity_distances = results["distance_meters"]["by_activity"]
+        total_distance = results["distance_meters"]["total"]
 
         print(f"\n=== ACTIVITY BREAKDOWN ===")
         for activity, count in sorted(activity_counts.items(), key=lambda x: x[1], reverse=True):
@@ -387,56 +3576,219 @@ class TimelineParser:
                 print(f"  {activity}: {distance:.1f}m ({distance/1000:.2f}km) - {percentage:.1f}% of total")
 
         # Location records
-        location_records = [r for r in records if r["start_latitude"] is not None]
+        coverage = results["coverage"]
         print(f"\n=== LOCATION DATA ===")
-        print(f"Records with location data: {len(location_records)}/{len(records)} ({len(location_records) / len(records) * 100:.1f}%)")
+        print(f"Records with location data: {coverage['with_location']}/{coverage['total']} ({coverage['share'] * 100:.1f}%)")
+
+        return results
 
-    def export_csv(self, records, filename="timeline.csv"):
-        """Export records to CSV"""
+    def print_records(self, records, rows, distances=None, limit=20):
+        """Print a short listing of selected records"""
+        print(f"{len(rows)} matching records")
+        for n, i in enumerate(rows[:limit]):
+            row = records.csv_row(i)
+            line = f"  {row['timestamp']}  {row['record_type']:<15} {row['activity_type']:<22}"
+            if row["start_latitude"]:
+                line += f" {row['start_latitude']}, {row['start_longitude']}"
+            if distances is not None:
+                line += f"  ({distances[n]:.0f} m)"
+            print(line)
+        if len(rows) > limit:
+            print(f"  ... {len(rows) - limit} more")
+
+    @timed_stage("export_csv", count_records)
+    def export_csv(self, records, filename="timeline.csv", compression=None, split_by_month=False,
+                   chunk_rows=EXPORT_CHUNK_ROWS, quiet=False):
+        """Export records to CSV; returns the list of files written"""
         import csv
 
-        with open(filename, "w", newline="", encoding="utf-8") as csvfile:
-            fieldnames = [
-                "timestamp",
-                "end_timestamp",
-                "date",
-                "time",
-                "record_type",
-                "activity_type",
-                "probability",
-                "start_latitude",
-                "start_longitude",
-                "end_latitude",
-                "end_longitude",
-                "distance_meters",
-                "duration_seconds",
-                "place_id",
-                "semantic_type",
+        suffix = {None: "", "gzip": ".gz", "zstd": ".zst"}[compression]
+        root, ext = os.path.splitext(filename[:-len(suffix)] if suffix and filename.endswith(suffix) else filename)
+        files = {}
+
+        def writer_for(month):
+            entry = files.get(month)
+            if entry is None:
+                path = f"{root}-{month}{ext}{suffix}" if month else f"{root}{ext}{suffix}"
+                handle = open_text_output(path, compression)
+                writer = csv.writer(handle)
+                writer.writerow(CSV_FIELDS)
+                entry = files[month] = (path, handle, writer)
+            return entry[2]
+
+        try:
+            if not split_by_month:
+                writer_for(None)
+            for lo in range(0, len(records), chunk_rows):
+                hi = min(lo + chunk_rows, len(records))
+                columns = records.csv_columns(lo, hi)
+                if not split_by_month:
+                    writer_for(None).writerows(zip(*columns))
+                    continue
+
+                # Records are time-sorted, so each month is a run of consecutive rows
+                dates = columns[CSV_FIELDS.index("date")]
+                run_start = 0
+                for i in range(1, hi - lo + 1):
+                    if i == hi - lo or dates[i][:7] != dates[run_start][:7]:
+                        writer_for(dates[run_start][:7]).writerows(zip(*(c[run_start:i] for c in columns)))
+                        run_start = i
+        finally:
+            for _, handle, _ in files.values():
+                handle.close()
+
+        paths = [path for path, _, _ in files.values()]
+        if not quiet:
+            if len(paths) == 1:
+                print(f"\nData exported to {paths[0]}")
+            else:
+                print(f"\nData exported to {len(paths)} files: {', '.join(paths)}")
+        return paths
+
+    @timed_stage("export_columnar", count_records)
+    def export_columnar(self, records, filename="timeline.parquet", file_format="parquet", quiet=False):
+        """Export records as Parquet (or Arrow IPC with file_format="arrow"), one row group per month"""
+        require_numpy("export_columnar")
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise RuntimeError("Parquet/Arrow export requires pyarrow (pip install pyarrow)") from None
+
+        schema = pa.schema(
+            [
+                ("timestamp", pa.timestamp("ns", tz="UTC")),
+                ("end_timestamp", pa.timestamp("ns", tz="UTC")),
+                ("utc_offset_minutes", pa.int16()),
+                ("end_utc_offset_minutes", pa.int16()),
+                ("segment_index", pa.int64()),
             ]
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames, extrasaction='ignore')
-            writer.writeheader()
+            + [(name, pa.dictionary(pa.int32(), pa.string())) for name in RecordStore.STRING_COLUMNS]
+            + [(name, pa.float64()) for name in RecordStore.FLOAT_COLUMNS]
+            + [("wifi_devices", pa.int32()), ("track_points", pa.int32())],
+            metadata={"source": os.path.basename(self.file_path or "")},
+        )
+        dictionaries = {name: pa.array(records.dictionary(name), pa.string()) for name in RecordStore.STRING_COLUMNS}
 
-            for record in records:
-                row = {
-                    "timestamp": record["timestamp"].isoformat(),
-                    "end_timestamp": record["end_timestamp"].isoformat() if record.get("end_timestamp") else "",
-                    "date": record["timestamp"].strftime("%Y-%m-%d"),
-                    "time": record["timestamp"].strftime("%H:%M:%S"),
-                    "record_type": record.get("record_type", ""),
-                    "activity_type": record.get("activity_type", ""),
-                    "probability": f"{record['probability']:.4f}" if record.get("probability") is not None else "",
-                    "start_latitude": f"{record['start_latitude']:.7f}" if record.get("start_latitude") is not None else "",
-                    "start_longitude": f"{record['start_longitude']:.7f}" if record.get("start_longitude") is not None else "",
-                    "end_latitude": f"{record['end_latitude']:.7f}" if record.get("end_latitude") is not None else "",
-                    "end_longitude": f"{record['end_longitude']:.7f}" if record.get("end_longitude") is not None else "",
-                    "distance_meters": f"{record['distance_meters']:.1f}" if record.get("distance_meters") is not None else "",
-                    "duration_seconds": f"{record['duration_seconds']:.0f}" if record.get("duration_seconds") is not None else "",
-                    "place_id": record.get("place_id", ""),
-                    "semantic_type": record.get("semantic_type", ""),
-                }
-                writer.writerow(row)
-
-        print(f"\nData exported to {filename}")
+        def table(lo, hi):
+            arrays = [
+                pa.array(records.numpy("timestamp")[lo:hi], pa.int64()).cast(schema.field("timestamp").type),
+                pa.array(records.numpy("end_timestamp")[lo:hi], pa.int64()).cast(schema.field("end_timestamp").type),
+                pa.array(records.numpy("utc_offset")[lo:hi], pa.int16()),
+                pa.array(records.numpy("end_utc_offset")[lo:hi], pa.int16()),
+                pa.array(records.numpy("segment_index")[lo:hi], pa.int64()),
+            ]
+            for name in RecordStore.STRING_COLUMNS:
+                codes = records.numpy(name)[lo:hi]
+                indices = pa.array(codes, pa.int32(), mask=codes < 0)
+                arrays.append(pa.DictionaryArray.from_arrays(indices, dictionaries[name]))
+            for name in RecordStore.FLOAT_COLUMNS:
+                values = records.numpy(name)[lo:hi]
+                arrays.append(pa.array(values, pa.float64(), mask=np.isnan(values)))
+            for name in ("wifi_devices", "track_points"):
+                counts = records.numpy(name)[lo:hi]
+                arrays.append(pa.array(counts, pa.int32(), mask=counts < 0))
+            return pa.Table.from_arrays(arrays, schema=schema)
+
+        # Local calendar month of every record; sorted records form one run per month
+        local_seconds = records.numpy("timestamp") // 1_000_000_000 + records.numpy("utc_offset").astype(np.int64) * 60
+        months = (local_seconds // 86400).astype("datetime64[D]").astype("datetime64[M]")
+        boundaries = [0] + (np.flatnonzero(months[1:] != months[:-1]) + 1).tolist() + [len(records)]
+        runs = [(lo, hi) for lo, hi in zip(boundaries, boundaries[1:]) if hi > lo]
+
+        if file_format == "arrow":
+            with pa.OSFile(filename, "wb") as sink, pa.ipc.new_file(sink, schema) as writer:
+                for lo, hi in runs:
+                    writer.write_table(table(lo, hi), max_chunksize=hi - lo)
+        else:
+            with pq.ParquetWriter(filename, schema, compression="zstd", write_statistics=True) as writer:
+                for lo, hi in runs:
+                    writer.write_table(table(lo, hi), row_group_size=hi - lo)
+
+        if not quiet:
+            print(f"\nData exported to {filename} ({len(runs)} monthly {'batches' if file_format == 'arrow' else 'row groups'})")
+        return filename
+
+
+    @timed_stage("export_sqlite", count_records)
+    def export_sqlite(self, records, db_path="timeline.db", batch_rows=SQLITE_BATCH_ROWS, quiet=False):
+        """Bulk-load records into an indexed SQLite database; returns the number of inserted rows"""
+        import sqlite3
+
+        connection = sqlite3.connect(db_path)
+        try:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(SQLITE_SCHEMA)
+            # An empty table is loaded without any index; later runs need the identity index to skip stored rows
+            initial = connection.execute("SELECT 1 FROM records LIMIT 1").fetchone() is None
+            identity = connection.execute(
+                "SELECT sql FROM sqlite_master WHERE type = 'index' AND name = 'records_identity'"
+            ).fetchone()
+            if identity is not None and (initial or identity[0] != SQLITE_IDENTITY_INDEX):
+                connection.execute("DROP INDEX records_identity")  # rebuilt after the load, or with an older key
+                identity = None
+            if identity is None and not initial:
+                connection.execute(SQLITE_IDENTITY_INDEX)
+
+            before = connection.total_changes
+            strings = {name: records.dictionary(name) + [None] for name in RecordStore.STRING_COLUMNS}
+
+            def texts(name, lo, hi):
+                lookup = strings[name]
+                return [lookup[code] for code in getattr(records, name)[lo:hi]]
+
+            def reals(name, lo, hi):
+                return [None if v != v else v for v in getattr(records, name)[lo:hi]]
+
+            with connection:
+                for lo in range(0, len(records), batch_rows):
+                    hi = min(lo + batch_rows, len(records))
+                    dates, times = records.local_date_times(lo, hi)
+                    columns = [
+                        records.timestamp[lo:hi],
+                        records.end_timestamp[lo:hi],
+                        records.utc_offset[lo:hi],
+                        dates,
+                        times,
+                        texts("record_type", lo, hi),
+                        texts("activity_type", lo, hi),
+                        reals("probability", lo, hi),
+                        reals("start_latitude", lo, hi),
+                        reals("start_longitude", lo, hi),
+                        reals("end_latitude", lo, hi),
+                        reals("end_longitude", lo, hi),
+                        reals("distance_meters", lo, hi),
+                        reals("duration_seconds", lo, hi),
+                        texts("place_id", lo, hi),
+                        texts("semantic_type", lo, hi),
+                        reals("accuracy_meters", lo, hi),
+                        reals("altitude_meters", lo, hi),
+                        reals("speed_mps", lo, hi),
+                        texts("source", lo, hi),
+                        [None if v < 0 else v for v in records.wifi_devices[lo:hi]],
+                        reals("strongest_signal", lo, hi),
+                    ]
+                    connection.executemany(SQLITE_INSERT, zip(*columns))
+
+                if initial:
+                    try:
+                        connection.execute(SQLITE_IDENTITY_INDEX)
+                    except sqlite3.IntegrityError:
+                        # The records repeat themselves: keep the first of each identity
+                        connection.execute(SQLITE_DELETE_REPEATS)
+                        connection.execute(SQLITE_IDENTITY_INDEX)
+                    for column in SQLITE_INDEXED_COLUMNS:
+                        connection.execute(f"CREATE INDEX IF NOT EXISTS records_{column} ON records ({column})")
+            inserted = connection.total_changes - before
+            if initial:
+                inserted = connection.execute("SELECT count(*) FROM records").fetchone()[0]
+        finally:
+            connection.close()
+
+        if not quiet:
+            print(f"\nLoaded {inserted} new records into {db_path} ({len(records) - inserted} already stored)")
+        return inserted
 
 
 def main():
@@ -444,34 +3796,329 @@ def main():
     parser = argparse.ArgumentParser(
         description="Parse Google Timeline in JSON format and analyze activities and locations"
     )
-    parser.add_argument("path", help="Path to Timeline JSON file")
+    parser.add_argument(
+        "path",
+        nargs="+",
+        help="Timeline JSON file(s) or directories of exports; several exports are merged and deduplicated",
+    )
     parser.add_argument("--export-csv", action="store_true", help="Export to CSV file")
+    parser.add_argument("--csv-file", default="timeline.csv", help="CSV export file name (default timeline.csv)")
+    parser.add_argument("--compress", choices=["gzip", "zstd"], help="Compress the CSV export")
+    parser.add_argument("--split-by-month", action="store_true", help="Write one CSV file per month")
+    parser.add_argument(
+        "--export-parquet",
+        nargs="?",
+        const="timeline.parquet",
+        metavar="FILE",
+        help="Export typed columns to Parquet, one row group per month (requires pyarrow)",
+    )
+    parser.add_argument(
+        "--export-arrow",
+        nargs="?",
+        const="timeline.arrow",
+        metavar="FILE",
+        help="Export typed columns to an Arrow IPC file, one record batch per month (requires pyarrow)",
+    )
+    parser.add_argument(
+        "--export-sqlite",
+        nargs="?",
+        const="timeline.db",
+        metavar="FILE",
+        help="Load records into an indexed SQLite database (incremental on re-runs)",
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Read segments incrementally instead of loading the whole file (constant memory)",
+    )
+    parser.add_argument(
+        "--json-backend",
+        choices=["auto"] + JSON_BACKEND_PREFERENCE,
+        default="auto",
+        help="JSON decoder for loading the export (default auto: orjson, then simdjson, then the stdlib)",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Parse segment shards in this many processes (0 = one per CPU core)",
+    )
+    parser.add_argument(
+        "--cache",
+        action="store_true",
+        help="Reuse parsed records from <path>.records while the export is unchanged",
+    )
+    parser.add_argument(
+        "--incremental",
+        metavar="STORE",
+        help="Add only new, non-duplicate records of this export to a persisted record store",
+    )
+    parser.add_argument(
+        "--detect-stays",
+        action="store_true",
+        help="Infer visits from raw positions where the export has no visit segment",
+    )
+    parser.add_argument(
+        "--stay-radius",
+        type=float,
+        default=STAY_RADIUS_METERS,
+        help=f"With --detect-stays: max distance of fixes from the stay centre (default {STAY_RADIUS_METERS} m)",
+    )
+    parser.add_argument(
+        "--stay-minutes",
+        type=float,
+        default=STAY_MIN_DWELL_SECONDS / 60,
+        help=f"With --detect-stays: minimum dwell time (default {STAY_MIN_DWELL_SECONDS // 60} minutes)",
+    )
+    parser.add_argument(
+        "--gps-distances",
+        action="store_true",
+        help="Replace activity distances with the GPS track length inside each activity (requires NumPy)",
+    )
+    parser.add_argument(
+        "--locate-wifi",
+        action="store_true",
+        help="Give wifi scans coordinates from nearby fixes, or by matching their access points against located scans",
+    )
+    parser.add_argument(
+        "--track-distances",
+        action="store_true",
+        help="Recompute the GPS track length from raw position records",
+    )
+
+    parser.add_argument("--summary-json", metavar="FILE", help="Write the analysis results as JSON")
+    parser.add_argument(
+        "--stats-json",
+        metavar="FILE",
+        help="Write run statistics (stage timings, parsed/failed counts, error samples) as JSON, - for stdout",
+    )
+    parser.add_argument("--from", dest="start", metavar="TIME", help="Only records starting at/after this ISO date or time")
+    parser.add_argument("--to", dest="end", metavar="TIME", help="Only records starting before this ISO date or time")
+    parser.add_argument("--cluster-places", action="store_true", help="Cluster visit coordinates into places")
+    parser.add_argument(
+        "--place-radius",
+        type=float,
+        default=PLACE_RADIUS_METERS,
+        help=f"Visits closer than this many meters form one place (default {PLACE_RADIUS_METERS})",
+    )
+    parser.add_argument("--places-json", metavar="FILE", help="With --cluster-places: write all places as JSON")
+    parser.add_argument(
+        "--simplify-tracks",
+        type=float,
+        nargs="?",
+        const=SIMPLIFY_TOLERANCE_METERS,
+        metavar="METERS",
+        help=f"Simplify position tracks per activity within this tolerance (default {SIMPLIFY_TOLERANCE_METERS}, requires NumPy)",
+    )
+    parser.add_argument("--track-file", metavar="FILE", help="With --simplify-tracks: write the reduced tracks as CSV")
+    parser.add_argument("--heatmap", metavar="DIR", help="Render a location heatmap as XYZ PNG tiles into DIR (requires NumPy)")
+    parser.add_argument(
+        "--heatmap-zoom",
+        default=f"{HEATMAP_ZOOM_LEVELS.start}-{HEATMAP_ZOOM_LEVELS.stop - 1}",
+        metavar="MIN-MAX",
+        help=f"With --heatmap: zoom levels to render (default {HEATMAP_ZOOM_LEVELS.start}-{HEATMAP_ZOOM_LEVELS.stop - 1})",
+    )
+    parser.add_argument(
+        "--heatmap-weight",
+        choices=HeatmapRaster.WEIGHTS,
+        default="count",
+        help="With --heatmap: weigh points by count or by dwell time (default count)",
+    )
+    parser.add_argument(
+        "--heatmap-grid",
+        metavar="ROWSxCOLS",
+        help="With --heatmap: also write one histogram over the data extent as grid.npz and grid.png",
+    )
+    parser.add_argument("--near", metavar="LAT,LNG", help="List records near a point (spatial index)")
+    parser.add_argument("--radius", type=float, default=500, help="Search radius in meters for --near (default 500)")
+    parser.add_argument("--nearest", type=int, metavar="K", help="With --near: list the K nearest records instead")
+    parser.add_argument("--bbox", metavar="S,W,N,E", help="List records inside a bounding box (spatial index; W > E crosses the antimeridian)")
+    parser.add_argument("--types", help="Only these comma-separated record types, e.g. visit,activity")
 
     args = parser.parse_args()
 
-    if not os.path.exists(args.path):
-        print(f"Error: Path {args.path} not found!")
+    for path in args.path:
+        if not os.path.exists(path):
+            print(f"Error: Path {path} not found!")
+            return
+    files = expand_export_paths(args.path)
+    if not files:
+        print(f"Error: No .json exports found in {', '.join(args.path)}")
+        return
+    if len(files) > 1 and args.incremental:
+        print("Error: --incremental takes a single export")
         return
 
     print("Google Timeline Parser")
     print("=" * 50)
 
     # Initialize parser
-    timeline_parser = TimelineParser(args.path)
+    timeline_parser = TimelineParser(files[0] if len(files) == 1 else None)
+    if args.detect_stays:
+        timeline_parser.stay_detector = StayPointDetector(args.stay_radius, args.stay_minutes * 60)
+    workers = args.workers if args.workers > 0 else os.cpu_count()
 
-    # Load data
-    if not timeline_parser.load_timeline_data():
-        return
+    types = args.types.split(",") if args.types else None
+    segment_filter = None
+    if args.start or args.end or types:
+        try:
+            segment_filter = SegmentFilter(args.start, args.end, types)
+        except ValueError as e:
+            print(f"Error: {e}")
+            return
+    # Push --from/--to/--types down into parsing unless the full parse is cached or stored for later runs;
+    # parse_files filters cached exports itself
+    pushed_down = segment_filter is not None and (len(files) > 1 or not (args.cache or args.incremental))
+
+    records = timeline_parser.load_cached_records() if args.cache and len(files) == 1 else None
+    if len(files) > 1:
+        records = timeline_parser.parse_files(files, workers, use_cache=args.cache, segment_filter=segment_filter)
+    elif args.incremental:
+        if not timeline_parser.load_timeline_data(stream=True):
+            return
+        records, _ = timeline_parser.ingest_incremental(args.incremental)
+    elif records is None:
+        # Load and parse; decoding and batching records allocate millions of acyclic objects, so pause the
+        # cyclic collector meanwhile. Parallel workers decode their own byte ranges, so the export is only
+        # opened as a stream here.
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            loaded = timeline_parser.load_timeline_data(stream=args.stream or workers > 1, json_backend_name=args.json_backend)
+            if loaded:
+                records = timeline_parser.parse_all_segments(
+                    workers=workers, segment_filter=segment_filter if pushed_down else None,
+                )
+        finally:
+            if gc_enabled:
+                gc.enable()
+        if not loaded:
+            return
+
+        if args.cache:
+            timeline_parser.save_cached_records(records)
+
+    if args.gps_distances:
+        try:
+            corrected = timeline_parser.recompute_activity_distances(records)
+            print(f"\nGPS distances: {corrected['corrected']} of {corrected['activities']} activities recomputed "
+                  f"({corrected['reported_meters'] / 1000:.1f} km reported -> {corrected['gps_meters'] / 1000:.1f} km tracked)")
+        except RuntimeError as e:
+            print(f"Error: {e}")
+
+    if args.locate_wifi:
+        located = timeline_parser.locate_wifi_scans(records)
+        print(f"\nWifi scans: {located['anchored']} anchored to fixes or visits, {located['fingerprinted']} located "
+              f"by fingerprint, {located['unlocated']} unlocated ({located['access_points']} access points)")
 
-    # Parse segments
-    records = timeline_parser.parse_all_segments()
+    if segment_filter is not None and not pushed_down:
+        records = records.records_between(args.start, args.end, types)
+        print(f"\nSelected {len(records)} records from {args.start or 'the beginning'} to {args.end or 'the end'}"
+              + (f" ({', '.join(types)})" if types else ""))
 
     # Analyze
-    timeline_parser.analyze_timeline(records)
+    summary = timeline_parser.analyze_timeline(records)
+    if args.summary_json:
+        with open(args.summary_json, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+        print(f"\nSummary written to {args.summary_json}")
+
+    if args.track_distances:
+        track = timeline_parser.recompute_track_distances(records)
+        print(f"\n=== GPS TRACK ===")
+        print(f"Track length from positions: {track['total']:.1f} meters ({track['total'] / 1000:.2f} km)")
+
+    if args.simplify_tracks is not None:
+        try:
+            tracks = timeline_parser.simplify_tracks(records, args.simplify_tracks)
+            kept = len(tracks["rows"])
+            print(f"\n=== SIMPLIFIED TRACKS (tolerance {args.simplify_tracks:g} m) ===")
+            print(f"Tracks: {len(tracks['activity_type'])}")
+            print(f"Positions: {tracks['points']} -> {kept} ({tracks['points'] / max(kept, 1):.1f}x smaller)")
+            if kept:
+                print(f"Largest deviation: {tracks['error_meters'].max():.1f} m")
+            if args.track_file:
+                timeline_parser.export_tracks(records, tracks, args.track_file, args.compress)
+        except RuntimeError as e:
+            print(f"Error: {e}")
+
+    if args.cluster_places:
+        places = cluster_visit_places(records, args.place_radius)
+        print(f"\n=== PLACES ({len(places)} clusters within {args.place_radius:.0f} m) ===")
+        for place in places[:20]:
+            print(f"  {place['latitude']:.6f}, {place['longitude']:.6f}  {place['visits']:>5} visits  "
+                  f"{place['dwell_seconds'] / 3600:8.1f} h  {place['first_seen'][:10]} - {place['last_seen'][:10]}  "
+                  f"{place['semantic_type'] or ''} {place['place_id'] or ''}")
+        if args.places_json:
+            with open(args.places_json, "w", encoding="utf-8") as f:
+                json.dump(places, f, indent=2)
+            print(f"Places written to {args.places_json}")
+
+    if args.near or args.bbox:
+        # Only the index over the full history is worth persisting
+        windowed = segment_filter is not None
+        persist = args.cache and not windowed and len(files) == 1
+        index_path = f"{timeline_parser.cache_path()}.spatial" if persist else None
+        index = timeline_parser.spatial_index(records, index_path)
+
+        if args.near:
+            lat, lng = (float(v) for v in args.near.split(","))
+            if args.nearest:
+                print(f"\n=== {args.nearest} NEAREST TO {lat}, {lng} ===")
+                matches = index.nearest(lat, lng, args.nearest, types)
+            else:
+                print(f"\n=== WITHIN {args.radius:.0f} m OF {lat}, {lng} ===")
+                matches = index.within_radius(lat, lng, args.radius, types)
+            timeline_parser.print_records(records, [i for i, _ in matches], [d for _, d in matches])
+
+        if args.bbox:
+            south, west, north, east = (float(v) for v in args.bbox.split(","))
+            print(f"\n=== INSIDE {south}, {west} / {north}, {east} ===")
+            timeline_parser.print_records(records, index.within_bbox(south, west, north, east, types))
 
     # Export if requested
     if args.export_csv:
-        timeline_parser.export_csv(records)
+        try:
+            timeline_parser.export_csv(
+                records,
+                args.csv_file,
+                compression=args.compress,
+                split_by_month=args.split_by_month,
+            )
+        except RuntimeError as e:
+            print(f"Error: {e}")
+
+    if args.export_sqlite:
+        timeline_parser.export_sqlite(records, args.export_sqlite)
+
+    if args.heatmap:
+        try:
+            low, _, high = args.heatmap_zoom.partition("-")
+            zoom_levels = range(int(low), int(high or low) + 1)
+            grid = tuple(int(v) for v in args.heatmap_grid.lower().split("x")) if args.heatmap_grid else None
+            if not zoom_levels or zoom_levels.start < 0 or zoom_levels.stop > 21:
+                raise ValueError("zoom levels must be within 0-20")
+            heatmap = timeline_parser.render_heatmap(records, args.heatmap, zoom_levels, args.heatmap_weight, grid)
+            print(f"\nHeatmap: {heatmap['points']} new points, {heatmap['rendered']} of {heatmap['tiles']} tiles "
+                  f"rendered into {args.heatmap}")
+        except (RuntimeError, ValueError) as e:
+            print(f"Error: {e}")
+
+    for file_format, filename in (("parquet", args.export_parquet), ("arrow", args.export_arrow)):
+        if filename:
+            try:
+                timeline_parser.export_columnar(records, filename, file_format)
+            except RuntimeError as e:
+                print(f"Error: {e}")
+
+    if args.stats_json:
+        stats = timeline_parser.stats.result()
+        if args.stats_json == "-":
+            print(json.dumps(stats, indent=2))
+        else:
+            with open(args.stats_json, "w", encoding="utf-8") as f:
+                json.dump(stats, f, indent=2)
+            print(f"\nRun statistics written to {args.stats_json}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,386 @@
+#!/usr/bin/env python3
+"""
+Serve queries on a Google Timeline export from memory.
+
+The export is ingested once into a persisted record store (see
+TimelineParser.ingest_incremental) and kept in memory together with its
+spatial index, so queries over a local HTTP port or Unix socket answer in
+milliseconds instead of paying the load-and-parse cost every time. When the
+export file changes, only the segments after the store's watermark are
+parsed and the new snapshot replaces the old one between requests.
+
+Endpoints (GET, JSON unless noted):
+  /status                                  records, source file, reloads, run statistics
+  /records?from=&to=&types=&limit=&offset= records starting in a time range
+  /near?lat=&lng=&radius=&k=&types=        records within radius meters (or the k nearest)
+  /bbox?bbox=S,W,N,E&types=&limit=         records inside a bounding box
+  /places?radius=&min_visits=&limit=       visit places (density clustering)
+  /summary?from=&to=                       counts, distances, durations and coverage
+  /monthly                                 monthly aggregates kept with the store
+  /export?format=csv|json&from=&to=&types= records of a time range as CSV or JSON
+  /reload                                  check the export for changes now
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from urllib.parse import parse_qs, urlsplit
+
+from script_loader import load_timeline_parser
+
+POLL_SECONDS = 2.0
+DEFAULT_LIMIT = 100
+EXECUTOR_ROWS = 20000  # queries that scan more records than this run in a worker thread
+
+
+timeline_parser = load_timeline_parser()
+
+
+class QueryError(ValueError):
+    """A request that cannot be answered; reported to the client with an HTTP status"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def json_default(value):
+    """Serialize datetimes in records as ISO strings"""
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+class Snapshot:
+    """Records of one ingest with their indexes and summary; only place clusterings are added later, memoized"""
+
+    def __init__(self, parser, records, fingerprint):
+        self.parser = parser
+        self.records = records
+        self.fingerprint = fingerprint
+        self.index = timeline_parser.SpatialIndex.build(records)
+        self.summary = timeline_parser.AggregationEngine().run(records).results()
+        self.loaded_at = time.time()
+        self.places = {}  # (radius, min_visits) -> places, filled on first request
+
+
+class TimelineServer:
+    """Keeps the latest Snapshot of an export and answers queries against it"""
+
+    def __init__(self, path, store_path=None, stream=False, poll_seconds=POLL_SECONDS):
+        self.path = path
+        self.store_path = store_path or f"{path}.store"
+        self.stream = stream
+        self.poll_seconds = poll_seconds
+        self.snapshot = None
+        self.reloads = 0
+        self.reloading = None
+        self.routes = {
+            "/status": self.status,
+            "/records": self.query_records,
+            "/near": self.query_near,
+            "/bbox": self.query_bbox,
+            "/places": self.query_places,
+            "/summary": self.query_summary,
+            "/monthly": self.query_monthly,
+            "/export": self.query_export,
+            "/reload": self.query_reload,
+        }
+        # Records a query will scan, for the routes whose cost depends on the request
+        self.workloads = {
+            "/summary": self.summary_rows,
+            "/export": self.window_rows,
+            "/places": self.places_rows,
+        }
+
+    def fingerprint(self):
+        stat = os.stat(self.path)
+        return stat.st_size, stat.st_mtime_ns
+
+    def ingest(self):
+        """Ingest the export into the store and build a new Snapshot (runs in a worker thread)"""
+        fingerprint = self.fingerprint()
+        parser = timeline_parser.TimelineParser(self.path)
+        if not parser.load_timeline_data(stream=self.stream):
+            raise RuntimeError(f"Could not load {self.path}")
+        records, _ = parser.ingest_incremental(self.store_path)
+        return Snapshot(parser, records, fingerprint)
+
+    async def reload(self, force=False):
+        """Re-ingest when the export changed; concurrent callers share one reload"""
+        if self.reloading is None:
+            if not force and self.snapshot is not None and self.fingerprint() == self.snapshot.fingerprint:
+                return False
+            self.reloading = asyncio.get_running_loop().run_in_executor(None, self.ingest)
+            try:
+                self.snapshot = await self.reloading
+                self.reloads += 1
+            finally:
+                self.reloading = None
+            print(f"Serving {len(self.snapshot.records)} records from {self.path}")
+            return True
+        await self.reloading
+        return True
+
+    async def watch(self):
+        """Poll the export's size and mtime and reload when they change"""
+        while True:
+            await asyncio.sleep(self.poll_seconds)
+            try:
+                await self.reload()
+            except Exception as e:
+                print(f"Error: reloading {self.path} failed: {e}")
+
+    # Queries: each takes the snapshot and the query parameters and returns
+    # (content type, body) or a JSON-serializable value
+
+    @staticmethod
+    def param(params, name, convert=str, default=None):
+        values = params.get(name)
+        if not values or values[0] == "":
+            return default
+        try:
+            return convert(values[0])
+        except ValueError:
+            raise QueryError(f"Invalid value for {name}: '{values[0]}'") from None
+
+    def window(self, snapshot, params):
+        """The records of the from/to/types parameters"""
+        types = self.param(params, "types")
+        try:
+            return snapshot.records.records_between(
+                self.param(params, "from"), self.param(params, "to"), types.split(",") if types else None
+            )
+        except ValueError as e:
+            raise QueryError(str(e)) from None
+
+    def window_rows(self, snapshot, params):
+        """Upper bound of the records in the from/to/types window (a bisection, no scan)"""
+        try:
+            lo, hi = snapshot.records.time_range(self.param(params, "from"), self.param(params, "to"))
+        except ValueError:
+            return 0  # the query reports the bad bound itself
+        return hi - lo
+
+    def summary_rows(self, snapshot, params):
+        windowed = "from" in params or "to" in params or "types" in params
+        return self.window_rows(snapshot, params) if windowed else 0
+
+    def places_rows(self, snapshot, params):
+        return 0 if self.places_key(params) in snapshot.places else len(snapshot.records)
+
+    @staticmethod
+    def rows(records, rows, distances=None):
+        result = []
+        for n, i in enumerate(rows):
+            record = records.row(i)
+            if distances is not None:
+                record["distance_meters_away"] = round(distances[n], 1)
+            result.append(record)
+        return result
+
+    def status(self, snapshot, params):
+        return {
+            "file": self.path,
+            "store": self.store_path,
+            "records": len(snapshot.records),
+            "record_types": snapshot.records.type_counts(),
+            "loaded_at": snapshot.loaded_at,
+            "reloads": self.reloads,
+            "stats": snapshot.parser.stats.result(),
+        }
+
+    def query_records(self, snapshot, params):
+        records = self.window(snapshot, params)
+        offset = self.param(params, "offset", int, 0)
+        limit = self.param(params, "limit", int, DEFAULT_LIMIT)
+        rows = range(offset, min(offset + limit, len(records)))
+        return {"count": len(records), "offset": offset, "records": self.rows(records, rows)}
+
+    def query_near(self, snapshot, params):
+        lat = self.param(params, "lat", float)
+        lng = self.param(params, "lng", float)
+        if lat is None or lng is None:
+            raise QueryError("lat and lng are required")
+        types = self.param(params, "types")
+        types = types.split(",") if types else None
+        k = self.param(params, "k", int)
+        if k:
+            matches = snapshot.index.nearest(lat, lng, k, types)
+        else:
+            matches = snapshot.index.within_radius(lat, lng, self.param(params, "radius", float, 500.0), types)
+            matches = matches[: self.param(params, "limit", int, DEFAULT_LIMIT)]
+        return {"records": self.rows(snapshot.records, [i for i, _ in matches], [d for _, d in matches])}
+
+    def query_bbox(self, snapshot, params):
+        bbox = self.param(params, "bbox")
+        try:
+            south, west, north, east = (float(v) for v in bbox.split(","))
+        except (AttributeError, ValueError):
+            raise QueryError("bbox=S,W,N,E is required") from None
+        types = self.param(params, "types")
+        rows = snapshot.index.within_bbox(south, west, north, east, types.split(",") if types else None)
+        limit = self.param(params, "limit", int, DEFAULT_LIMIT)
+        return {"count": len(rows), "records": self.rows(snapshot.records, rows[:limit])}
+
+    def places_key(self, params):
+        return (self.param(params, "radius", float, timeline_parser.PLACE_RADIUS_METERS),
+                self.param(params, "min_visits", int, 1))
+
+    def query_places(self, snapshot, params):
+        key = self.places_key(params)
+        places = snapshot.places.get(key)
+        if places is None:
+            places = snapshot.places[key] = timeline_parser.cluster_visit_places(snapshot.records, *key)
+        return {"count": len(places), "places": places[: self.param(params, "limit", int, 50)]}
+
+    def query_summary(self, snapshot, params):
+        if "from" not in params and "to" not in params and "types" not in params:
+            return snapshot.summary
+        return timeline_parser.AggregationEngine().run(self.window(snapshot, params)).results()
+
+    def query_monthly(self, snapshot, params):
+        return snapshot.records.metadata.get("monthly", {})
+
+    def query_export(self, snapshot, params):
+        records = self.window(snapshot, params)
+        file_format = self.param(params, "format", str, "csv")
+        if file_format == "json":
+            return {"count": len(records), "records": self.rows(records, range(len(records)))}
+        if file_format != "csv":
+            raise QueryError(f"Unknown export format '{file_format}' (use csv or json)")
+
+        with tempfile.TemporaryDirectory() as tmp:
+            filename = os.path.join(tmp, "timeline.csv")
+            snapshot.parser.export_csv(records, filename, quiet=True)
+            with open(filename, "rb") as f:
+                return "text/csv; charset=utf-8", f.read()
+
+    async def query_reload(self, snapshot, params):
+        reloaded = await self.reload(force=self.param(params, "force", int, 0) == 1)
+        return {"reloaded": reloaded, "records": len(self.snapshot.records)}
+
+    # HTTP/1.1 over asyncio streams, with keep-alive
+
+    async def answer(self, target):
+        """Route one request target; returns (status, content type, body bytes, milliseconds)"""
+        url = urlsplit(target)
+        handler = self.routes.get(url.path)
+        if handler is None:
+            return 404, "application/json", json.dumps({"error": f"Unknown endpoint {url.path}"}).encode(), 0.0
+
+        params = parse_qs(url.query)
+        started = time.perf_counter()
+        try:
+            workload = self.workloads.get(url.path)
+            if asyncio.iscoroutinefunction(handler):
+                result = await handler(self.snapshot, params)
+            elif workload is not None and workload(self.snapshot, params) > EXECUTOR_ROWS:
+                # Large answers are built off the event loop so small queries keep flowing
+                result = await asyncio.get_running_loop().run_in_executor(None, handler, self.snapshot, params)
+            else:
+                result = handler(self.snapshot, params)
+        except QueryError as e:
+            return e.status, "application/json", json.dumps({"error": str(e)}).encode(), 0.0
+
+        if isinstance(result, tuple):
+            content_type, body = result
+        else:
+            content_type, body = "application/json", json.dumps(result, default=json_default).encode()
+        return 200, content_type, body, (time.perf_counter() - started) * 1000
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                elapsed = 0.0
+                try:
+                    method, target, version = request_line.decode("latin-1").split()
+                except ValueError:
+                    status, content_type, body = 400, "application/json", b'{"error": "Malformed request"}'
+                    version = "HTTP/1.0"
+                else:
+                    if method == "GET":
+                        try:
+                            status, content_type, body, elapsed = await self.answer(target)
+                        except Exception as e:
+                            status, content_type = 500, "application/json"
+                            body = json.dumps({"error": f"{type(e).__name__}: {e}"}).encode()
+                    else:
+                        status, content_type, body = 405, "application/json", b'{"error": "Only GET is supported"}'
+
+                keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+                reason = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed"}.get(status, "Error")
+                writer.write(
+                    f"HTTP/1.1 {status} {reason}\r\nContent-Type: {content_type}\r\nContent-Length: {len(body)}\r\n"
+                    f"Server-Timing: query;dur={elapsed:.3f}\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode("latin-1") + body
+                )
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host="127.0.0.1", port=8765, socket_path=None):
+        await self.reload(force=True)
+        if socket_path:
+            if os.path.exists(socket_path):
+                os.remove(socket_path)
+            server = await asyncio.start_unix_server(self.handle, socket_path)
+            print(f"Listening on {socket_path}")
+        else:
+            server = await asyncio.start_server(self.handle, host, port)
+            print(f"Listening on http://{host}:{port}/")
+
+        watcher = asyncio.create_task(self.watch())
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            watcher.cancel()
+
+
+def main():
+    """Main function"""
+    parser = argparse.ArgumentParser(description="Serve queries on a Google Timeline export from memory")
+    parser.add_argument("path", help="Timeline JSON file")
+    parser.add_argument("--store", help="Record store the export is ingested into (default <path>.store)")
+    parser.add_argument("--host", default="127.0.0.1", help="Address to listen on (default 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8765, help="HTTP port (default 8765)")
+    parser.add_argument("--socket", metavar="PATH", help="Listen on a Unix socket instead of a TCP port")
+    parser.add_argument("--stream", action="store_true", help="Read the export incrementally (constant memory)")
+    parser.add_argument("--poll", type=float, default=POLL_SECONDS,
+                        help=f"Seconds between checks of the export for changes (default {POLL_SECONDS:g})")
+    args = parser.parse_args()
+
+    if not os.path.isfile(args.path):
+        print(f"Error: File {args.path} not found")
+        return 1
+
+    server = TimelineServer(args.path, args.store, args.stream, args.poll)
+    try:
+        asyncio.run(server.serve(args.host, args.port, args.socket))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())